@@ -1,20 +1,89 @@
-import pandas as pd
+import argparse
+import sys
+import time
 
+DEFAULT_SETTING_FILE_PATH = r"C:\Users\tomon\Documents\Python\settings.xlsx"
 
-def fetch_setteings(fp: str):
-    sheet_names = ["data", "layout", "graph", "calc"]
-    setting_df_dict = pd.read_excel(fp, sheet_name=sheet_names, header=1)
-    data_df = setting_df_dict["data"]
-    layout_df = setting_df_dict["layout"]
-    graph_df = setting_df_dict["graph"]
-    calc_df = setting_df_dict["calc"]
-    return data_df, layout_df, graph_df, calc_df
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src", description="レポートの一括生成")
+    parser.add_argument(
+        "settings", nargs="?", default=DEFAULT_SETTING_FILE_PATH, help="設定ファイル"
+    )
+    parser.add_argument("-o", "--out", default="output", help="出力フォルダ")
+    parser.add_argument("-f", "--format", choices=["html", "json"], default="html", help="出力形式")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="並列数 (省略時は CPU 数)")
+    parser.add_argument("--pages", nargs="*", type=int, help="出力するページ番号 (省略時は全て)")
+    parser.add_argument(
+        "--cache-dir", help="描画結果のキャッシュフォルダ (省略時はキャッシュしない)"
+    )
+    parser.add_argument("--cache-size", type=int, default=512, help="キャッシュの上限 (MB)")
+    parser.add_argument(
+        "--sidecars",
+        action="store_true",
+        help="系列を出力ファイルの隣のフォルダに書き出し、タブを選択したときに読み込む",
+    )
+    parser.add_argument(
+        "--sidecar-url",
+        help=(
+            "出力フォルダを配信する URL"
+            " (json_item を別のページに埋め込む場合にサイドカーの URL の基準にする)"
+        ),
+    )
+    parser.add_argument(
+        "--shared-series",
+        action="store_true",
+        help="並列に描画する場合、系列を1度だけ取得して共有メモリでワーカーに渡す",
+    )
+    parser.add_argument("--store-dir", help="取得した系列を保存するフォルダ (省略時は保存しない)")
+    parser.add_argument(
+        "--profile",
+        metavar="TRACE_JSON",
+        help=(
+            "段階ごとの計測結果を Chrome のトレース形式で出力する (環境変数 GRAPH_PROFILE でも可)"
+        ),
+    )
+    parser.add_argument("--profile-memory", action="store_true", help="メモリのピークも計測する")
+    args = parser.parse_args(argv)
+
+    # 設定の読み込み・描画に使うモジュールは引数を確認した後に読み込む (--help などを速くする)
+    from src.batch import format_summary, render_pages
+    from src.libs.calc import condition_sources
+    from src.libs.profiling import configure_from_env, finish, tracer
+    from src.libs.render.cache import RenderCache
+    from src.libs.settings import load_settings
+
+    if args.profile:
+        tracer.enable(args.profile, memory=args.profile_memory)
+    else:
+        configure_from_env()
+
+    started = time.perf_counter()
+    # 2回目以降は変換済みのキャッシュから読み込む (Excel が更新された場合のみ読み直す)
+    settings = load_settings(fp=args.settings)
+    pages = settings.pages
+    if args.pages is not None:
+        pages = [pages[i] for i in args.pages]
+
+    cache = RenderCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache_dir else None
+    results = render_pages(
+        pages,
+        args.out,
+        fmt=args.format,
+        jobs=args.jobs,
+        calcs=settings.calcs,
+        calc_sources=condition_sources(settings.pages),
+        cache=cache,
+        store_dir=args.store_dir,
+        sidecars=args.sidecars,
+        shared_series=args.shared_series,
+        sidecar_url=args.sidecar_url,
+    )
+    print(format_summary(results))
+    print(f"total {time.perf_counter() - started:.2f}s")
+    finish()
+    return 0 if all(result.ok for result in results) else 1
 
 
 if __name__ == "__main__":
-    setting_file_path = r"C:\Users\tomon\Documents\Python\settings.xlsx"
-    data_df, layout_df, graph_df, calc_df = fetch_setteings(fp=setting_file_path)
-    print(data_df)
-    print(layout_df)
-    print(graph_df)
-    print(calc_df)
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""ページ単位の一括レポート生成
+
+各 Page を独立した HTML / JSON ファイルとして出力します。ページはプロセスプールで並列に
+描画し、1ページの失敗で全体を止めずに、ページごとの所要時間と失敗を報告します。
+"""
+
+import json
+import logging
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from src.libs.calc import condition_sources, install_calcs
+from src.libs.model.calc import CalcDefinition
+from src.libs.model.page import Page
+from src.libs.profiling import span, tracer
+from src.libs.render.cache import RenderCache, page_key
+from src.libs.source import DataSourceError
+
+if TYPE_CHECKING:
+    from src.libs.fetch.shared import SeriesCoordinator, SharedSeriesReader
+
+logger = logging.getLogger(__name__)
+
+# 親プロセスが共有メモリで配布した系列の参照 (init_worker で設定する)
+_shared_series: Optional["SharedSeriesReader"] = None
+
+
+class PageResult(BaseModel):
+    """1ページ分の出力結果"""
+
+    page: int = Field(description="ページ番号")
+    page_title: str = Field(description="ページのタイトル")
+    path: Optional[str] = Field(default=None, description="出力ファイルのパス")
+    seconds: float = Field(description="所要時間 (秒)")
+    size: int = Field(default=0, description="出力ファイルのサイズ (byte)")
+    cached: bool = Field(default=False, description="キャッシュから出力した場合は True")
+    error: Optional[str] = Field(default=None, description="失敗した場合のエラー内容")
+    trace: List[Dict[str, Any]] = Field(
+        default_factory=list, description="計測が有効な場合のトレースイベント"
+    )
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def output_names(pages: List[Page]) -> List[str]:
+    """ページごとの出力ファイル名 (拡張子なし) を重複しないように決めます。"""
+    names: List[str] = []
+    seen = set()
+    for i, page in enumerate(pages):
+        name = page.output_file_name
+        if name in seen:
+            name = f"{name}_{i}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def init_worker(
+    calcs: List[CalcDefinition],
+    calc_sources: Dict[str, str],
+    store_dir: Optional[str] = None,
+    profile: Optional[Tuple[bool, bool]] = None,
+    shared_series: Optional["SharedSeriesReader"] = None,
+) -> None:
+    """ワーカープロセスの初期化 (calc シートの派生系列・ローカルストア・計測を設定する)。
+
+    profile は親プロセスの計測の設定 (有効か, メモリも計測するか) です。
+    shared_series を指定した場合、系列は取得せずに親プロセスの共有メモリから参照します。
+    """
+    from src.graph import fetch_series, use_local_store
+
+    global _shared_series
+    _shared_series = shared_series
+    use_local_store(store_dir)
+    if profile is not None and profile[0]:
+        if not tracer.enabled:
+            tracer.enable(memory=profile[1])
+        # fork で引き継いだ親プロセスのイベントは親が出力するため捨てる
+        tracer.events = [event for event in tracer.events if event["pid"] == os.getpid()]
+    install_calcs(calcs, calc_sources, fetch_series)
+
+
+def render_page_file(
+    index: int,
+    page: Page,
+    path: str,
+    fmt: str = "html",
+    cache: Optional[RenderCache] = None,
+    sidecars: bool = False,
+    sidecar_url: Optional[str] = None,
+) -> PageResult:
+    """1ページ分を描画してファイルに書き出します (プロセスプールから呼ばれる)。
+
+    cache を指定した場合、設定とデータが前回と同じページは描画せずに保存済みの内容を書き出します。
+    sidecars=True では系列をタブごとにサイドカー (<name>_series フォルダ) へ書き出します
+    (サイドカーはキャッシュに含まれないため、キャッシュは使わない)。
+    sidecar_url は出力フォルダを配信する URL で、サイドカーの URL の基準になります
+    (省略時は出力ファイルからの相対 URL。json_item を別のページに埋め込む場合に指定する)。
+    """
+    started = time.perf_counter()
+    try:
+        with span("page.render", "page", page=page.page_title) as stats:
+            key = page_key(page, fmt) if cache is not None and not sidecars else None
+            data = cache.get(key) if key is not None else None
+            cached = data is not None
+            if data is None:
+                # bokeh は描画するときだけ読み込む (全ページがキャッシュにあれば読み込まない)
+                from bokeh.embed import file_html, json_item
+                from bokeh.resources import CDN
+
+                from src.graph import create_page_tabs
+                from src.libs.render.sidecar import SidecarWriter
+
+                writer = SidecarWriter.for_output(path, sidecar_url) if sidecars else None
+                sources = _shared_series.sources_for(page) if _shared_series is not None else None
+                layout = create_page_tabs(page, sources, sidecars=writer)
+                if writer is not None:
+                    stats["sidecar_bytes"] = writer.bytes_written
+                with span("page.serialize", format=fmt) as serialize_stats:
+                    if fmt == "json":
+                        text = json.dumps(json_item(layout), ensure_ascii=False)
+                    else:
+                        text = file_html(layout, CDN, title=page.page_title)
+                    data = text.encode("utf-8")
+                    serialize_stats["bytes"] = len(data)
+                if key is not None:
+                    cache.put(key, data)
+            with open(path, "wb") as f:
+                f.write(data)
+            stats["cached"] = cached
+        return PageResult(
+            page=index,
+            page_title=page.page_title,
+            path=path,
+            seconds=time.perf_counter() - started,
+            size=os.path.getsize(path),
+            cached=cached,
+            trace=tracer.drain(),
+        )
+    except Exception as e:
+        return PageResult(
+            page=index,
+            page_title=page.page_title,
+            seconds=time.perf_counter() - started,
+            error=f"{type(e).__name__}: {e}\n{traceback.format_exc()}",
+            trace=tracer.drain(),
+        )
+
+
+def render_pages(
+    pages: List[Page],
+    out_dir: str,
+    fmt: str = "html",
+    jobs: Optional[int] = None,
+    calcs: Optional[List[CalcDefinition]] = None,
+    calc_sources: Optional[Dict[str, str]] = None,
+    cache: Optional[RenderCache] = None,
+    store_dir: Optional[str] = None,
+    sidecars: bool = False,
+    shared_series: bool = False,
+    sidecar_url: Optional[str] = None,
+) -> List[PageResult]:
+    """全ページを並列に描画し、ページ番号順の結果を返します。
+
+    calc_sources は派生系列の式が参照する系列 ID → 取得先の対応です
+    (省略時は pages の DataCondition から作成する)。
+    store_dir を指定した場合、取得した系列をそのフォルダのローカルストアに保存します。
+    sidecars=True では系列をページごとのサイドカーに書き出します
+    (sidecar_url とあわせて render_page_file を参照)。
+    shared_series=True では、並列に描画する場合に親プロセスが全ページの系列を1度だけ取得し、
+    共有メモリでワーカーに渡します (複数のページで使う系列をワーカーごとに取得しない)。
+    """
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    paths = [str(Path(out_dir) / f"{name}.{fmt}") for name in output_names(pages)]
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(pages) or 1))
+
+    profile = (tracer.enabled, tracer.memory)
+    initargs = (calcs or [], calc_sources or condition_sources(pages), store_dir, profile)
+    if jobs == 1:
+        init_worker(*initargs)
+        results = [
+            render_page_file(i, page, path, fmt, cache, sidecars, sidecar_url)
+            for i, (page, path) in enumerate(zip(pages, paths))
+        ]
+    else:
+        results = _render_parallel(
+            pages, paths, fmt, jobs, cache, initargs, sidecars, shared_series, sidecar_url
+        )
+    # ワーカーで記録したトレースイベントを親プロセスの計測結果にまとめる
+    for result in results:
+        tracer.extend(result.trace)
+        result.trace = []
+    return results
+
+
+def _render_parallel(
+    pages: List[Page],
+    paths: List[str],
+    fmt: str,
+    jobs: int,
+    cache: Optional[RenderCache],
+    initargs: tuple,
+    sidecars: bool = False,
+    shared_series: bool = False,
+    sidecar_url: Optional[str] = None,
+) -> List[PageResult]:
+    """プロセスプールでページを描画します (1ページの失敗・ワーカーの異常終了でも続ける)。"""
+    coordinator = None
+    if shared_series:
+        from src.graph import afetch_series
+        from src.libs.fetch.shared import SeriesCoordinator
+
+        # 親プロセスでも派生系列・ローカルストアを使えるようにしてから取得する
+        init_worker(*initargs[:3])
+        coordinator = SeriesCoordinator()
+    results: List[PageResult] = []
+    try:
+        if coordinator is not None:
+            # キャッシュから出力するページの系列は取得しない
+            coordinator.fetch_pages(
+                [
+                    (i, page)
+                    for i, page in enumerate(pages)
+                    if not _is_cached(page, fmt, cache, sidecars)
+                ],
+                afetch_series,
+            )
+            initargs = initargs + (coordinator.reader(),)
+        _run_pool(
+            pages,
+            paths,
+            fmt,
+            jobs,
+            cache,
+            initargs,
+            (sidecars, sidecar_url),
+            results,
+            coordinator,
+        )
+    finally:
+        if coordinator is not None:
+            coordinator.close()
+    return sorted(results, key=lambda result: result.page)
+
+
+def _run_pool(
+    pages: List[Page],
+    paths: List[str],
+    fmt: str,
+    jobs: int,
+    cache: Optional[RenderCache],
+    initargs: tuple,
+    sidecars: Tuple[bool, Optional[str]],
+    results: List[PageResult],
+    coordinator: Optional["SeriesCoordinator"] = None,
+) -> None:
+    """プロセスプールでページを描画し、結果を results に追加します。
+
+    ワーカーが異常終了 (os._exit・メモリ不足での強制終了など) するとプール全体が使えなくなる
+    ため、プールを作り直して描画を続けます。異常終了した時に描画中だったページは1ページずつ
+    描画し直し、もう一度異常終了したページだけを失敗として報告します。
+    どのページが描画中だったかが分かるよう、同時に投入するページはワーカー数までにします。
+    sidecars は render_page_file に渡す (sidecars, sidecar_url) です。
+    """
+
+    _PagePool(pages, paths, fmt, jobs, cache, initargs, sidecars, results, coordinator).run()
+
+
+class _PagePool:
+    """ワーカーの異常終了からの復旧を含めてプロセスプールでページを描画する (_run_pool を参照)"""
+
+    def __init__(
+        self,
+        pages: List[Page],
+        paths: List[str],
+        fmt: str,
+        jobs: int,
+        cache: Optional[RenderCache],
+        initargs: tuple,
+        sidecars: Tuple[bool, Optional[str]],
+        results: List[PageResult],
+        coordinator: Optional["SeriesCoordinator"] = None,
+    ):
+        self.pages = pages
+        self.paths = paths
+        self.fmt = fmt
+        self.jobs = jobs
+        self.cache = cache
+        self.initargs = initargs
+        self.sidecars = sidecars
+        self.results = results
+        self.coordinator = coordinator
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def run(self) -> None:
+        todo = deque(range(len(self.pages)))
+        self._restart()
+        try:
+            while todo:
+                suspects = self._render_until_broken(todo)
+                if suspects:
+                    logger.warning(
+                        "worker process died; retrying pages %s one by one", sorted(suspects)
+                    )
+                    self._restart()
+                    self._retry_one_by_one(suspects)
+        finally:
+            self.executor.shutdown()
+
+    def _restart(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.jobs, initializer=init_worker, initargs=self.initargs
+        )
+
+    def _submit(self, i: int) -> Future:
+        return self.executor.submit(
+            render_page_file, i, self.pages[i], self.paths[i], self.fmt, self.cache, *self.sidecars
+        )
+
+    def _finish(self, i: int, result: PageResult) -> None:
+        self.results.append(result)
+        if self.coordinator is not None:
+            # このページだけが使っていた系列の共有メモリを解放する
+            self.coordinator.release_page(i)
+
+    def _failed(self, i: int, error: BaseException) -> PageResult:
+        return PageResult(page=i, page_title=self.pages[i].page_title, seconds=0, error=repr(error))
+
+    def _collect(self, i: int, future: Future) -> bool:
+        """結果を追加します。プールが壊れていた場合は追加せずに True を返します。"""
+        try:
+            self._finish(i, future.result())
+        except BrokenProcessPool:
+            return True
+        except Exception as e:
+            self._finish(i, self._failed(i, e))
+        return False
+
+    def _render_until_broken(self, todo: "deque[int]") -> List[int]:
+        """todo のページを描画します。プールが壊れた場合は描画中だったページを返します。"""
+        running: Dict[Future, int] = {}
+        suspects: List[int] = []
+        while (todo or running) and not suspects:
+            while todo and len(running) < self.jobs:
+                i = todo.popleft()
+                running[self._submit(i)] = i
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                if self._collect(i, future):
+                    suspects.append(i)
+        if suspects:
+            # プールが壊れると描画中の全ページが失敗するため、残りの結果も待って振り分ける
+            wait(running)
+            suspects += [i for future, i in running.items() if self._collect(i, future)]
+        return suspects
+
+    def _retry_one_by_one(self, suspects: List[int]) -> None:
+        for i in sorted(suspects):
+            try:
+                self._finish(i, self._submit(i).result())
+            except BrokenProcessPool as e:
+                # 単独で描画しても異常終了したページは失敗として報告する
+                self._finish(i, self._failed(i, e))
+                self._restart()
+            except Exception as e:
+                self._finish(i, self._failed(i, e))
+
+
+def _is_cached(page: Page, fmt: str, cache: Optional[RenderCache], sidecars: bool) -> bool:
+    """ページの出力がキャッシュにあるか (render_page_file でキャッシュから出力されるか)。
+
+    取得先の更新状況を調べられない場合はキャッシュに無いものとします
+    (エラーは render_page_file がそのページの失敗として報告する)。
+    """
+    if cache is None or sidecars:
+        return False
+    try:
+        key = page_key(page, fmt)
+    except DataSourceError as e:
+        logger.debug("cannot fingerprint page %s: %s", page.page_title, e)
+        return False
+    return key is not None and cache.path_for(key).exists()
+
+
+def format_summary(results: Iterable[PageResult]) -> str:
+    """ページごとの結果を表形式の文字列にします。"""
+    results = list(results)
+    lines = [f"{'page':>4}  {'status':<6}  {'seconds':>8}  {'size':>10}  title / output"]
+    for result in results:
+        status = ("cached" if result.cached else "ok") if result.ok else "FAILED"
+        target = result.path if result.ok else result.error.splitlines()[0]
+        lines.append(
+            f"{result.page:>4}  {status:<6}  {result.seconds:>8.2f}  {result.size:>10,}  "
+            f"{result.page_title} -> {target}"
+        )
+    failed = sum(not result.ok for result in results)
+    lines.append(f"{len(results)} pages, {failed} failed")
+    return "\n".join(lines)
@@ -0,0 +1,431 @@
+"""レンダリング処理のベンチマーク
+
+合成データ (系列数・点数・サンプリング間隔・ページ/タブ数を指定できる) で、
+設定の変換・データ取得・図の作成・シリアライズの各段階の所要時間と出力サイズを計測し、
+JSON に保存します。保存した結果を --compare に渡すとコミット間の差を比較できます。
+
+    python -m src.benchmark --scale medium -o bench.json
+    python -m src.benchmark --scale medium --compare bench.json
+    python -m src.benchmark --imports-only      # 起動時間 (import) の予算だけを確認する
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, Field
+
+SYNTHETIC_SOURCE = "synthetic"
+
+SCALES: Dict[str, Dict[str, int]] = {
+    "small": {"pages": 2, "tabs_per_page": 2, "series_per_tab": 2, "points": 1_000},
+    "medium": {"pages": 4, "tabs_per_page": 4, "series_per_tab": 4, "points": 20_000},
+    "large": {"pages": 8, "tabs_per_page": 8, "series_per_tab": 8, "points": 200_000},
+}
+
+
+class Workload(BaseModel):
+    """合成データの規模"""
+
+    pages: int = Field(default=2, ge=1, description="ページ数")
+    tabs_per_page: int = Field(default=2, ge=1, description="ページあたりのタブ数")
+    graphs_per_tab: int = Field(default=1, ge=1, description="タブあたりのグラフ数")
+    series_per_tab: int = Field(default=2, ge=1, description="タブあたりの系列数")
+    points: int = Field(default=1_000, ge=2, description="系列あたりの点数")
+    interval: str = Field(default="1min", description="サンプリング間隔 (DataCondition.interval)")
+    categories: int = Field(default=50, ge=1, description="円グラフ・棒グラフの項目数")
+    seed: int = Field(default=0, description="乱数のシード")
+
+    class Config:
+        frozen = True
+
+
+def synthetic_series(request, seed: int = 0):
+    """取得要求の期間・間隔のランダムウォークを配列演算だけで生成します (ID ごとに再現可能)。"""
+    from src.libs.series.interval import interval_step
+
+    step = interval_step(request.interval) or np.timedelta64(1, "m")
+    x = np.arange(
+        np.datetime64(request.start_date, "ms"),
+        np.datetime64(request.end_date, "ms") + np.timedelta64(1, "ms"),
+        step,
+    )
+    rng = np.random.default_rng([seed, zlib.crc32(request.id.encode("utf-8"))])
+    y = 50 + np.cumsum(rng.standard_normal(len(x)))
+    return x, y
+
+
+def install_synthetic_source(seed: int = 0) -> None:
+    """data_source "synthetic" に合成データの取得先を登録します。"""
+    from src.libs.source import SeriesSource, register_source
+
+    class SyntheticSource(SeriesSource):
+        storable = False
+
+        def fetch(self, request):
+            return synthetic_series(request, seed)
+
+    register_source(SYNTHETIC_SOURCE, SyntheticSource())
+
+
+def settings_frames(workload: Workload) -> Dict[str, pd.DataFrame]:
+    """設定ファイルの各シート (data / layout / graph / calc) を作成します。"""
+    from src.libs.series.interval import interval_step
+
+    start = np.datetime64("2023-01-01T00:00", "ms")
+    end = start + (interval_step(workload.interval) or np.timedelta64(1, "m")) * (
+        workload.points - 1
+    )
+    tabs = [
+        (f"Page {page}", f"Tab {page}-{tab}")
+        for page in range(workload.pages)
+        for tab in range(workload.tabs_per_page)
+    ]
+    data = pd.DataFrame(
+        {
+            "id": f"s{i}-{j}",
+            "tabname": tabname,
+            "unit": "U1",
+            "start_date": start.astype(datetime),
+            "end_date": end.astype(datetime),
+            "interval": workload.interval,
+            "data_source": SYNTHETIC_SOURCE,
+            "graph_color": "steelblue",
+        }
+        for i, (_, tabname) in enumerate(tabs)
+        for j in range(workload.series_per_tab)
+    )
+    layout = pd.DataFrame(
+        {
+            "page_title": page_title,
+            "output_file_name": page_title.replace(" ", "_"),
+            "tabname": tabname,
+            "tabtitle": f"{tabname} title",
+            "columns": 1,
+            "rows": workload.graphs_per_tab,
+        }
+        for page_title, tabname in tabs
+    )
+    graph = pd.DataFrame(
+        {
+            "id": f"g{k}",
+            "tabname": tabname,
+            "x_param": "date",
+            "x_unit": "datetime",
+            "x_min": 0,
+            "x_max": 1,
+            "x_label": "Date",
+            "y_param": "value",
+            "y_unit": "-",
+            "y_min": 0,
+            "y_max": 100,
+            "y_color": "black",
+            "y_label": "Value",
+        }
+        for _, tabname in tabs
+        for k in range(workload.graphs_per_tab)
+    )
+    calc = pd.DataFrame(columns=["id", "expression", "data_source", "unit"])
+    return {"data": data, "layout": layout, "graph": graph, "calc": calc}
+
+
+def write_settings(workload: Workload, path: Path) -> None:
+    """設定ファイル (Excel) を書き出します (fetch_setteings と同じく2行目が見出し)。"""
+    with pd.ExcelWriter(path) as writer:
+        for name, frame in settings_frames(workload).items():
+            frame.to_excel(writer, sheet_name=name, index=False, startrow=1)
+
+
+# 起動時に読み込むと時間のかかる依存パッケージ
+HEAVY_MODULES = ("bokeh", "pandas", "numpy", "pydantic", "pyarrow", "duckdb", "httpx")
+
+
+class ImportBudget(BaseModel):
+    """モジュールを新しいプロセスで import するときの予算"""
+
+    seconds: float = Field(description="import にかかる時間の上限 (秒)", gt=0)
+    forbidden: Tuple[str, ...] = Field(
+        default=(), description="import の時点で読み込まれてはならないパッケージ"
+    )
+
+
+# 描画が必要になるまで重い依存を読み込まないエントリーポイント・パッケージ
+IMPORT_BUDGETS: Dict[str, ImportBudget] = {
+    "src.__main__": ImportBudget(seconds=0.1, forbidden=HEAVY_MODULES),
+    "src.worker": ImportBudget(seconds=0.1, forbidden=HEAVY_MODULES),
+    "src.libs.chart": ImportBudget(seconds=0.1, forbidden=HEAVY_MODULES),
+    "src.libs.model": ImportBudget(
+        seconds=1.0, forbidden=("bokeh", "pandas", "numpy", "pyarrow", "duckdb", "httpx")
+    ),
+    "src.libs.source": ImportBudget(
+        seconds=1.0, forbidden=("bokeh", "pandas", "pyarrow", "duckdb", "httpx")
+    ),
+    "src.libs.fetch": ImportBudget(seconds=1.0, forbidden=("bokeh", "pandas", "pyarrow")),
+    "src.batch": ImportBudget(seconds=1.0, forbidden=("bokeh", "pandas", "pyarrow", "duckdb")),
+    "src.graph": ImportBudget(seconds=1.0, forbidden=("bokeh", "pandas", "pyarrow", "duckdb")),
+}
+
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+class Timer:
+    """段階ごとの所要時間 (繰り返しの最小値・中央値) と付加情報を集める"""
+
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def measure(self, name: str, func: Callable[[], Any], **info: Any) -> Any:
+        seconds = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            value = func()
+            seconds.append(time.perf_counter() - started)
+        self.record(name, seconds, **info)
+        return value
+
+    def record(self, name: str, seconds: List[float], **info: Any) -> None:
+        """別の方法で計測した所要時間を記録します。"""
+        self.results[name] = {
+            "min": min(seconds),
+            "median": statistics.median(seconds),
+            **info,
+        }
+
+    def note(self, name: str, **info: Any) -> None:
+        self.results[name].update(info)
+
+
+def bench_timeseries(workload: Workload, timer: Timer, workdir: Path) -> None:
+    """時系列グラフ (src/graph.py) の各段階を計測します。"""
+    from bokeh.embed import file_html, json_item
+    from bokeh.resources import CDN
+
+    from src.graph import create_page_tabs, fetch_series
+    from src.libs.fetch import execute_plan, plan_fetches
+    from src.libs.settings import compile_settings, load_settings
+
+    settings_path = workdir / "settings.xlsx"
+    write_settings(workload, settings_path)
+    compiled = timer.measure("settings.compile", lambda: compile_settings(str(settings_path)))
+    load_settings(str(settings_path))
+    timer.measure("settings.cached", lambda: load_settings(str(settings_path)))
+    pages = compiled.pages
+
+    plan = plan_fetches(pages)
+    sources = timer.measure("fetch", lambda: execute_plan(plan, fetch_series))
+    timer.note("fetch", requests=len(plan), rows=len(plan) * workload.points)
+
+    layouts = timer.measure(
+        "figure.build", lambda: [create_page_tabs(page, sources) for page in pages]
+    )
+    items = timer.measure("serialize.json", lambda: [json_item(layout) for layout in layouts])
+    timer.note("serialize.json", bytes=sum(len(json.dumps(item)) for item in items))
+    html = timer.measure(
+        "serialize.html",
+        lambda: [
+            file_html(layout, CDN, title=page.page_title) for layout, page in zip(layouts, pages)
+        ],
+    )
+    timer.note("serialize.html", bytes=sum(len(text.encode("utf-8")) for text in html))
+
+
+def bench_charts(workload: Workload, timer: Timer) -> None:
+    """円グラフ・棒グラフ (src/libs/chart) の作成とシリアライズを計測します。"""
+    from bokeh.embed import json_item
+
+    from src.libs.chart import BarChart, BarChartConfig, ChartData, PieChart, PieChartConfig
+
+    rng = np.random.default_rng(workload.seed)
+    data = ChartData(
+        x=np.array([f"item {i}" for i in range(workload.categories)], dtype=object),
+        y=rng.integers(1, 1000, workload.categories),
+        colors=np.full(workload.categories, "steelblue", dtype=object),
+    )
+    for name, chart, config in (
+        ("pie", PieChart, PieChartConfig()),
+        ("bar", BarChart, BarChartConfig()),
+    ):
+        figure = timer.measure(f"chart.{name}.build", lambda: chart(data, config).render())
+        item = timer.measure(f"chart.{name}.serialize", lambda: json_item(figure))
+        timer.note(f"chart.{name}.serialize", bytes=len(json.dumps(item)))
+
+
+def measure_import(module: str) -> Dict[str, Any]:
+    """新しいインタプリタで module を import し、所要時間と読み込まれた重い依存を返します。"""
+    completed = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).resolve().parent.parent,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def bench_imports(timer: Timer) -> None:
+    """IMPORT_BUDGETS の各モジュールを新しいプロセスで import する時間を計測します。"""
+    for module in IMPORT_BUDGETS:
+        probes = [measure_import(module) for _ in range(timer.repeat)]
+        timer.record(
+            f"import.{module}",
+            [probe["seconds"] for probe in probes],
+            loaded=probes[-1]["loaded"],
+        )
+
+
+def import_violations(report: Dict[str, Any]) -> List[str]:
+    """IMPORT_BUDGETS を超えたモジュールの説明を返します。"""
+    violations = []
+    for module, budget in IMPORT_BUDGETS.items():
+        result = report["results"].get(f"import.{module}")
+        if result is None:
+            continue
+        if result["min"] > budget.seconds:
+            violations.append(f"{module}: {result['min']:.3f}s > {budget.seconds}s")
+        loaded = sorted(set(result["loaded"]) & set(budget.forbidden))
+        if loaded:
+            violations.append(f"{module}: imports {', '.join(loaded)}")
+    return violations
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(workload: Workload, repeat: int = 3, imports_only: bool = False) -> Dict[str, Any]:
+    """ベンチマークを実行し、結果 (JSON に保存できる辞書) を返します。
+
+    imports_only=True では起動時間 (import) だけを計測します。
+    """
+    import bokeh
+
+    timer = Timer(repeat)
+    started = time.perf_counter()
+    bench_imports(timer)
+    if not imports_only:
+        install_synthetic_source(workload.seed)
+        with tempfile.TemporaryDirectory() as workdir:
+            bench_timeseries(workload, timer, Path(workdir))
+        bench_charts(workload, timer)
+    return {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "bokeh": bokeh.__version__,
+        "numpy": np.__version__,
+        "workload": workload.model_dump(),
+        "repeat": repeat,
+        "total_seconds": time.perf_counter() - started,
+        "results": timer.results,
+    }
+
+
+def format_results(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    """結果を表形式の文字列にします。baseline を指定した場合は比 (今回 / 基準) も表示します。"""
+    header = f"{'stage':<24}  {'min ms':>10}  {'median ms':>10}  {'bytes':>14}"
+    if baseline is not None:
+        header += f"  {'vs ' + str(baseline.get('commit')):>14}"
+    lines = [header]
+    for name, result in report["results"].items():
+        line = (
+            f"{name:<24}  {result['min'] * 1000:>10.1f}  "
+            f"{result.get('median', result['min']) * 1000:>10.1f}  "
+            f"{result.get('bytes', ''):>14}"
+        )
+        base = (baseline or {}).get("results", {}).get(name)
+        if base is not None:
+            line += f"  {result['min'] / base['min']:>13.2f}x"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """基準より threshold 倍以上遅くなった段階の名前を返します。"""
+    return [
+        name
+        for name, result in report["results"].items()
+        if name in baseline["results"]
+        and result["min"] > baseline["results"][name]["min"] * threshold
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.benchmark", description="ベンチマーク")
+    parser.add_argument("--scale", choices=list(SCALES), default="small", help="規模のプリセット")
+    for field in ("pages", "tabs_per_page", "graphs_per_tab", "series_per_tab", "points"):
+        parser.add_argument(f"--{field.replace('_', '-')}", dest=field, type=int)
+    parser.add_argument("--interval", help="サンプリング間隔 (1s / 1min / hourly など)")
+    parser.add_argument("--categories", type=int, help="円グラフ・棒グラフの項目数")
+    parser.add_argument("--repeat", type=int, default=3, help="各段階の繰り返し回数")
+    parser.add_argument("-o", "--output", help="結果を保存する JSON ファイル")
+    parser.add_argument("--compare", help="比較する基準の結果 (JSON)")
+    parser.add_argument(
+        "--imports-only", action="store_true", help="起動時間 (import) の予算だけを確認する"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=1.25, help="この倍率以上遅くなったら失敗とする"
+    )
+    args = parser.parse_args(argv)
+
+    overrides = {
+        key: value
+        for key, value in vars(args).items()
+        if key in Workload.model_fields and value is not None
+    }
+    workload = Workload(**{**SCALES[args.scale], **overrides})
+    report = run(workload, repeat=args.repeat, imports_only=args.imports_only)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_results(report, baseline))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    violations = import_violations(report)
+    if violations:
+        print(f"import budget exceeded: {'; '.join(violations)}", file=sys.stderr)
+        failed = True
+
+    if baseline is not None:
+        if baseline.get("workload") != report["workload"]:
+            print("warning: 基準と規模が異なります", file=sys.stderr)
+        slower = regressions(report, baseline, args.threshold)
+        if slower:
+            print(f"regressions (>{args.threshold}x): {', '.join(slower)}", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
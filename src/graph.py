@@ -1,187 +1,381 @@
-import random
-from datetime import datetime, timedelta
-from typing import List
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
 
-from bokeh.layouts import column, gridplot
-from bokeh.models import ColumnDataSource, Panel, Tabs
-from bokeh.plotting import figure, show
+# bokeh は図を作成する関数の中で読み込む
+# (データ取得だけのワーカーや、全ページがキャッシュにある場合は読み込まない)
+import numpy as np
 
-from src.libs.model.page import DataCondition, GraphCondition, GraphLayout, Page, Tab, XAxis, YAxis
+from src.libs.fetch import FetchRequest, SharedSources, plan_fetches
+from src.libs.fetch.concurrent import execute_plan_concurrent
+from src.libs.fetch.planner import plan_conditions
+from src.libs.model.graph import Downsample, GlyphOptions, XAxis, YAxis
+from src.libs.model.page import DataCondition, GraphCondition, GraphLayout, Page, Tab
+from src.libs.profiling import span, tracer
+from src.libs.render.lazy import LazyReport
+from src.libs.series.interval import INTERVALS
+from src.libs.source import resolve_source
+from src.libs.source.base import run_in_thread
+
+if TYPE_CHECKING:
+    from bokeh.models import Tabs
+
+    from src.libs.render.live import LiveOptions
+    from src.libs.render.sidecar import SidecarWriter
+    from src.libs.store import LocalStore
+
+# GraphCondition・Tab のどちらにも描画方法の設定がない場合の設定
+DEFAULT_GLYPH_OPTIONS = GlyphOptions()
+
+# 取得した系列を保持するローカルストア (use_local_store で設定する)
+_local_store: Optional["LocalStore"] = None
 
 
 # ダミーデータ生成用の関数
 def generate_dummy_data(start_date, end_date, interval):
-    dates = []
-    values = []
-    current_date = start_date
-    while current_date <= end_date:
-        dates.append(current_date)
-        values.append(random.uniform(0, 100))  # ダミーのランダム値
-        current_date += timedelta(days=1)  # 仮に1日ごとのデータとする
+    # 間隔ごとのデータとする (生データ・不明な間隔は1日ごと、終了日時を含む)
+    parsed = INTERVALS.get(interval)
+    count, unit = parsed if parsed is not None else (1, "D")
+    if unit == "M":
+        # 月は長さが一定でないため、月単位で並べてからミリ秒に変換する
+        dates = np.arange(
+            np.datetime64(start_date, "M"),
+            np.datetime64(end_date, "M") + np.timedelta64(1, "M"),
+            np.timedelta64(count, "M"),
+        ).astype("datetime64[ms]")
+    else:
+        dates = np.arange(
+            np.datetime64(start_date, "ms"),
+            np.datetime64(end_date, "ms") + np.timedelta64(1, "ms"),
+            np.timedelta64(count, unit),
+        )
+    values = np.random.uniform(0, 100, len(dates))  # ダミーのランダム値
     return dates, values
 
 
+def use_local_store(directory: Optional[str]) -> None:
+    """取得した系列をローカルストアに保存し、次回からは未取得の期間だけを取得します。"""
+    global _local_store
+    if not directory:
+        _local_store = None
+        return
+    # pyarrow はローカルストアを使う場合だけ読み込む
+    from src.libs.store import LocalStore
+
+    _local_store = LocalStore(directory)
+
+
+def fetch_series(request: FetchRequest):
+    """取得計画の1要求分の系列を取得します。"""
+    source = resolve_source(request.data_source)
+    if source is None:
+        # 取得先が登録されていない場合はダミーデータを生成する
+        return generate_dummy_data(request.start_date, request.end_date, request.interval)
+    if _local_store is not None and source.storable:
+        return _local_store.fetch(request, source.fetch)
+    return source.fetch(request)
+
+
+async def afetch_series(request: FetchRequest):
+    """fetch_series の非同期版 (非同期に対応した取得先は I/O を待つ間に他の系列を取得する)。"""
+    source = resolve_source(request.data_source)
+    if source is None or (_local_store is not None and source.storable):
+        # ダミーデータの生成とローカルストア経由の取得はスレッドで実行する
+        return await run_in_thread(fetch_series, request)
+    return await source.afetch(request)
+
+
 # 各タブのグラフを作成する関数
-def create_bokeh_graph(tab: Tab):
-    # 各タブのグラフを保持するリスト
-    tab_plots = []
-
-    for graph_condition in tab.graph_conditions:
-        # 新しい Figure を作成
-        p = figure(
-            title=tab.tabtitle,
-            x_axis_label=graph_condition.x_axis.label,
-            y_axis_label=" / ".join([y_axis.label for y_axis in graph_condition.y_axes]),
-            x_axis_type="datetime",
+def add_consolidated_lines(
+    p,
+    sources: SharedSources,
+    conditions: List[DataCondition],
+    downsample: Optional[Downsample],
+    max_points: Optional[int],
+) -> None:
+    """図内の系列を1つの multi_line グリフ・1つのソースにまとめて追加します。
+
+    凡例のクリックで系列ごとに表示を切り替えられるよう、グリフとソースは共有したまま
+    系列ごとに IndexFilter で1行だけを表示するレンダラーを作ります。
+    系列ごとの ColumnDataSource・グリフ・選択状態のモデルが不要になるため、
+    系列の多い図ではドキュメントのモデル数とシリアライズ量が減ります。
+    """
+    from bokeh.models import CDSView, GlyphRenderer, IndexFilter, Legend, LegendItem, MultiLine
+
+    source = sources.multi_source_for(conditions, downsample, max_points)
+    glyph = MultiLine(xs="xs", ys="ys", line_color="color", line_width=2)
+    items = []
+    for index, condition in enumerate(conditions):
+        renderer = GlyphRenderer(
+            data_source=source,
+            glyph=glyph,
+            view=CDSView(source=source, filters=[IndexFilter([index])]),
         )
+        p.renderers.append(renderer)
+        items.append(LegendItem(label=f"{condition.id} ({condition.unit})", renderers=[renderer]))
+    p.add_layout(Legend(items=items))
+
+
+# 時系列の図の骨組みのテンプレートのキー (軸の種類)
+TIMESERIES_SKELETON = ("timeseries", "datetime")
+
+
+def timeseries_skeleton():
+    """グリフを追加する前の時系列の図 (軸・グリッド・ツールの設定まで) を作成します。"""
+    from bokeh.plotting import figure
+
+    p = figure(x_axis_type="datetime")
+    p.grid.grid_line_alpha = 0.3
+    return p
+
+
+def create_bokeh_graph(tab: Tab, sources: Optional[SharedSources] = None):
+    from bokeh.layouts import gridplot
+
+    from src.libs.render.skeleton import templates
+
+    # 取得済みのソースが渡されない場合はこのタブ分だけ取得する
+    if sources is None:
+        sources = execute_plan_concurrent(plan_conditions(tab.data_conditions), afetch_series)
+
+    with span("tab.build", "tab", tab=tab.tabname) as stats:
+        # 各タブのグラフを保持するリスト
+        tab_plots = []
+
+        for graph_condition in tab.graph_conditions:
+            # 間引き設定 (GraphCondition が未指定なら Tab の設定) から図1枚あたりの点数を決める
+            downsample = graph_condition.downsample or tab.downsample
+            max_points = downsample.target_points(tab.layout.columns) if downsample else None
+
+            # 描画方法 (GraphCondition が未指定なら Tab の設定)
+            glyph_options = graph_condition.glyphs or tab.glyphs or DEFAULT_GLYPH_OPTIONS
+
+            # 新しい Figure を作成 (骨組みは1度だけ作成し、2回目以降は複製する)
+            p = templates.figure(TIMESERIES_SKELETON, timeseries_skeleton)
+            p.title.text = tab.tabtitle
+            p.xaxis.axis_label = graph_condition.x_axis.label
+            p.yaxis.axis_label = " / ".join([y_axis.label for y_axis in graph_condition.y_axes])
+
+            # 取得計画で共有されているソースを使う（同じ系列は1度だけ取得される）
+            series_sources = [
+                sources.source_for(data_condition, downsample, max_points)
+                for data_condition in tab.data_conditions
+            ]
+            points = sum(len(source.data["x"]) for source in series_sources)
+
+            # 点数の多い図は WebGL で描画する
+            # (Bokeh 2.4 の WebGL は line には対応するが multi_line には対応しないため、統合しない)
+            if glyph_options.use_webgl(points):
+                p.output_backend = "webgl"
+            if glyph_options.consolidate and p.output_backend != "webgl":
+                add_consolidated_lines(p, sources, tab.data_conditions, downsample, max_points)
+            else:
+                # データ条件に従って折れ線グラフを追加
+                for data_condition, source in zip(tab.data_conditions, series_sources):
+                    p.line(
+                        x="x",
+                        y="y",
+                        source=source,
+                        legend_label=f"{data_condition.id} ({data_condition.unit})",
+                        color=data_condition.graph_color,
+                        line_width=2,
+                    )
+            if tracer.enabled:
+                stats["glyphs"] = stats.get("glyphs", 0) + len(p.renderers)
+                stats["rows"] = stats.get("rows", 0) + points
+                if p.output_backend == "webgl":
+                    stats["webgl"] = stats.get("webgl", 0) + 1
 
-        # データ条件に従って折れ線グラフを追加
-        for data_condition in tab.data_conditions:
-            # ダミーデータを生成（本番環境ではデータベースなどから取得する）
-            dates, values = generate_dummy_data(
-                data_condition.start_date, data_condition.end_date, data_condition.interval
-            )
-            source = ColumnDataSource(data=dict(x=dates, y=values))
-
-            # 折れ線グラフを描画
-            p.line(
-                x="x",
-                y="y",
-                source=source,
-                legend_label=f"{data_condition.id} ({data_condition.unit})",
-                color=data_condition.graph_color,
-                line_width=2,
-            )
-
-        # グラフに対してレイアウト設定 (GraphLayout) を適用
-        p.legend.title = "Data Conditions"
-        p.legend.click_policy = "hide"
-        p.grid.grid_line_alpha = 0.3
-
-        # 各グラフをリストに追加
-        tab_plots.append(p)
-
-    # グリッドレイアウトに並べる
-    grid = gridplot(tab_plots, ncols=tab.layout.columns, sizing_mode="stretch_both")
+            # グラフに対してレイアウト設定 (GraphLayout) を適用
+            p.legend.title = "Data Conditions"
+            p.legend.click_policy = "hide"
+
+            # 各グラフをリストに追加
+            tab_plots.append(p)
+
+        # グリッドレイアウトに並べる
+        with span("tab.gridplot", figures=len(tab_plots)):
+            grid = gridplot(tab_plots, ncols=tab.layout.columns, sizing_mode="stretch_both")
+        if tracer.enabled:
+            stats.update(figures=len(tab_plots), models=len(grid.references()))
 
     return grid
 
 
-# 複数ページの作成と表示
-def display_multiple_pages(pages: List[Page]):
-    all_tabs = []
+# 1ページ分のタブを作成する関数
+def create_page_tabs(
+    page: Page,
+    sources: Optional[SharedSources] = None,
+    sidecars: Optional["SidecarWriter"] = None,
+) -> "Tabs":
+    """1ページ分のタブを作成します。
 
-    for page in pages:
+    sidecars を指定した場合、最初のタブ以外の系列はタブを作成するたびにサイドカーへ書き出し、
+    タブが選択されたときに読み込むようにします。
+    """
+    from bokeh.layouts import column
+    from bokeh.models import Panel, Tabs
+
+    if sources is None:
+        # ページ内の全系列を取得先ごとの同時実行数の範囲で並行に取得する
+        sources = execute_plan_concurrent(plan_fetches([page]), afetch_series)
+
+    with span("page.build", "page", page=page.page_title, tabs=len(page.tabs)):
         page_tabs = []
-        for tab in page.tabs:
+        for index, tab in enumerate(page.tabs):
             # 各タブに対応するグラフを生成
-            grid = create_bokeh_graph(tab)
+            grid = create_bokeh_graph(tab, sources)
+            if sidecars is not None:
+                with span("tab.sidecar", tab=tab.tabname):
+                    sidecars.add_tab(grid, inline=index == 0)
 
             # Panelとしてタブに追加
             panel = Panel(child=column(grid), title=tab.tabname)
             page_tabs.append(panel)
 
+        tabs = Tabs(tabs=page_tabs)
+        if sidecars is not None:
+            sidecars.attach(tabs)
+        return tabs
+
+
+# タブ一覧だけを先に返し、タブは要求時に描画するレポートを作成
+def create_lazy_report(pages: List[Page]) -> LazyReport:
+    return LazyReport(pages, build_tab=create_bokeh_graph, fetch=fetch_series, afetch=afetch_series)
+
+
+# Bokeh サーバで表示中のタブを定期的に更新するライブ表示
+def serve_live_pages(
+    pages: List[Page], options: Optional["LiveOptions"] = None, port: int = 5006
+) -> None:
+    from src.libs.render.live import LiveOptions, serve_live
+
+    serve_live(
+        pages,
+        fetch_series,
+        create_bokeh_graph,
+        options or LiveOptions(),
+        port=port,
+        afetch=afetch_series,
+    )
+
+
+# 複数ページの作成と表示
+def display_multiple_pages(pages: List[Page]):
+    from bokeh.models import Panel, Tabs
+    from bokeh.plotting import show
+
+    # 図を作成する前に全ページの DataCondition をまとめて取得する
+    sources = execute_plan_concurrent(plan_fetches(pages), afetch_series)
+
+    all_tabs = []
+
+    for page in pages:
         # 各ページごとにTabsを作成
-        page_layout = Tabs(tabs=page_tabs)
-        all_tabs.append(Panel(child=page_layout, title=page.pagename))
+        page_layout = create_page_tabs(page, sources)
+        all_tabs.append(Panel(child=page_layout, title=page.page_title))
 
     # メインのページレイアウトとして複数のページを表示
     main_tabs = Tabs(tabs=all_tabs)
-    show(main_tabs)
-
-
-# テスト用のダミーPageデータ
-page_data = [
-    Page(
-        pagename="Page 1",
-        title="Sample Page 1",
-        tabs=[
-            Tab(
-                tabname="Tab 1",
-                tabtitle="Sample Graph for Tab 1",
-                layout=GraphLayout(tabname="Tab 1", columns=2, rows=1),
-                data_conditions=[
-                    DataCondition(
-                        id="data1",
-                        tabname="Tab 1",
-                        unit="Unit A",
-                        start_date=datetime(2023, 1, 1),
-                        end_date=datetime(2023, 1, 10),
-                        interval="daily",
-                        data_source="Source A",
-                        graph_color="blue",
-                    ),
-                    DataCondition(
-                        id="data2",
-                        tabname="Tab 1",
-                        unit="Unit B",
-                        start_date=datetime(2023, 1, 1),
-                        end_date=datetime(2023, 1, 10),
-                        interval="daily",
-                        data_source="Source B",
-                        graph_color="green",
-                    ),
-                ],
-                graph_conditions=[
-                    GraphCondition(
-                        id="graph1",
-                        tabname="Tab 1",
-                        x_axis=XAxis(param="date", unit="datetime", range=(0, 10), label="Date"),
-                        y_axes=[
-                            YAxis(
-                                param="value",
-                                unit="units",
-                                range=(0, 100),
-                                color="blue",
-                                label="Value A",
-                            ),
-                            YAxis(
-                                param="value",
-                                unit="units",
-                                range=(0, 100),
-                                color="green",
-                                label="Value B",
+    with span("show"):
+        show(main_tabs)
+
+
+if __name__ == "__main__":
+    # テスト用のダミーPageデータ
+    page_data = [
+        Page(
+            page_title="Sample Page 1",
+            tabs=[
+                Tab(
+                    tabname="Tab 1",
+                    tabtitle="Sample Graph for Tab 1",
+                    layout=GraphLayout(tabname="Tab 1", columns=2, rows=1),
+                    data_conditions=[
+                        DataCondition(
+                            id="data1",
+                            tabname="Tab 1",
+                            unit="Unit A",
+                            start_date=datetime(2023, 1, 1),
+                            end_date=datetime(2023, 1, 10),
+                            interval="daily",
+                            data_source="Source A",
+                            graph_color="blue",
+                        ),
+                        DataCondition(
+                            id="data2",
+                            tabname="Tab 1",
+                            unit="Unit B",
+                            start_date=datetime(2023, 1, 1),
+                            end_date=datetime(2023, 1, 10),
+                            interval="daily",
+                            data_source="Source B",
+                            graph_color="green",
+                        ),
+                    ],
+                    graph_conditions=[
+                        GraphCondition(
+                            id="graph1",
+                            tabname="Tab 1",
+                            x_axis=XAxis(
+                                param="date", unit="datetime", range=(0, 10), label="Date"
                             ),
-                        ],
-                    )
-                ],
-            ),
-            Tab(
-                tabname="Tab 2",
-                tabtitle="Sample Graph for Tab 2",
-                layout=GraphLayout(tabname="Tab 2", columns=1, rows=1),
-                data_conditions=[
-                    DataCondition(
-                        id="data3",
-                        tabname="Tab 2",
-                        unit="Unit C",
-                        start_date=datetime(2023, 2, 1),
-                        end_date=datetime(2023, 2, 10),
-                        interval="daily",
-                        data_source="Source C",
-                        graph_color="purple",
-                    ),
-                ],
-                graph_conditions=[
-                    GraphCondition(
-                        id="graph2",
-                        tabname="Tab 2",
-                        x_axis=XAxis(param="date", unit="datetime", range=(0, 10), label="Date"),
-                        y_axes=[
-                            YAxis(
-                                param="value",
-                                unit="units",
-                                range=(0, 100),
-                                color="purple",
-                                label="Value C",
+                            y_axes=[
+                                YAxis(
+                                    param="value",
+                                    unit="units",
+                                    range=(0, 100),
+                                    color="blue",
+                                    label="Value A",
+                                ),
+                                YAxis(
+                                    param="value",
+                                    unit="units",
+                                    range=(0, 100),
+                                    color="green",
+                                    label="Value B",
+                                ),
+                            ],
+                        )
+                    ],
+                ),
+                Tab(
+                    tabname="Tab 2",
+                    tabtitle="Sample Graph for Tab 2",
+                    layout=GraphLayout(tabname="Tab 2", columns=1, rows=1),
+                    data_conditions=[
+                        DataCondition(
+                            id="data3",
+                            tabname="Tab 2",
+                            unit="Unit C",
+                            start_date=datetime(2023, 2, 1),
+                            end_date=datetime(2023, 2, 10),
+                            interval="daily",
+                            data_source="Source C",
+                            graph_color="purple",
+                        ),
+                    ],
+                    graph_conditions=[
+                        GraphCondition(
+                            id="graph2",
+                            tabname="Tab 2",
+                            x_axis=XAxis(
+                                param="date", unit="datetime", range=(0, 10), label="Date"
                             ),
-                        ],
-                    )
-                ],
-            ),
-        ],
-    )
-]
+                            y_axes=[
+                                YAxis(
+                                    param="value",
+                                    unit="units",
+                                    range=(0, 100),
+                                    color="purple",
+                                    label="Value C",
+                                ),
+                            ],
+                        )
+                    ],
+                ),
+            ],
+        )
+    ]
 
-# グラフを作成・表示
-display_multiple_pages(page_data)
+    # グラフを作成・表示
+    display_multiple_pages(page_data)
@@ -0,0 +1,19 @@
+from .engine import (
+    CALC_SOURCE,
+    CalcEngine,
+    CalcError,
+    CalcExpression,
+    CalcSource,
+    condition_sources,
+    install_calcs,
+)
+
+__all__ = [
+    "CALC_SOURCE",
+    "CalcEngine",
+    "CalcError",
+    "CalcExpression",
+    "CalcSource",
+    "condition_sources",
+    "install_calcs",
+]
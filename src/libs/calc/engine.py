@@ -0,0 +1,348 @@
+import ast
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..fetch.planner import FetchRequest, Series
+from ..model.calc import CalcDefinition
+from ..model.page import Page
+from ..series.encoding import as_time_array, as_value_array
+from ..source.base import (
+    Columns,
+    DataSourceError,
+    SeriesSource,
+    register_source,
+    resolve_source,
+)
+
+# 派生系列を表す DataCondition.data_source
+CALC_SOURCE = "calc"
+
+# {...} で囲んだ ID は識別子として書けない名前 (記号を含む ID など) にも使える
+_QUOTED_NAME = re.compile(r"\{([^{}]+)\}")
+
+
+class CalcError(DataSourceError):
+    """計算式の解析・評価時のエラー"""
+
+
+def _rolling(y: np.ndarray, window: int, mean: bool) -> np.ndarray:
+    """欠損値を除いた移動合計 / 移動平均 (累積和で計算し、先頭の window - 1 点は欠損)。"""
+    window = int(window)
+    if window < 1:
+        raise CalcError("移動窓は1以上である必要があります")
+    valid = ~np.isnan(y)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(valid, y, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    out = np.full(len(y), np.nan)
+    if len(y) >= window:
+        window_sums = sums[window:] - sums[:-window]
+        window_counts = counts[window:] - counts[:-window]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = window_sums / window_counts if mean else window_sums
+        out[window - 1 :] = np.where(window_counts > 0, values, np.nan)
+    return out
+
+
+def _elementwise(func: Callable) -> Callable:
+    return lambda *args: func.reduce(np.broadcast_arrays(*args))
+
+
+# 関数名 → (関数, 引数の数 (None は1個以上))
+# (NumPy の ufunc は余分な引数を out= として受け取り、参照している系列を書き換えるため、
+# 引数の数は解析時に確認する)
+FUNCTIONS: Dict[str, Tuple[Callable[..., np.ndarray], Optional[int]]] = {
+    "abs": (np.abs, 1),
+    "sqrt": (np.sqrt, 1),
+    "log": (np.log, 1),
+    "exp": (np.exp, 1),
+    "min": (_elementwise(np.fmin), None),
+    "max": (_elementwise(np.fmax), None),
+    "sum": (_elementwise(np.add), None),
+    "diff": (lambda y: np.concatenate([[np.nan], np.diff(y)]), 1),
+    "rolling_mean": (lambda y, window: _rolling(y, window, mean=True), 2),
+    "rolling_sum": (lambda y, window: _rolling(y, window, mean=False), 2),
+}
+
+# 2番目の引数に移動窓の点数 (整数の定数) を取る関数
+_WINDOW_FUNCTIONS = {"rolling_mean", "rolling_sum"}
+
+_BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+
+
+class CalcExpression:
+    """解析済みの計算式 (参照している系列の ID を保持する)"""
+
+    def __init__(self, definition: CalcDefinition):
+        self.definition = definition
+        self.names: Dict[str, str] = {}
+
+        def quote(match: re.Match) -> str:
+            placeholder = f"__ref{len(self.names)}"
+            self.names[placeholder] = match.group(1).strip()
+            return placeholder
+
+        source = _QUOTED_NAME.sub(quote, definition.expression)
+        try:
+            self.tree = ast.parse(source, mode="eval")
+        except SyntaxError as e:
+            raise CalcError(f"計算式を解析できません ({definition.id}): {e.msg}") from e
+
+        self.dependencies: List[str] = []
+        self._validate(self.tree.body)
+        if not self.dependencies:
+            raise CalcError(f"計算式が系列を参照していません: {definition.id}")
+
+    def _name(self, node: ast.Name) -> str:
+        return self.names.get(node.id, node.id)
+
+    def _validate(self, node: ast.AST) -> None:
+        """使える構文 (四則演算・べき乗・符号・許可した関数) だけで書かれているか確認します。"""
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            self._validate(node.left)
+            self._validate(node.right)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            self._validate(node.operand)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            pass
+        elif isinstance(node, ast.Name):
+            name = self._name(node)
+            if name not in self.dependencies:
+                self.dependencies.append(name)
+        elif (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in FUNCTIONS
+            and not node.keywords
+        ):
+            self._validate_call(node)
+        else:
+            raise CalcError(f"計算式に使えない構文です ({self.definition.id}): {ast.unparse(node)}")
+
+    def _validate_call(self, node: ast.Call) -> None:
+        name = node.func.id
+        arity = FUNCTIONS[name][1]
+        args = node.args
+        if any(isinstance(arg, ast.Starred) for arg in args) or (
+            len(args) != arity if arity is not None else not args
+        ):
+            expected = f"{arity}個" if arity is not None else "1個以上"
+            raise CalcError(
+                f"{name} の引数は{expected}です ({self.definition.id}): {ast.unparse(node)}"
+            )
+        if name in _WINDOW_FUNCTIONS:
+            window = args[1]
+            if not (
+                isinstance(window, ast.Constant) and type(window.value) is int and window.value >= 1
+            ):
+                raise CalcError(
+                    f"{name} の移動窓は1以上の整数で指定してください ({self.definition.id}): "
+                    f"{ast.unparse(window)}"
+                )
+            args = args[:1]
+        for arg in args:
+            self._validate(arg)
+
+    def evaluate(self, values: Dict[str, np.ndarray]) -> np.ndarray:
+        """参照している系列の値 (時刻をそろえた配列) から式を配列単位で評価します。"""
+
+        def visit(node: ast.AST):
+            if isinstance(node, ast.BinOp):
+                return _BINARY_OPERATORS[type(node.op)](visit(node.left), visit(node.right))
+            if isinstance(node, ast.UnaryOp):
+                operand = visit(node.operand)
+                return -operand if isinstance(node.op, ast.USub) else operand
+            if isinstance(node, ast.Constant):
+                return node.value
+            if isinstance(node, ast.Name):
+                return values[self._name(node)]
+            return FUNCTIONS[node.func.id][0](*[visit(arg) for arg in node.args])
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.asarray(visit(self.tree.body), dtype=np.float64)
+
+
+def align(x_target: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """系列 (x, y) を x_target の各時刻時点の直近の値にそろえます (as-of 結合)。"""
+    if len(x) == 0:
+        return np.full(len(x_target), np.nan)
+    if len(x) == len(x_target) and np.array_equal(x, x_target):
+        return y
+    indices = np.searchsorted(x, x_target, side="right") - 1
+    return np.where(indices >= 0, y[np.clip(indices, 0, None)], np.nan)
+
+
+class CalcEngine:
+    """calc シートの式を DataCondition.id の依存グラフとして評価するエンジン
+
+    式が参照する系列は、表示する派生系列から必要になった分だけ取得します。
+    取得・計算した系列は (ID, 期間, 間隔) ごとに保持するため、複数の式から
+    参照される系列も1度だけ取得・計算されます。保持した系列は参照している生の系列の
+    更新状況 (watermark) が変わったら取得・計算し直します。
+    """
+
+    def __init__(
+        self,
+        definitions: Iterable[CalcDefinition],
+        fetch: Callable[[FetchRequest], Series],
+        sources: Optional[Dict[str, str]] = None,
+    ):
+        self.expressions: Dict[str, CalcExpression] = {
+            definition.id: CalcExpression(definition) for definition in definitions
+        }
+        self.fetch = fetch
+        # 系列 ID → 取得先 (DataCondition.data_source)
+        self.sources = sources or {}
+        # (ID, 間隔, 集計方法, 期間) → (更新状況, 系列)
+        self._cache: Dict[tuple, Tuple[Optional[str], Columns]] = {}
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        """派生系列を依存先から順に並べます (循環参照はエラー)。"""
+        order: List[str] = []
+        state: Dict[str, int] = {}
+
+        def visit(name: str, path: List[str]) -> None:
+            if state.get(name) == 2 or name not in self.expressions:
+                return
+            if state.get(name) == 1:
+                raise CalcError(f"計算式が循環しています: {' -> '.join(path + [name])}")
+            state[name] = 1
+            for dependency in self.expressions[name].dependencies:
+                visit(dependency, path + [name])
+            state[name] = 2
+            order.append(name)
+
+        for name in self.expressions:
+            visit(name, [])
+        return order
+
+    def raw_dependencies(self, name: str) -> Set[str]:
+        """派生系列が最終的に必要とする生の系列の ID を返します。"""
+        if name not in self.expressions:
+            return {name}
+        return set().union(
+            *(self.raw_dependencies(dep) for dep in self.expressions[name].dependencies)
+        )
+
+    def _fetch_raw(self, name: str, request: FetchRequest) -> Columns:
+        data_source = self.sources.get(name)
+        if data_source is None and request.id in self.expressions:
+            data_source = self.expressions[request.id].definition.data_source
+        if data_source is None:
+            raise CalcError(f"系列の取得先が分かりません: {name}")
+        x, y = self.fetch(request.model_copy(update={"id": name, "data_source": data_source}))
+        return as_time_array(x), as_value_array(y, np.float64)
+
+    def watermark(self, name: str, request: FetchRequest) -> Optional[str]:
+        """式の定義と、参照している全ての生の系列の更新状況を合わせた文字列。
+
+        更新状況が分からない系列を参照している場合は None を返します。
+        """
+        parts = [d.model_dump_json() for d in self.definitions_for(name)]
+        for raw in sorted(self.raw_dependencies(name)):
+            data_source = self.sources.get(raw)
+            source = resolve_source(data_source) if data_source is not None else None
+            if source is None:
+                return None
+            mark = source.watermark(
+                request.model_copy(update={"id": raw, "data_source": data_source})
+            )
+            if mark is None:
+                return None
+            parts.append(f"{raw}={mark}")
+        return "|".join(parts)
+
+    def series(self, name: str, request: FetchRequest) -> Columns:
+        """系列 (派生系列なら計算結果) を取得要求の期間・間隔で返します。
+
+        更新状況が分からない系列は、clear() するまで最初に取得・計算した結果を返します。
+        """
+        key = (name, request.interval, request.aggregation, request.start_date, request.end_date)
+        mark = self.watermark(name, request)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == mark:
+            return cached[1]
+
+        expression = self.expressions.get(name)
+        if expression is None:
+            result = self._fetch_raw(name, request)
+        else:
+            dependencies = [
+                (dep, self.series(dep, request.model_copy(update={"id": name})))
+                for dep in expression.dependencies
+            ]
+            # 最初に参照した系列の時刻を基準に他の系列をそろえる
+            x = dependencies[0][1][0]
+            values = {dep: align(x, dep_x, dep_y) for dep, (dep_x, dep_y) in dependencies}
+            result = (x, expression.evaluate(values))
+
+        self._cache[key] = (mark, result)
+        return result
+
+    def definitions_for(self, name: str) -> List[CalcDefinition]:
+        """派生系列の計算に使う定義 (参照先の派生系列の定義を含む) を返します。"""
+        expression = self.expressions.get(name)
+        if expression is None:
+            return []
+        definitions = [expression.definition]
+        for dependency in expression.dependencies:
+            definitions += self.definitions_for(dependency)
+        return definitions
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+class CalcSource(SeriesSource):
+    """派生系列 (data_source が "calc" の DataCondition) を計算で返す取得先"""
+
+    # 参照先の系列がストアに保存されるため、計算結果は保存しない
+    storable = False
+
+    def __init__(self, engine: CalcEngine):
+        self.engine = engine
+
+    def fetch(self, request: FetchRequest) -> Columns:
+        if request.id not in self.engine.expressions:
+            raise CalcError(f"calc シートに定義がありません: {request.id}")
+        return self.engine.series(request.id, request)
+
+    def watermark(self, request: FetchRequest) -> Optional[str]:
+        """式の定義と、参照している全ての生の系列の更新状況を合わせた文字列。"""
+        return self.engine.watermark(request.id, request)
+
+    def close(self) -> None:
+        self.engine.clear()
+
+
+def condition_sources(pages: Iterable[Page]) -> Dict[str, str]:
+    """設定に含まれる DataCondition の ID → 取得先の対応を返します。"""
+    return {
+        condition.id: condition.data_source
+        for page in pages
+        for tab in page.tabs
+        for condition in tab.data_conditions
+        if condition.data_source != CALC_SOURCE
+    }
+
+
+def install_calcs(
+    definitions: Iterable[CalcDefinition],
+    sources: Dict[str, str],
+    fetch: Callable[[FetchRequest], Series],
+) -> CalcEngine:
+    """calc シートの定義を data_source "calc" の取得先として登録します。
+
+    sources は式が参照する系列の ID → 取得先の対応です (condition_sources で作成する)。
+    """
+    engine = CalcEngine(definitions, fetch, sources)
+    register_source(CALC_SOURCE, CalcSource(engine))
+    return engine
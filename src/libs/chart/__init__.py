@@ -1,6 +1,39 @@
-from .charts.bar import BarChart
-from .charts.pie import PieChart
-from .config import BarChartConfig, PieChartConfig
-from .schema import ChartData
+"""円グラフ・棒グラフ
+
+bokeh / numpy は描画するときに必要になるため、公開しているクラスは最初に参照された時点で
+読み込みます (import src.libs.chart だけでは読み込まない)。
+"""
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .charts.bar import BarChart
+    from .charts.pie import PieChart
+    from .config import BarChartConfig, PieChartConfig
+    from .schema import ChartData
+
+# 公開名 → 定義しているモジュール
+_EXPORTS = {
+    "BarChart": ".charts.bar",
+    "PieChart": ".charts.pie",
+    "BarChartConfig": ".config",
+    "PieChartConfig": ".config",
+    "ChartData": ".schema",
+}
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
+
 
 __all__ = ["PieChart", "BarChart", "BarChartConfig", "PieChartConfig", "ChartData"]
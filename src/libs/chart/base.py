@@ -1,24 +1,19 @@
 from abc import ABC, abstractmethod
+from typing import Hashable
 
-from bokeh.io import show
-from bokeh.layouts import row
 from bokeh.models import ColumnDataSource
 from bokeh.plotting import figure, show
 
-# from bokeh.plotting import show
-from src.libs.chart import (
-    BarChart,
-    BarChartConfig,
-    ChartData,
-    PieChart,
-    PieChartConfig,
-)
-
-from .config import FigureConfig
+from ..render.skeleton import templates
+from .config import BarChartConfig, FigureConfig
+from .schema import ChartData
 
 
 class Chart(ABC):
     def __init__(self, data: ChartData, config: FigureConfig = FigureConfig()):
+        # 項目数が多い場合は上位のみ残し、残りを「その他」にまとめる
+        if config.max_categories is not None:
+            data = data.top_n(config.max_categories, config.other_label, config.other_color)
         self.data = data
         self.config = config
         self.source = ColumnDataSource()
@@ -31,22 +26,42 @@ class Chart(ABC):
     def _add_elements(self, p: figure) -> None:
         pass
 
-    def _create_figure(self) -> figure:
-        """Bokehのfigureオブジェクトを作成し、設定します。"""
+    def _figure_key(self) -> Hashable:
+        """図の骨組みのテンプレートのキーを返します。
+
+        タイトルと棒グラフの項目は複製してから設定するため、キーには含めません。
+        """
+        return type(self.config), self.config.model_copy(update={"title": ""})
+
+    def _build_skeleton(self) -> figure:
+        """グリフを追加する前の図 (軸・グリッド・ツールの設定まで) を作成します。"""
+        # 棒グラフの項目は図ごとに異なるため、仮の項目で分類軸の図を作成する
         x_range = (
-            self.source.data["labels"]
+            [""]
             if isinstance(self.config, BarChartConfig)
             else getattr(self.config, "x_range", None)
         )
         y_range = getattr(self.config, "y_range", None)
-        return figure(
-            title=self.config.title,
+        p = figure(
             plot_height=self.config.plot_height,
             plot_width=self.config.plot_width,
             toolbar_location=self.config.toolbar_location,
             x_range=x_range,
             y_range=y_range,
         )
+        self._configure_axes(p)
+        return p
+
+    def _create_figure(self) -> figure:
+        """Bokehのfigureオブジェクトを作成し、設定します。
+
+        同じ設定の図の骨組みは1度だけ作成し、2回目以降は骨組みを複製します。
+        """
+        p = templates.figure(self._figure_key(), self._build_skeleton)
+        p.title.text = self.config.title
+        if isinstance(self.config, BarChartConfig):
+            p.x_range.factors = list(self.source.data["labels"])
+        return p
 
     def _configure_axes(self, p: figure) -> None:
         """軸とグリッドの表示設定を行います。"""
@@ -59,51 +74,9 @@ class Chart(ABC):
         """グラフを表示します。"""
         self._prepare_data_source()
         p = self._create_figure()
-        self._configure_axes(p)
         self._add_elements(p)
         return p
 
     def show(self):
         p = self.render()
         show(p)
-
-
-def set_chart_data() -> ChartData:
-    return ChartData(
-        x=["Pepperoni", "Cheese", "Mixed Veggies", "Bacon"],
-        y=[221, 212, 152, 72],
-        colors=["red", "darkorange", "darkgreen", "hotpink"],
-    )
-
-
-def config_pie_chart():
-    return PieChartConfig(
-        title="Pizza Orders - Pie Chart",
-        label_position_adjust=1.3,
-    )
-
-
-def config_bar_chart():
-    return BarChartConfig(
-        title="Pizza Orders - Bar Chart",
-    )
-
-
-def create_charts(data):
-    pie_config = config_pie_chart()
-    bar_config = config_bar_chart()
-
-    pie_chart = PieChart(data, pie_config)
-    bar_chart = BarChart(data, bar_config)
-
-    return pie_chart.render(), bar_chart.render()
-
-
-def main():
-    data = set_chart_data()
-    pie_figure, bar_figure = create_charts(data)
-    show(row(pie_figure, bar_figure))
-
-
-if __name__ == "__main__":
-    main()
@@ -16,25 +16,25 @@ class PieChart(Chart):
 
     def _calculate_angles(self) -> None:
         """各セクションの開始角度、終了角度、および中央角度を計算します。"""
-        total = sum(self.data.y)
-        ratios = [amount / total for amount in self.data.y]
-        angles = [ratio * 2 * pi for ratio in ratios]
+        self.total = self.data.y.sum()
+        self.ratios = self.data.y / self.total
+        angles = self.ratios * 2 * pi
 
-        self.start_angles = [sum(angles[:i]) + pi / 2 for i in range(len(angles))]
-        self.end_angles = [start + angle for start, angle in zip(self.start_angles, angles)]
-        self.mid_angles = [(s + e) / 2 for s, e in zip(self.start_angles, self.end_angles)]
+        # 累積和で終了角度を求め、開始角度はそこから各セクションの角度を引く
+        self.end_angles = np.cumsum(angles) + pi / 2
+        self.start_angles = self.end_angles - angles
+        self.mid_angles = (self.start_angles + self.end_angles) / 2
 
     def _calculate_label_positions(self) -> None:
         """ラベルのx, y座標を計算します。"""
         adjust = self.config.label_position_adjust
-        self.label_x = [adjust * np.cos(angle) for angle in self.mid_angles]
-        self.label_y = [adjust * np.sin(angle) for angle in self.mid_angles]
+        self.label_x = adjust * np.cos(self.mid_angles)
+        self.label_y = adjust * np.sin(self.mid_angles)
 
     def _prepare_data_source(self) -> None:
         """Bokehプロット用のデータソースを準備します。"""
-        total = sum(self.data.y)
-        percentages = [(amount / total) * 100 for amount in self.data.y]
-        display_text = [f"{amount} ({(amount / total) * 100:.1f}%)" for amount in self.data.y]
+        percentages = self.ratios * 100
+        display_text = np.char.add(self.data.y.astype(str), np.char.mod(" (%.1f%%)", percentages))
         self.source.data = {
             "labels": self.data.x,
             "start_angle": self.start_angles,
@@ -70,11 +70,10 @@ class PieChart(Chart):
             source=self.source,
         )
 
-        total_amount = sum(self.data.y)
         p.text(
             x=self.config.x_range[0] * 0.9,
             y=self.config.y_range[1] * 0.9,
-            text=[f"Total: {total_amount}"],
+            text=[f"Total: {self.total}"],
             text_align="left",
             text_baseline="top",
             text_font_size="12pt",
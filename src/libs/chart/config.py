@@ -13,6 +13,13 @@ class FigureConfig(BaseModel):
     show_grid: bool = Field(default=True, description="グリッドの表示/非表示")
     show_axis: bool = Field(default=True, description="軸の表示/非表示")
     legend_location: Optional[str] = Field(default="top_left", description="凡例の位置")
+    max_categories: Optional[int] = Field(
+        default=None,
+        description="表示する項目数の上限/超えた分は「その他」にまとめる (None で無制限)",
+        ge=1,
+    )
+    other_label: str = Field(default="Other", description="「その他」のラベル")
+    other_color: str = Field(default="lightgray", description="「その他」の色")
 
     class Config:
         frozen = True  # イミュータブルに設定
@@ -1,27 +1,67 @@
-from typing import List
+from typing import Any
 
-from pydantic import BaseModel, Field, model_validator
+import numpy as np
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+
+def to_array(values: Any) -> np.ndarray:
+    """リスト・NumPy 配列・pandas / polars の Series・Arrow 配列を NumPy 配列に変換します。
+
+    数値の列はできる限りコピーせずにそのまま参照します。
+    """
+    if isinstance(values, np.ndarray):
+        return values
+    if type(values).__module__.startswith("pyarrow"):
+        # 欠損値の無い数値配列はゼロコピーで参照される
+        return values.to_numpy(zero_copy_only=False)
+    if hasattr(values, "to_numpy"):
+        # pandas / polars の Series
+        return values.to_numpy()
+    return np.asarray(values)
 
 
 class ChartData(BaseModel):
-    """グラフ作成に必要なデータを保持するデータ構造"""
+    """グラフ作成に必要なデータを保持するデータ構造
 
-    x: List[str] = Field(
+    各項目は NumPy 配列として保持し、検証・計算は要素ごとではなく配列単位で行います。
+    """
+
+    x: np.ndarray = Field(
         ...,  # 必須パラメータ
         description="各セクションのラベル",
-        min_length=1,  # 少なくとも1つの要素が必要
     )
-    y: List[int] = Field(
+    y: np.ndarray = Field(
         ...,
         description="各セクションの数量",
-        min_length=1,
     )
-    colors: List[str] = Field(
+    colors: np.ndarray = Field(
         ...,
         description="各セクションの色",
-        min_length=1,
     )
 
+    @field_validator("x", "y", "colors", mode="before")
+    @classmethod
+    def convert_arrays(cls, values):
+        array = to_array(values)
+        if array.ndim != 1:
+            raise ValueError("1次元の配列である必要があります")
+        return array
+
+    @field_validator("x", "y", "colors")
+    @classmethod
+    def validate_not_empty(cls, values: np.ndarray) -> np.ndarray:
+        # 少なくとも1つの要素が必要
+        if len(values) == 0:
+            raise ValueError("少なくとも1つの要素が必要です")
+        return values
+
+    @field_validator("y")
+    @classmethod
+    def validate_numeric(cls, values: np.ndarray) -> np.ndarray:
+        if not np.issubdtype(values.dtype, np.number):
+            raise ValueError("数量は数値である必要があります")
+        return values
+
     @model_validator(mode="after")
     def validate_lists(self) -> "ChartData":
         """全てのリストの長さが同じであることを確認"""
@@ -31,5 +71,26 @@ class ChartData(BaseModel):
 
         return self
 
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def top_n(self, n: int, other_label: str = "Other", other_color: str = "lightgray"):
+        """数量の多い上位 n 件を残し、残りを1つの「その他」にまとめたデータを返します。"""
+        if len(self) <= n:
+            return self
+        # 上位 n 件を O(len) で選び、その中だけを数量の降順に並べる
+        # (符号なし整数は符号を反転すると桁あふれするため、浮動小数点数に変換してから反転する)
+        keys = -self.y.astype(np.float64)
+        top = np.argpartition(keys, n - 1)[:n]
+        top = top[np.argsort(keys[top], kind="stable")]
+        rest = np.ones(len(self), dtype=bool)
+        rest[top] = False
+        return ChartData(
+            x=np.append(self.x[top].astype(object), other_label),
+            y=np.append(self.y[top], self.y[rest].sum()),
+            colors=np.append(self.colors[top].astype(object), other_color),
+        )
+
     class Config:
         frozen = True  # イミュータブルに設定
+        arbitrary_types_allowed = True  # NumPy 配列を保持する
@@ -0,0 +1,3 @@
+from .planner import FetchPlan, FetchRequest, SharedSources, execute_plan, plan_fetches
+
+__all__ = ["FetchPlan", "FetchRequest", "SharedSources", "execute_plan", "plan_fetches"]
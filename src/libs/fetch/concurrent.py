@@ -0,0 +1,212 @@
+"""取得計画の非同期・並行実行
+
+取得計画の要求を asyncio で同時に実行します。data_source ごとに同時実行数・タイムアウト・
+再試行回数を FetchPolicy で指定でき、失敗した系列は (partial が有効なら) 警告を出して
+空の系列として扱うため、1つの取得先の障害でページ全体が失敗しなくなります。
+"""
+
+import asyncio
+import logging
+import threading
+import warnings
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from ..profiling import span
+from ..series.encoding import TIME_DTYPE
+from ..source.base import TransientSourceError, resolve_source
+from .planner import FetchPlan, FetchRequest, Series, SharedSources
+
+logger = logging.getLogger(__name__)
+
+
+class FetchPolicy(BaseModel):
+    """data_source ごとの取得方法の設定"""
+
+    max_concurrency: int = Field(default=4, ge=1, description="同時に実行する取得要求の数")
+    timeout: Optional[float] = Field(default=30.0, gt=0, description="1回の取得の制限時間 (秒)")
+    retries: int = Field(default=2, ge=0, description="失敗した場合の再試行回数")
+    backoff: float = Field(default=0.5, ge=0, description="再試行までの待ち時間 (秒、毎回2倍)")
+    partial: bool = Field(
+        default=True, description="失敗した系列を空の系列にして続ける (False では例外を送出)"
+    )
+
+    class Config:
+        frozen = True
+
+
+class FetchFailedWarning(UserWarning):
+    """取得に失敗した系列を空の系列として扱った場合の警告"""
+
+
+DEFAULT_POLICY = FetchPolicy()
+
+# data_source 名 → 取得方法 (登録されていない取得先は DEFAULT_POLICY)
+_policies: Dict[str, FetchPolicy] = {}
+
+
+def set_fetch_policy(data_source: str, policy: FetchPolicy) -> None:
+    """data_source の取得方法を設定します。"""
+    _policies[data_source] = policy
+
+
+def policy_for(data_source: str) -> FetchPolicy:
+    return _policies.get(data_source, DEFAULT_POLICY)
+
+
+def empty_series() -> Tuple[np.ndarray, np.ndarray]:
+    return np.array([], dtype=TIME_DTYPE), np.array([], dtype=np.float64)
+
+
+def _is_transient(error: BaseException) -> bool:
+    """再試行すれば成功する可能性のあるエラーか (設定の誤りや計算式のエラーは再試行しない)。"""
+    return isinstance(error, (TimeoutError, ConnectionError, TransientSourceError))
+
+
+async def _fetch_with_policy(
+    request: FetchRequest,
+    afetch: Callable[[FetchRequest], Awaitable[Series]],
+    policy: FetchPolicy,
+    semaphore: asyncio.Semaphore,
+    running: Set["asyncio.Future[Series]"],
+) -> Series:
+    """制限時間・再試行付きで1要求を取得します。
+
+    制限時間を過ぎた取得は取り消しますが、スレッドで実行中の取得は止められないため、
+    同時実行数の枠は取得が実際に終わるまで解放しません (running で終了を待てる)。
+    """
+    delay = policy.backoff
+    for attempt in range(policy.retries + 1):
+        await semaphore.acquire()
+        task = asyncio.ensure_future(afetch(request))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: semaphore.release())
+        try:
+            with span("fetch", "series", id=request.id, source=request.data_source) as stats:
+                stats["attempt"] = attempt
+                try:
+                    series = await asyncio.wait_for(asyncio.shield(task), policy.timeout)
+                except BaseException:
+                    task.cancel()
+                    raise
+                stats["rows"] = len(series[0])
+                return series
+        except Exception as e:
+            if attempt == policy.retries or not _is_transient(e):
+                raise
+            logger.info("retrying %s/%s after %r", request.data_source, request.id, e)
+            await asyncio.sleep(delay)
+            delay *= 2
+    raise AssertionError("unreachable")
+
+
+async def execute_plan_async(
+    plan: FetchPlan,
+    afetch: Callable[[FetchRequest], Awaitable[Series]],
+    value_dtype=None,
+    warn: bool = True,
+) -> SharedSources:
+    """取得計画の全要求を同時に取得します (data_source ごとに同時実行数を制限する)。
+
+    partial が有効な取得先で失敗した要求は空の系列になり、SharedSources.failures に
+    エラー内容が記録されます。warn が True なら失敗した要求ごとに FetchFailedWarning を
+    出します。
+    """
+    semaphores: Dict[str, asyncio.Semaphore] = {}
+    for request in plan.requests:
+        if request.data_source not in semaphores:
+            semaphores[request.data_source] = asyncio.Semaphore(
+                policy_for(request.data_source).max_concurrency
+            )
+
+    running: Set["asyncio.Future[Series]"] = set()
+    with span("fetch.plan", requests=len(plan), concurrent=True):
+        results = await asyncio.gather(
+            *(
+                _fetch_with_policy(
+                    request,
+                    afetch,
+                    policy_for(request.data_source),
+                    semaphores[request.data_source],
+                    running,
+                )
+                for request in plan.requests
+            ),
+            return_exceptions=True,
+        )
+        # 取り消した取得 (実行中のスレッドなど) が終わってから取得先を閉じる
+        if running:
+            await asyncio.wait(set(running))
+        # イベントループごとに作成したクライアントなどを閉じる
+        for data_source in semaphores:
+            source = resolve_source(data_source)
+            if source is not None:
+                await source.aclose()
+
+    series: Dict[FetchRequest, Series] = {}
+    failures: Dict[FetchRequest, str] = {}
+    for request, result in zip(plan.requests, results):
+        if not isinstance(result, BaseException):
+            series[request] = result
+            continue
+        if not policy_for(request.data_source).partial:
+            raise result
+        # httpx のエラーなどは複数行になるため1行目だけを使う
+        detail = str(result).splitlines()[0] if str(result) else ""
+        message = f"{type(result).__name__}: {detail}" if detail else type(result).__name__
+        series[request] = empty_series()
+        failures[request] = message
+
+    sources = SharedSources(plan, series, value_dtype=value_dtype)
+    sources.failures = failures
+    if warn:
+        _warn_failures(sources, stacklevel=3)
+    return sources
+
+
+def _warn_failures(sources: SharedSources, stacklevel: int) -> None:
+    # stacklevel は取得計画を実行した関数の呼び出し元を指すように指定する
+    for request, message in sources.failures.items():
+        warnings.warn(
+            f"系列を取得できませんでした ({request.data_source} / {request.id}): {message}",
+            FetchFailedWarning,
+            stacklevel=stacklevel,
+        )
+
+
+def execute_plan_concurrent(
+    plan: FetchPlan,
+    afetch: Callable[[FetchRequest], Awaitable[Series]],
+    value_dtype=None,
+) -> SharedSources:
+    """execute_plan_async を同期的に実行します。
+
+    イベントループの中 (Bokeh サーバーなど) から呼ばれた場合は別スレッドのループで実行します。
+    """
+    # 警告はイベントループの中ではなく、この関数の呼び出し元を指すように出す
+    coroutine = execute_plan_async(plan, afetch, value_dtype, warn=False)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        sources = asyncio.run(coroutine)
+        _warn_failures(sources, stacklevel=3)
+        return sources
+
+    result = {}
+
+    def run() -> None:
+        try:
+            result["value"] = asyncio.run(coroutine)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    _warn_failures(result["value"], stacklevel=3)
+    return result["value"]
@@ -0,0 +1,210 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from ..model.data import DataCondition
+from ..model.graph import Downsample
+from ..model.page import Page
+from ..profiling import span, tracer
+from ..series.downsample import downsample as downsample_series
+from ..series.encoding import as_time_array, as_value_array
+
+if TYPE_CHECKING:
+    # bokeh はソースを作成するときに読み込む (取得計画の作成・データ取得だけでは不要)
+    from bokeh.models import ColumnDataSource
+
+FetchKey = Tuple[str, str, str, str]
+Series = Tuple[Sequence, Sequence]
+
+
+class FetchRequest(BaseModel):
+    """1系列分の取得要求 (重複する期間をまとめたもの)"""
+
+    data_source: str = Field(description="データ取得先")
+    id: str = Field(description="データのID")
+    interval: str = Field(description="間隔")
+    aggregation: str = Field(default="mean", description="間隔ごとの集計方法")
+    start_date: datetime = Field(description="開始日時")
+    end_date: datetime = Field(description="終了日時")
+
+    @property
+    def key(self) -> FetchKey:
+        return (self.data_source, self.id, self.interval, self.aggregation)
+
+    def covers(self, start_date: datetime, end_date: datetime) -> bool:
+        """指定の期間がこの要求の期間に含まれるかを判定します。"""
+        return self.start_date <= start_date and end_date <= self.end_date
+
+    class Config:
+        frozen = True  # イミュータブルに設定
+
+
+def condition_key(condition: DataCondition) -> FetchKey:
+    """DataCondition を取得単位のキーに変換します。"""
+    return (condition.data_source, condition.id, condition.interval, condition.aggregation)
+
+
+def _merge_windows(windows: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    """重なる (接する) 期間をまとめます。"""
+    merged: List[Tuple[datetime, datetime]] = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class FetchPlan:
+    """全ページ・全タブの DataCondition をまとめた取得計画"""
+
+    def __init__(self, requests: List[FetchRequest]):
+        self.requests = requests
+        self._by_key: Dict[FetchKey, List[FetchRequest]] = defaultdict(list)
+        for request in requests:
+            self._by_key[request.key].append(request)
+
+    def request_for(self, condition: DataCondition) -> FetchRequest:
+        """DataCondition の期間を含む取得要求を返します。"""
+        for request in self._by_key.get(condition_key(condition), []):
+            if request.covers(condition.start_date, condition.end_date):
+                return request
+        raise KeyError(f"取得計画に含まれないデータ条件です: {condition.id}")
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+
+def plan_conditions(conditions: Iterable[DataCondition]) -> FetchPlan:
+    """DataCondition の集合から取得計画を作成します。"""
+    windows: Dict[FetchKey, List[Tuple[datetime, datetime]]] = defaultdict(list)
+    for condition in conditions:
+        windows[condition_key(condition)].append((condition.start_date, condition.end_date))
+
+    requests = [
+        FetchRequest(
+            data_source=data_source,
+            id=id_,
+            interval=interval,
+            aggregation=aggregation,
+            start_date=start,
+            end_date=end,
+        )
+        for (data_source, id_, interval, aggregation), key_windows in windows.items()
+        for start, end in _merge_windows(key_windows)
+    ]
+    return FetchPlan(requests)
+
+
+def plan_fetches(pages: Iterable[Page]) -> FetchPlan:
+    """図を作成する前に全ページを走査し、取得計画を作成します。"""
+    return plan_conditions(
+        condition for page in pages for tab in page.tabs for condition in tab.data_conditions
+    )
+
+
+class SharedSources:
+    """取得計画の各要求につき1つの ColumnDataSource を共有するための入れ物
+
+    系列は datetime64[ms] の時刻と float の値の配列として保持するため、
+    ドキュメントには base64 のバイナリ配列としてシリアライズされます。
+    """
+
+    def __init__(self, plan: FetchPlan, series: Dict[FetchRequest, Series], value_dtype=None):
+        self.plan = plan
+        self._series: Dict[FetchRequest, Tuple[np.ndarray, np.ndarray]] = {
+            request: (as_time_array(x), as_value_array(y, value_dtype))
+            for request, (x, y) in series.items()
+        }
+        self._sources: Dict[tuple, "ColumnDataSource"] = {}
+        # 取得に失敗して空の系列にした要求 → エラー内容 (fetch.concurrent で設定する)
+        self.failures: Dict[FetchRequest, str] = {}
+
+    def series_of(self, request: FetchRequest) -> Tuple[np.ndarray, np.ndarray]:
+        """取得計画の要求1つ分の系列 (x, y) を返します。"""
+        return self._series[request]
+
+    def series_for(self, condition: DataCondition) -> Tuple[np.ndarray, np.ndarray]:
+        """DataCondition の期間に切り出した系列 (x, y) を返します。"""
+        request = self.plan.request_for(condition)
+        x, y = self.series_of(request)
+        if (request.start_date, request.end_date) == (condition.start_date, condition.end_date):
+            return x, y
+        start = np.searchsorted(x, np.datetime64(condition.start_date, "ms"), side="left")
+        stop = np.searchsorted(x, np.datetime64(condition.end_date, "ms"), side="right")
+        return x[start:stop], y[start:stop]
+
+    def source_for(
+        self,
+        condition: DataCondition,
+        downsample: Optional[Downsample] = None,
+        max_points: Optional[int] = None,
+    ) -> "ColumnDataSource":
+        """DataCondition 用の ColumnDataSource を返します。
+
+        同じ取得要求・同じ期間 (・同じ間引き設定) を参照する図には同一のソースを渡すため、
+        ドキュメント内ではデータが1度だけシリアライズされます。
+        期間が取得要求の一部の場合は、取得済み配列のスライスからソースを作成します。
+        downsample を指定した場合は max_points 点程度に間引いてからソースに渡します。
+        """
+        request = self.plan.request_for(condition)
+        if downsample is None or not max_points:
+            downsample, max_points = None, None
+        method = downsample.method if downsample is not None else None
+        cache_key = (request, condition.start_date, condition.end_date, method, max_points)
+        source = self._sources.get(cache_key)
+        if source is None:
+            from bokeh.models import ColumnDataSource
+
+            x, y = self.series_for(condition)
+            if method is not None:
+                x, y = downsample_series(x, y, max_points, method)
+            source = ColumnDataSource(data=dict(x=x, y=y))
+            self._sources[cache_key] = source
+        return source
+
+    def multi_source_for(
+        self,
+        conditions: Sequence[DataCondition],
+        downsample: Optional[Downsample] = None,
+        max_points: Optional[int] = None,
+    ) -> "ColumnDataSource":
+        """複数の DataCondition を1行1系列にまとめた multi_line 用のソースを返します。
+
+        列は xs / ys (系列ごとの配列) と color です。各系列は source_for と同じく切り出し・
+        間引きを行い、同じ系列の組み合わせを参照する図には同一のソースを渡します。
+        """
+        singles = [self.source_for(condition, downsample, max_points) for condition in conditions]
+        cache_key = ("multi",) + tuple(
+            (source.id, condition.graph_color) for source, condition in zip(singles, conditions)
+        )
+        source = self._sources.get(cache_key)
+        if source is None:
+            from bokeh.models import ColumnDataSource
+
+            source = ColumnDataSource(
+                data=dict(
+                    xs=[single.data["x"] for single in singles],
+                    ys=[single.data["y"] for single in singles],
+                    color=[condition.graph_color for condition in conditions],
+                )
+            )
+            self._sources[cache_key] = source
+        return source
+
+
+def execute_plan(
+    plan: FetchPlan, fetch: Callable[[FetchRequest], Series], value_dtype=None
+) -> SharedSources:
+    """取得計画の各要求を1回ずつ取得します。value_dtype で値の型 (float32 等) を指定できます。"""
+    with span("fetch.plan", requests=len(plan)):
+        series = {}
+        for request in plan.requests:
+            with span("fetch", "series", id=request.id, source=request.data_source) as stats:
+                series[request] = fetch(request)
+                if tracer.enabled:
+                    stats["rows"] = len(series[request][0])
+        return SharedSources(plan, series, value_dtype=value_dtype)
@@ -0,0 +1,196 @@
+"""取得した系列の共有メモリでの受け渡し
+
+ページをプロセスプールで描画すると、複数のページで使う系列をワーカーごとに取得するため、
+メモリ使用量がワーカー数 × データ量で増えます。SeriesCoordinator (親プロセス) は描画する
+全ページの取得計画を1度だけ実行し、各系列を multiprocessing.shared_memory のブロックに
+書き込みます。ワーカーは SharedSeriesReader でブロックを参照し、コピーせずに NumPy 配列の
+ビューとして SharedSources (ColumnDataSource) に渡します。
+
+ブロックは系列を使うページの数で参照を数え、それらのページの描画が終わったものから削除します。
+ブロックの配置は datetime64[ms] の時刻 (8 byte × 行数) の後に値 (value_dtype × 行数) です。
+"""
+
+import logging
+from multiprocessing.shared_memory import SharedMemory
+from typing import Awaitable, Callable, Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from ..model.page import Page
+from ..profiling import span
+from ..series.encoding import TIME_DTYPE, as_time_array, as_value_array
+from .concurrent import empty_series, execute_plan_concurrent
+from .planner import FetchPlan, FetchRequest, Series, SharedSources, plan_fetches
+
+logger = logging.getLogger(__name__)
+
+
+class SharedSeries(BaseModel):
+    """共有メモリに書き込んだ1系列の場所"""
+
+    name: str = Field(description="共有メモリのブロック名")
+    rows: int = Field(ge=0, description="行数")
+    value_dtype: str = Field(default="float64", description="値の型")
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows * (TIME_DTYPE.itemsize + np.dtype(self.value_dtype).itemsize)
+
+    class Config:
+        frozen = True
+
+
+def _views(handle: SharedSeries, block: SharedMemory) -> Tuple[np.ndarray, np.ndarray]:
+    x = np.ndarray(handle.rows, dtype=TIME_DTYPE, buffer=block.buf)
+    y = np.ndarray(
+        handle.rows,
+        dtype=handle.value_dtype,
+        buffer=block.buf,
+        offset=handle.rows * TIME_DTYPE.itemsize,
+    )
+    return x, y
+
+
+def _read_only(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # 他のプロセスと共有しているため書き換えられないようにする
+    x.flags.writeable = False
+    y.flags.writeable = False
+    return x, y
+
+
+def _page_conditions(page: Page):
+    return [condition for tab in page.tabs for condition in tab.data_conditions]
+
+
+class SharedSeriesReader:
+    """ワーカープロセスで共有メモリの系列を参照する (SeriesCoordinator.reader で作成する)
+
+    ページをまたいで同じブロックを使い回し、次のページで使わないブロックは閉じます。
+    """
+
+    def __init__(self, plan: FetchPlan, handles: Dict[FetchRequest, SharedSeries]):
+        self.plan = plan
+        self.handles = handles
+        self._blocks: Dict[str, SharedMemory] = {}
+
+    def __getstate__(self):
+        # プロセスプールの initargs として渡すときは、開いているブロックを含めない
+        return {"plan": self.plan, "handles": self.handles, "_blocks": {}}
+
+    def series(self, request: FetchRequest) -> Tuple[np.ndarray, np.ndarray]:
+        """取得要求の系列 (x, y) を共有メモリのビューとして返します。"""
+        handle = self.handles[request]
+        block = self._blocks.get(handle.name)
+        if block is None:
+            block = SharedMemory(name=handle.name)
+            self._blocks[handle.name] = block
+        return _read_only(*_views(handle, block))
+
+    def sources_for(self, page: Page) -> SharedSources:
+        """ページで使う系列だけを参照する SharedSources を返します。"""
+        requests = {self.plan.request_for(condition) for condition in _page_conditions(page)}
+        sources = SharedSources(self.plan, {request: self.series(request) for request in requests})
+        self._detach({self.handles[request].name for request in requests})
+        return sources
+
+    def _detach(self, keep: Set[str]) -> None:
+        for name in [name for name in self._blocks if name not in keep]:
+            try:
+                self._blocks[name].close()
+            except BufferError:
+                # 前のページの図がまだ配列を参照している (次のページで閉じ直す)
+                continue
+            del self._blocks[name]
+
+
+class SeriesCoordinator:
+    """描画する全ページの系列を1度だけ取得し、共有メモリで配布する (親プロセスで使う)"""
+
+    def __init__(self):
+        self.plan = FetchPlan([])
+        self.handles: Dict[FetchRequest, SharedSeries] = {}
+        self._blocks: Dict[FetchRequest, SharedMemory] = {}
+        self._refs: Dict[FetchRequest, int] = {}
+        self._page_requests: Dict[int, List[FetchRequest]] = {}
+
+    @property
+    def nbytes(self) -> int:
+        """公開中の系列の合計サイズ (byte)"""
+        return sum(handle.nbytes for handle in self.handles.values())
+
+    def publish(self, request: FetchRequest, x, y) -> Series:
+        """系列を共有メモリに書き込み、書き込んだ配列のビューを返します。"""
+        x, y = as_time_array(x), as_value_array(y)
+        handle = SharedSeries(name="", rows=len(x), value_dtype=y.dtype.name)
+        # サイズ 0 のブロックは作成できないため、空の系列も 1 byte 確保する
+        block = SharedMemory(create=True, size=max(handle.nbytes, 1))
+        handle = handle.model_copy(update={"name": block.name})
+        shared_x, shared_y = _views(handle, block)
+        shared_x[:] = x
+        shared_y[:] = y
+        self._blocks[request] = block
+        self.handles[request] = handle
+        return _read_only(shared_x, shared_y)
+
+    def fetch_pages(
+        self,
+        pages: Iterable[Tuple[int, Page]],
+        afetch: Callable[[FetchRequest], Awaitable[Series]],
+    ) -> None:
+        """ページ (ページ番号, Page) の系列をまとめて取得し、共有メモリに書き込みます。
+
+        取得に失敗した系列は (取得方法の設定に従い) 空の系列として書き込みます。
+        """
+        pages = list(pages)
+        self.plan = plan_fetches(page for _, page in pages)
+
+        async def afetch_shared(request: FetchRequest) -> Series:
+            return self.publish(request, *await afetch(request))
+
+        with span("fetch.shared", requests=len(self.plan)) as stats:
+            execute_plan_concurrent(self.plan, afetch_shared)
+            for request in self.plan.requests:
+                if request not in self.handles:
+                    self.publish(request, *empty_series())
+            stats["bytes"] = self.nbytes
+
+        for index, page in pages:
+            requests = list({self.plan.request_for(c) for c in _page_conditions(page)})
+            self._page_requests[index] = requests
+            for request in requests:
+                self._refs[request] = self._refs.get(request, 0) + 1
+
+    def reader(self) -> SharedSeriesReader:
+        """ワーカープロセスに渡す参照用オブジェクトを返します。"""
+        return SharedSeriesReader(self.plan, dict(self.handles))
+
+    def release_page(self, index: int) -> None:
+        """ページの描画が終わったら呼び出し、どのページも使わなくなった系列を削除します。"""
+        for request in self._page_requests.pop(index, []):
+            self._refs[request] -= 1
+            if self._refs[request] == 0:
+                self._unlink(request)
+
+    def _unlink(self, request: FetchRequest) -> None:
+        block = self._blocks.pop(request)
+        self.handles.pop(request, None)
+        self._refs.pop(request, None)
+        # 名前を削除してもワーカーが開いているブロックは閉じるまで有効
+        block.unlink()
+        try:
+            block.close()
+        except BufferError:
+            logger.debug("shared series %s is still referenced in this process", block.name)
+
+    def close(self) -> None:
+        """残っている全ブロックを削除します。"""
+        for request in list(self._blocks):
+            self._unlink(request)
+        self._page_requests.clear()
+
+    def __enter__(self) -> "SeriesCoordinator":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,15 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class CalcDefinition(BaseModel):
+    """計算で求める派生系列の定義 (calc シートの1行)"""
+
+    id: str = Field(description="派生系列のID (DataCondition.id として参照する)")
+    expression: str = Field(description="計算式 (例: (data1 + data2) / 2, rolling_mean(data1, 24))")
+    data_source: Optional[str] = Field(
+        default=None,
+        description="式中の系列の取得先/DataConditionで指定されている場合はそちらを優先",
+    )
+    unit: Optional[str] = Field(default=None, description="単位")
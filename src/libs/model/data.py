@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import List, Tuple
+from typing import Literal
 
-from pydantic import BaseModel, Field, ValidationError, model_validator
+from pydantic import BaseModel, Field, model_validator
 
 
 class DataCondition(BaseModel):
@@ -12,17 +12,18 @@ class DataCondition(BaseModel):
     unit: str = Field(description="号機")
     start_date: datetime = Field(description="開始日時")
     end_date: datetime = Field(description="終了日時")
-    interval: str = Field(description="間隔")
+    interval: str = Field(description="間隔 (raw / 1min / 15min / hourly / daily / monthly)")
+    aggregation: Literal["mean", "min", "max", "last"] = Field(
+        default="mean", description="間隔ごとの集計方法"
+    )
     data_source: str = Field(description="データ取得先")
     graph_color: str = Field(
         description="グラフの色/GraphConditionで指定されている場合はそちらを優先"
     )
 
-    @model_validator(mode="before")
-    @classmethod
-    def check_date_order(cls, values):
-        start_date = values.get("start_date")
-        end_date = values.get("end_date")
-        if start_date and end_date and start_date >= end_date:
-            raise ValidationError("開始日時は終了日時よりも前でなければなりません")
-        return values
+    @model_validator(mode="after")
+    def check_date_order(self):
+        # 変換後の datetime どうしを比較する (ValueError は pydantic が ValidationError にする)
+        if self.start_date >= self.end_date:
+            raise ValueError("開始日時は終了日時よりも前でなければなりません")
+        return self
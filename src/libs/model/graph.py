@@ -1,8 +1,39 @@
-from typing import List, Tuple
+from typing import List, Literal, Optional, Tuple
 
 from pydantic import BaseModel, Field
 
 
+class Downsample(BaseModel):
+    """データを描画前に間引く設定を保持するデータ構造"""
+
+    method: Literal["lttb", "minmax"] = Field(
+        default="minmax", description="間引き方法 (lttb / minmax: 最小・最大値の包絡線)"
+    )
+    points_per_pixel: float = Field(default=2, description="横方向1pxあたりの点数", ge=2, le=4)
+    screen_width: int = Field(default=1920, description="表示先の画面幅 (px)", gt=0)
+
+    def target_points(self, columns: int = 1) -> int:
+        """グリッドの列数から図1枚あたりの目標点数を計算します。"""
+        return int(self.screen_width / max(columns, 1) * self.points_per_pixel)
+
+
+class GlyphOptions(BaseModel):
+    """系列の描画方法 (グリフの統合・WebGL への切り替え) の設定を保持するデータ構造"""
+
+    consolidate: bool = Field(
+        default=False,
+        description="図内の系列を1つの multi_line グリフ・1つのソースにまとめてモデル数を減らす",
+    )
+    webgl_points: Optional[int] = Field(
+        default=100_000,
+        description="図の合計点数がこれを超えたら WebGL で描画する/None の場合は切り替えない",
+        gt=0,
+    )
+
+    def use_webgl(self, points: int) -> bool:
+        return self.webgl_points is not None and points > self.webgl_points
+
+
 class YAxis(BaseModel):
     """Y軸の設定を保持するデータ構造"""
 
@@ -29,3 +60,9 @@ class GraphCondition(BaseModel):
     tabname: str = Field(description="タブの名前")
     x_axis: XAxis = Field(description="X軸")
     y_axes: List[YAxis] = Field(description="Y軸のリスト")
+    downsample: Optional[Downsample] = Field(
+        default=None, description="間引き設定/未指定の場合はTabの設定を使用"
+    )
+    glyphs: Optional[GlyphOptions] = Field(
+        default=None, description="描画方法の設定/未指定の場合はTabの設定を使用"
+    )
@@ -1,10 +1,10 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
 from .data import DataCondition
-from .graph import GraphCondition
+from .graph import Downsample, GlyphOptions, GraphCondition
 
 
 class GraphLayout(BaseModel):
@@ -23,6 +23,8 @@ class Tab(BaseModel):
     layout: GraphLayout
     data_conditions: List[DataCondition]
     graph_conditions: List[GraphCondition]
+    downsample: Optional[Downsample] = Field(default=None, description="タブ全体の間引き設定")
+    glyphs: Optional[GlyphOptions] = Field(default=None, description="タブ全体の描画方法の設定")
 
 
 class Page(BaseModel):
@@ -0,0 +1,3 @@
+from .tracer import Tracer, configure_from_env, finish, span, tracer
+
+__all__ = ["Tracer", "configure_from_env", "finish", "span", "tracer"]
@@ -0,0 +1,182 @@
+"""レンダリング処理の段階ごとの計測
+
+設定の読み込み・モデルの構築・データ取得・図の作成・レイアウトの組み立て・シリアライズの
+各段階を span で囲み、所要時間と行数・モデル数などの付加情報 (とメモリのピーク) を記録します。
+計測結果は Chrome のトレースイベント形式 (chrome://tracing / Perfetto で表示できる) と、
+段階ごとの集計表として出力します。
+
+計測は --profile オプションか環境変数 GRAPH_PROFILE (出力先のパス) で有効になり、
+無効の場合の span は何もしません。
+
+入れ子の span の親子関係はコンテキスト (contextvars) ごとに管理するため、同じスレッドで
+並行に動く asyncio のタスク (系列の同時取得など) の span は、それぞれタスクを作成した時点の
+span の子になります。メモリのピークはプロセス全体の値のため、並行に動くタスクの span では
+他のタスクの分を含みます。
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PROFILE_ENV = "GRAPH_PROFILE"
+PROFILE_MEMORY_ENV = "GRAPH_PROFILE_MEMORY"
+
+
+class Tracer:
+    """span ごとの計測結果を Chrome のトレースイベントとして保持する"""
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.output: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        # 実行中の span (外側から順) の記録。タスクごとに分かれるようコンテキストで保持する
+        self._stack: ContextVar[Tuple[Dict[str, int], ...]] = ContextVar("span_stack", default=())
+        self._lock = threading.Lock()
+
+    def enable(self, output: Optional[str] = None, memory: bool = False) -> None:
+        """計測を有効にします。memory=True ではメモリのピークも記録します (処理は遅くなる)。"""
+        self.enabled = True
+        self.output = output
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self) -> None:
+        self.enabled = False
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memory = False
+
+    @contextmanager
+    def span(self, name: str, category: str = "stage", **args: Any) -> Iterator[Dict[str, Any]]:
+        """with ブロックの所要時間を記録します。
+
+        返す辞書に行数などを書き込むと、トレースイベントの args として記録されます。
+        """
+        if not self.enabled:
+            yield args
+            return
+
+        stack = self._stack.get()
+        parent = stack[-1] if stack else None
+        if self.memory:
+            # 入れ子の span でもそれぞれのピークが分かるよう、親のピークを退避してからリセットする
+            if parent is not None:
+                parent["peak"] = max(parent["peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        entry = {"peak": 0}
+        token = self._stack.set(stack + (entry,))
+        started = time.perf_counter_ns()
+        try:
+            yield args
+        finally:
+            duration = time.perf_counter_ns() - started
+            self._stack.reset(token)
+            if self.memory:
+                peak = max(entry["peak"], tracemalloc.get_traced_memory()[1])
+                if parent is not None:
+                    parent["peak"] = max(parent["peak"], peak)
+                args["peak_mb"] = round(peak / 2**20, 3)
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (started - _EPOCH_NS) / 1000 + _EPOCH_US,
+                "dur": duration / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def extend(self, events: Iterable[Dict[str, Any]]) -> None:
+        """他のプロセス (バッチのワーカー) で記録したイベントを取り込みます。"""
+        with self._lock:
+            self.events.extend(events)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """記録済みのイベントを取り出して消去します。"""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Chrome のトレースイベント形式 (JSON) で書き出します。"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"traceEvents": self.events, "displayTimeUnit": "ms"},
+                f,
+                ensure_ascii=False,
+                default=str,
+            )
+
+    def summary(self, top: int = 10) -> str:
+        """段階ごとの集計表と、時間のかかった span の一覧を返します。"""
+        groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        for event in self.events:
+            groups[(event["cat"], event["name"])].append(event)
+
+        lines = [
+            f"{'category':<10}  {'stage':<22}  {'count':>6}  {'total ms':>10}  "
+            f"{'max ms':>9}  {'rows':>12}  {'peak MB':>8}"
+        ]
+        for (category, name), events in sorted(
+            groups.items(), key=lambda item: -sum(event["dur"] for event in item[1])
+        ):
+            rows = sum(event["args"].get("rows", 0) for event in events)
+            peaks = [event["args"]["peak_mb"] for event in events if "peak_mb" in event["args"]]
+            lines.append(
+                f"{category:<10}  {name:<22}  {len(events):>6}  "
+                f"{sum(event['dur'] for event in events) / 1000:>10.1f}  "
+                f"{max(event['dur'] for event in events) / 1000:>9.1f}  {rows:>12,}  "
+                f"{max(peaks) if peaks else '-':>8}"
+            )
+
+        slowest = sorted(
+            (event for event in self.events if event["cat"] in ("tab", "page", "series")),
+            key=lambda event: -event["dur"],
+        )[:top]
+        if slowest:
+            lines.append("")
+            lines.append(f"slowest {len(slowest)} tabs / pages / series:")
+            for event in slowest:
+                label = ", ".join(
+                    f"{key}={value}" for key, value in event["args"].items() if key != "peak_mb"
+                )
+                lines.append(f"  {event['dur'] / 1000:>9.1f} ms  {event['name']}  {label}")
+        return "\n".join(lines)
+
+
+# perf_counter の値をトレース上の時刻 (µs) に変換するための基準
+_EPOCH_NS = time.perf_counter_ns()
+_EPOCH_US = time.time() * 1e6
+
+tracer = Tracer()
+span = tracer.span
+
+
+def configure_from_env() -> bool:
+    """環境変数 GRAPH_PROFILE (出力先のパス) が設定されていれば計測を有効にします。"""
+    output = os.environ.get(PROFILE_ENV)
+    if not output:
+        return False
+    tracer.enable(output, memory=os.environ.get(PROFILE_MEMORY_ENV, "") not in ("", "0"))
+    return True
+
+
+def finish(print_summary: bool = True) -> None:
+    """計測が有効な場合、トレースを書き出して集計表を表示します。"""
+    if not tracer.enabled:
+        return
+    if tracer.output:
+        tracer.export_chrome_trace(tracer.output)
+    if print_summary:
+        print(tracer.summary())
@@ -0,0 +1,194 @@
+"""描画結果のコンテンツアドレス型キャッシュ
+
+キャッシュのキーは Tab / Page のモデルのハッシュ値と、DataCondition ごとのデータの
+更新状況 (SeriesSource.watermark) を合わせたハッシュ値です。設定もデータも変わって
+いなければ同じキーになるため、描画をせずに保存済みの json_item / HTML を返せます。
+"""
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from pydantic import BaseModel
+
+from ..fetch.planner import FetchRequest
+from ..model.data import DataCondition
+from ..model.page import Page, Tab
+from ..source.base import SeriesSource, resolve_source
+
+# キャッシュの形式・描画処理 (グリフのまとめ方・WebGL への切り替え・図の骨組みなど、
+# 同じ設定とデータから作る出力が変わるもの) を変更したら上げる
+CACHE_VERSION = 2
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# 他のプロセスが保存した分も数えるため、この回数の保存ごとにフォルダ全体を調べ直す
+RESCAN_INTERVAL = 100
+
+# data_source 名 → 取得先 (登録されていない場合は None)
+Resolver = Callable[[str], Optional[SeriesSource]]
+
+
+def model_digest(model: BaseModel) -> str:
+    """モデルの内容から決まるハッシュ値 (フィールドの順序は定義順で固定)。"""
+    return hashlib.sha256(model.model_dump_json().encode("utf-8")).hexdigest()
+
+
+def data_fingerprint(
+    condition: DataCondition,
+    resolve: Resolver = resolve_source,
+) -> Optional[str]:
+    """DataCondition のデータの指紋 (取得先・ID・期間・間隔・更新状況)。
+
+    取得先が登録されていない場合や更新状況が分からない場合は None を返します。
+    """
+    source = resolve(condition.data_source)
+    if source is None:
+        return None
+    request = FetchRequest(
+        data_source=condition.data_source,
+        id=condition.id,
+        interval=condition.interval,
+        aggregation=condition.aggregation,
+        start_date=condition.start_date,
+        end_date=condition.end_date,
+    )
+    mark = source.watermark(request)
+    if mark is None:
+        return None
+    return request.model_dump_json() + "@" + mark
+
+
+@lru_cache(maxsize=None)
+def bokeh_version() -> str:
+    """bokeh の版 (キャッシュの確認だけで bokeh を import しないようパッケージ情報から調べる)。"""
+    return metadata.version("bokeh")
+
+
+def render_key(
+    kind: str,
+    models: Iterable[BaseModel],
+    conditions: Iterable[DataCondition],
+    resolve: Resolver = resolve_source,
+) -> Optional[str]:
+    """描画結果のキャッシュのキー。キャッシュできない場合は None を返します。"""
+    parts = [f"v{CACHE_VERSION}", f"bokeh={bokeh_version()}", kind]
+    parts += [model_digest(model) for model in models]
+    for condition in conditions:
+        fingerprint = data_fingerprint(condition, resolve)
+        if fingerprint is None:
+            return None
+        parts.append(fingerprint)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def tab_key(tab: Tab, resolve: Resolver = resolve_source) -> Optional[str]:
+    """タブの json_item のキャッシュのキー"""
+    return render_key("tab", [tab], tab.data_conditions, resolve)
+
+
+def page_key(page: Page, fmt: str, resolve: Resolver = resolve_source) -> Optional[str]:
+    """ページの出力ファイル (html / json) のキャッシュのキー"""
+    conditions = [condition for tab in page.tabs for condition in tab.data_conditions]
+    return render_key(f"page.{fmt}", [page], conditions, resolve)
+
+
+class RenderCache:
+    """描画結果をディスクに保存し、合計サイズが上限を超えたら古いものから消すキャッシュ
+
+    最後に使った日時はファイルの更新日時で管理するため、複数のプロセスから
+    同じフォルダを共有できます。合計サイズは保存のたびにフォルダ全体を調べず、
+    このプロセスで保存した分を足して見積もります (RESCAN_INTERVAL 回ごとに調べ直す)。
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # 見積もった合計サイズ (None はまだ調べていない) と、調べてからの保存回数
+        self._total: Optional[int] = None
+        self._puts = 0
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: Optional[str]) -> Optional[bytes]:
+        """キーに対応する保存済みの内容を返します (無い場合は None)。"""
+        if key is None:
+            return None
+        path = self.path_for(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # 最後に使った日時を更新する (LRU)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, key: Optional[str], data: bytes) -> None:
+        """内容を保存し、上限を超えた分を古い順に削除します。"""
+        if key is None:
+            return
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        if self._total is None or self._puts >= RESCAN_INTERVAL:
+            self.evict()
+            return
+        self._total += len(data) - replaced
+        self._puts += 1
+        if self._total > self.max_bytes:
+            self.evict()
+
+    def get_json(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        data = self.get(key)
+        return None if data is None else json.loads(data)
+
+    def put_json(self, key: Optional[str], item: Dict[str, Any]) -> None:
+        self.put(key, json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def evict(self) -> int:
+        """合計サイズが上限以下になるまで、最後に使った日時が古いものから削除します。"""
+        files = []
+        for path in self.directory.glob("*/*"):
+            if path.name.endswith(".tmp"):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._total = total
+        self._puts = 0
+        return removed
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*/*"):
+            path.unlink(missing_ok=True)
+        self._total = 0
+        self._puts = 0
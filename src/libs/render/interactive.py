@@ -0,0 +1,199 @@
+import zlib
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from bokeh.application import Application
+from bokeh.application.handlers.function import FunctionHandler
+from bokeh.document import Document
+from bokeh.events import RangesUpdate
+from bokeh.layouts import column, gridplot
+from bokeh.models import ColumnDataSource, Panel, Tabs
+from bokeh.plotting import figure
+from bokeh.server.server import Server
+
+from ..fetch.planner import FetchRequest, Series, plan_fetches
+from ..model.page import Page, Tab
+from ..series.pyramid import ResolutionPyramid
+
+DEFAULT_MAX_POINTS = 2000
+
+
+class PyramidStore:
+    """取得要求ごとに系列を1度だけ取得し、DataCondition の期間ごとに解像度ピラミッドを保持する入れ物
+
+    取得要求は期間の重なる DataCondition をまとめたものなので、ピラミッドは DataCondition の
+    期間に切り出した系列から作成します (他の DataCondition の期間のデータを表示しない)。
+    """
+
+    def __init__(self, pages: List[Page], fetch: Callable[[FetchRequest], Series]):
+        self.plan = plan_fetches(pages)
+        self.fetch = fetch
+        self._series: Dict[FetchRequest, Series] = {}
+        self._pyramids: Dict[Tuple[FetchRequest, datetime, datetime], ResolutionPyramid] = {}
+
+    def pyramid_for(self, condition) -> ResolutionPyramid:
+        request = self.plan.request_for(condition)
+        key = (request, condition.start_date, condition.end_date)
+        pyramid = self._pyramids.get(key)
+        if pyramid is None:
+            series = self._series.get(request)
+            if series is None:
+                series = self._series[request] = self.fetch(request)
+            x, y = series
+            start = np.searchsorted(x, np.datetime64(condition.start_date, "ms"), side="left")
+            stop = np.searchsorted(x, np.datetime64(condition.end_date, "ms"), side="right")
+            pyramid = ResolutionPyramid(x[start:stop], y[start:stop])
+            self._pyramids[key] = pyramid
+        return pyramid
+
+
+def _update_sources(sources, start, end, max_points: int) -> None:
+    """表示期間に合う段のデータだけをソースに送り直します。"""
+    for source, pyramid in sources:
+        level, data = pyramid.query(start, end, max_points)
+        source.data = data
+        source.tags = [level]
+
+
+def _on_ranges_update(sources, max_points: int, event: RangesUpdate) -> None:
+    if event.x0 is None or event.x1 is None:
+        return
+    start = np.datetime64(int(event.x0), "ms")
+    end = np.datetime64(int(event.x1), "ms")
+    _update_sources(sources, start, end, max_points)
+
+
+def create_interactive_graph(tab: Tab, store: PyramidStore):
+    """ズーム操作に合わせて解像度を切り替えるタブのグラフを作成します。"""
+    tab_plots = []
+
+    for graph_condition in tab.graph_conditions:
+        downsample = graph_condition.downsample or tab.downsample
+        max_points = (
+            downsample.target_points(tab.layout.columns) if downsample else DEFAULT_MAX_POINTS
+        )
+
+        p = figure(
+            title=tab.tabtitle,
+            x_axis_label=graph_condition.x_axis.label,
+            y_axis_label=" / ".join([y_axis.label for y_axis in graph_condition.y_axes]),
+            x_axis_type="datetime",
+        )
+
+        sources = []
+        for data_condition in tab.data_conditions:
+            pyramid = store.pyramid_for(data_condition)
+            source = ColumnDataSource()
+            sources.append((source, pyramid))
+            legend_label = f"{data_condition.id} ({data_condition.unit})"
+
+            # 集計段では最小・最大の帯を描いてピークを残す
+            p.varea(
+                x="x",
+                y1="y_min",
+                y2="y_max",
+                source=source,
+                legend_label=legend_label,
+                color=data_condition.graph_color,
+                fill_alpha=0.2,
+            )
+            p.line(
+                x="x",
+                y="y",
+                source=source,
+                legend_label=legend_label,
+                color=data_condition.graph_color,
+                line_width=2,
+            )
+
+        if tab.data_conditions:
+            # 初期表示は各 DataCondition の期間全体 (まとめた取得要求の期間ではない)
+            start = min(condition.start_date for condition in tab.data_conditions)
+            end = max(condition.end_date for condition in tab.data_conditions)
+            _update_sources(sources, start, end, max_points)
+            p.legend.title = "Data Conditions"
+            p.legend.click_policy = "hide"
+        p.on_event(RangesUpdate, partial(_on_ranges_update, sources, max_points))
+
+        p.grid.grid_line_alpha = 0.3
+
+        tab_plots.append(p)
+
+    return gridplot(tab_plots, ncols=tab.layout.columns, sizing_mode="stretch_both")
+
+
+def make_document(pages: List[Page], fetch: Callable[[FetchRequest], Series]):
+    """Bokeh サーバのセッションごとにドキュメントを作成する関数を返します。"""
+    store = PyramidStore(pages, fetch)
+
+    def modify_doc(doc: Document) -> None:
+        all_tabs = []
+        for page in pages:
+            page_tabs = [
+                Panel(child=column(create_interactive_graph(tab, store)), title=tab.tabname)
+                for tab in page.tabs
+            ]
+            all_tabs.append(Panel(child=Tabs(tabs=page_tabs), title=page.page_title))
+        doc.add_root(Tabs(tabs=all_tabs))
+
+    return modify_doc
+
+
+def serve(
+    pages: List[Page],
+    fetch: Callable[[FetchRequest], Series],
+    port: int = 5006,
+    show: bool = True,
+) -> None:
+    """ローカルの Bokeh サーバでズーム連動の再取得モードを起動します。"""
+    app = Application(FunctionHandler(make_document(pages, fetch)))
+    server = Server({"/": app}, port=port)
+    server.start()
+    if show:
+        server.io_loop.add_callback(server.show, "/")
+    server.io_loop.start()
+
+
+def synthetic_fetch(request: FetchRequest) -> Series:
+    """動作確認用に1秒間隔のランダムウォークを生成します。"""
+    x = np.arange(request.start_date, request.end_date, np.timedelta64(1, "s"))
+    # hash() はプロセスごとに変わるため、実行のたびに同じ系列になるよう crc32 を使う
+    rng = np.random.default_rng(zlib.crc32(request.id.encode("utf-8")))
+    y = np.cumsum(rng.normal(0, 0.1, len(x))) + 50
+    return x.astype("datetime64[ms]"), y
+
+
+if __name__ == "__main__":
+    from ..model.data import DataCondition
+    from ..model.graph import GraphCondition, XAxis, YAxis
+    from ..model.page import GraphLayout
+
+    conditions = [
+        DataCondition(
+            id=f"data{i}",
+            tabname="Tab 1",
+            unit="Unit A",
+            start_date=datetime(2023, 1, 1),
+            end_date=datetime(2023, 1, 15),
+            interval="1s",
+            data_source="synthetic",
+            graph_color=color,
+        )
+        for i, color in enumerate(["blue", "green"])
+    ]
+    graph = GraphCondition(
+        id="graph1",
+        tabname="Tab 1",
+        x_axis=XAxis(param="date", unit="datetime", range=(0, 10), label="Date"),
+        y_axes=[YAxis(param="value", unit="units", range=(0, 100), color="blue", label="Value")],
+    )
+    tab = Tab(
+        tabname="Tab 1",
+        tabtitle="Zoom test",
+        layout=GraphLayout(tabname="Tab 1", columns=1, rows=1),
+        data_conditions=conditions,
+        graph_conditions=[graph],
+    )
+    serve([Page(page_title="Interactive", tabs=[tab])], synthetic_fetch)
@@ -0,0 +1,186 @@
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from pydantic import BaseModel, Field
+
+from ..fetch.concurrent import execute_plan_concurrent
+from ..fetch.planner import FetchRequest, Series, SharedSources, plan_conditions
+from ..model.page import Page, Tab
+from ..profiling import span
+from ..source.base import DataSourceError, resolve_source, run_in_thread
+from .cache import RenderCache, tab_key
+
+if TYPE_CHECKING:
+    from bokeh.model import Model
+
+TabKey = Tuple[int, str]
+
+
+class TabEntry(BaseModel):
+    """タブ一覧の1件 (描画せずに返せる軽量な情報)"""
+
+    page: int = Field(description="ページ番号")
+    page_title: str = Field(description="ページのタイトル")
+    output_file_name: str = Field(description="出力ファイル名")
+    tabname: str = Field(description="タブの名前")
+    tabtitle: str = Field(description="タブページに表示するタイトル")
+    graphs: int = Field(description="グラフ数")
+    series: int = Field(description="系列数")
+
+
+class LazyReport:
+    """タブ一覧だけを先に返し、タブは要求された時に描画・シリアライズするレポート
+
+    描画済みタブの json_item はメモ化し、取得済みの系列はタブ間で共有します。
+    メモ化した結果は取得先の更新状況 (watermark) と合わせて保持し、データが更新されたら
+    取得・描画し直します (更新状況が分からない取得先は clear() するまで保持する)。
+    cache を指定した場合は json_item をディスクにも保存し、設定とデータが変わっていない
+    タブはプロセスを起動し直しても描画せずに返します。
+
+    系列は data_source ごとの取得方法 (FetchPolicy) に従って同時に取得します。afetch を
+    省略した場合は fetch をスレッドで実行します。取得に失敗した系列は空の系列として描画し、
+    そのタブは再び要求されたときに取得し直すため、メモ化・キャッシュしません。
+    """
+
+    def __init__(
+        self,
+        pages: List[Page],
+        build_tab: Callable[[Tab, SharedSources], "Model"],
+        fetch: Callable[[FetchRequest], Series],
+        cache: Optional[RenderCache] = None,
+        afetch: Optional[Callable[[FetchRequest], Awaitable[Series]]] = None,
+    ):
+        self.pages = pages
+        self.build_tab = build_tab
+        self.fetch = fetch
+        self.afetch = afetch
+        self.cache = cache
+        # 取得要求 → (更新状況, 系列)
+        self._series: Dict[FetchRequest, Tuple[Optional[str], Series]] = {}
+        # (ページ番号, タブ名) → (タブのキャッシュのキー, json_item)
+        self._rendered: Dict[TabKey, Tuple[Optional[str], Dict[str, Any]]] = {}
+
+    async def _cached_afetch(self, request: FetchRequest) -> Series:
+        mark = await run_in_thread(_watermark, request)
+        cached = self._series.get(request)
+        if cached is not None and cached[0] == mark:
+            return cached[1]
+        if self.afetch is not None:
+            series = await self.afetch(request)
+        else:
+            series = await run_in_thread(self.fetch, request)
+        self._series[request] = (mark, series)
+        return series
+
+    @property
+    def cached_series(self) -> int:
+        return len(self._series)
+
+    @property
+    def rendered_tabs(self) -> int:
+        return len(self._rendered)
+
+    def index(self) -> List[TabEntry]:
+        """全ページのタブ一覧を返します (データ取得・描画は行わない)。"""
+        return [
+            TabEntry(
+                page=i,
+                page_title=page.page_title,
+                output_file_name=page.output_file_name,
+                tabname=tab.tabname,
+                tabtitle=tab.tabtitle,
+                graphs=len(tab.graph_conditions),
+                series=len(tab.data_conditions),
+            )
+            for i, page in enumerate(self.pages)
+            for tab in page.tabs
+        ]
+
+    def page_index(self, page: Union[int, str]) -> int:
+        """ページ番号・タイトル・出力ファイル名からページ番号を返します。"""
+        if isinstance(page, int):
+            if not 0 <= page < len(self.pages):
+                raise KeyError(f"ページ番号が範囲外です: {page}")
+            return page
+        for i, candidate in enumerate(self.pages):
+            if page in (candidate.page_title, candidate.output_file_name):
+                return i
+        raise KeyError(f"ページが見つかりません: {page}")
+
+    def tab(self, page: Union[int, str], tabname: str) -> Tab:
+        for tab in self.pages[self.page_index(page)].tabs:
+            if tab.tabname == tabname:
+                return tab
+        raise KeyError(f"タブが見つかりません: {tabname}")
+
+    def sources_for(self, tabs: List[Tab]) -> SharedSources:
+        """タブで使う系列だけを取得します (取得済みの系列は再取得しない)。
+
+        失敗した系列は空の系列になり、SharedSources.failures に記録されます。
+        """
+        plan = plan_conditions(condition for tab in tabs for condition in tab.data_conditions)
+        return execute_plan_concurrent(plan, self._cached_afetch)
+
+    def render_tab(self, page: Union[int, str], tabname: str) -> "Model":
+        """1タブ分の Bokeh モデルを作成します。"""
+        tab = self.tab(page, tabname)
+        return self.build_tab(tab, self.sources_for([tab]))
+
+    def tab_json(self, page: Union[int, str], tabname: str) -> Dict[str, Any]:
+        """1タブ分の json_item を返します (データが変わるまではメモ化した結果を返す)。"""
+        key = (self.page_index(page), tabname)
+        tab = self.tab(*key)
+        try:
+            cache_key = tab_key(tab)
+        except DataSourceError:
+            # 更新状況を調べられない取得先がある (取得の失敗として空の系列で描画する)
+            cache_key, reusable = None, False
+        else:
+            reusable = True
+            memo = self._rendered.get(key)
+            if memo is not None and memo[0] == cache_key:
+                return memo[1]
+
+        item = None
+        if self.cache is not None and cache_key is not None:
+            item = self.cache.get_json(cache_key)
+        if item is None:
+            from bokeh.embed import json_item
+
+            sources = self.sources_for([tab])
+            model = self.build_tab(tab, sources)
+            with span("tab.serialize", "tab", tab=tabname):
+                item = json_item(model)
+            if sources.failures or not reusable:
+                # 取得に失敗した系列を含む結果は残さない
+                self._rendered.pop(key, None)
+                return item
+            if self.cache is not None and cache_key is not None:
+                self.cache.put_json(cache_key, item)
+        self._rendered[key] = (cache_key, item)
+        return item
+
+    def clear(self) -> None:
+        """描画結果と取得済みの系列を破棄します。"""
+        self._series.clear()
+        self._rendered.clear()
+
+
+def _watermark(request: FetchRequest) -> Optional[str]:
+    """取得要求の更新状況 (分からない・調べられない場合は None)。"""
+    source = resolve_source(request.data_source)
+    if source is None:
+        return None
+    try:
+        return source.watermark(request)
+    except DataSourceError:
+        return None
@@ -0,0 +1,394 @@
+"""ライブ表示モード
+
+Bokeh サーバで Tab の図を表示し、一定間隔で各 DataCondition の取得先から最後に表示した
+時刻 (ウォーターマーク) より新しい行だけを取得して ColumnDataSource.stream で追加します。
+ウォーターマークより少し前 (lookback) から取得し直し、値が変わった行は patch で修正します。
+更新はタブ単位で、タブ内の全系列を data_source ごとの取得方法 (FetchPolicy) に従って同時に
+取得してから変更をまとめて送ります。タブは最初に表示されたときに取得・作成します。
+送るのは追加・修正した行だけのため、CPU と通信量は履歴の長さではなく新しいデータの量に
+比例します。
+
+    python -m src.libs.render.live
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+from bokeh.application import Application
+from bokeh.application.handlers.function import FunctionHandler
+from bokeh.document import Document
+from bokeh.layouts import column
+from bokeh.model import Model
+from bokeh.models import ColumnDataSource, Panel, Tabs
+from bokeh.server.server import Server
+from pydantic import BaseModel, Field
+
+from ..fetch.concurrent import execute_plan_async, execute_plan_concurrent
+from ..fetch.planner import FetchPlan, FetchRequest, Series, SharedSources, plan_conditions
+from ..model.data import DataCondition
+from ..model.page import Page, Tab
+from ..profiling import span
+from ..series.encoding import as_time_array, as_value_array
+from ..source.base import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+# 値の修正 (patch) の対象: CDS 上の行番号 → 新しい値
+Patches = List[Tuple[int, float]]
+
+
+class LiveOptions(BaseModel):
+    """ライブ表示の設定"""
+
+    poll_seconds: float = Field(default=5.0, gt=0, description="取得先を確認する間隔 (秒)")
+    history: Optional[timedelta] = Field(
+        default=timedelta(days=1),
+        description="表示開始時に読み込む期間/None の場合は DataCondition の開始日時から",
+    )
+    lookback: timedelta = Field(
+        default=timedelta(minutes=5),
+        description="修正された値を反映するため、ウォーターマークより前から取得し直す期間",
+    )
+    rollover: int = Field(default=50_000, ge=1, description="系列ごとに保持する行数の上限")
+
+    class Config:
+        frozen = True
+
+
+class LiveSeries:
+    """1つの ColumnDataSource に表示している系列
+
+    stream・patch は Python 側のデータにも反映されるため、CDS のデータを写しとして使い、
+    patch の行番号を求めます。
+    """
+
+    def __init__(self, condition: DataCondition, source: ColumnDataSource, rollover: int):
+        self.condition = condition
+        self.source = source
+        # ドキュメントに追加する前なので、上限を超えた分はそのまま捨ててよい
+        source.data = {
+            "x": as_time_array(source.data["x"])[-rollover:],
+            "y": as_value_array(source.data["y"])[-rollover:],
+        }
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.source.data["x"]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.source.data["y"]
+
+    @property
+    def watermark(self) -> Optional[np.datetime64]:
+        return self.x[-1] if len(self.x) else None
+
+    def request(self, now: datetime, lookback: timedelta) -> FetchRequest:
+        """ウォーターマークの lookback 前から now までの取得要求を返します。"""
+        if self.watermark is None:
+            start = self.condition.start_date
+        else:
+            start = self.watermark.astype(datetime) - lookback
+        return FetchRequest(
+            data_source=self.condition.data_source,
+            id=self.condition.id,
+            interval=self.condition.interval,
+            aggregation=self.condition.aggregation,
+            start_date=start,
+            end_date=max(now, start),
+        )
+
+    def diff(self, x: np.ndarray, y: np.ndarray) -> Tuple[Patches, Series]:
+        """取得した系列と表示中の内容を比べ、修正する行と追加する行を返します。
+
+        修正の行番号は追加・rollover の前の行番号です (patch を stream より先に適用する)。
+        """
+        x, y = as_time_array(x), as_value_array(y, self.y.dtype)
+        watermark = self.watermark
+        if watermark is None:
+            return [], (x, y)
+
+        new = x > watermark
+        old_x, old_y = x[~new], y[~new]
+        positions = np.searchsorted(self.x, old_x)
+        inside = positions < len(self.x)
+        positions, old_x, old_y = positions[inside], old_x[inside], old_y[inside]
+        matched = self.x[positions] == old_x
+        positions, old_y = positions[matched], old_y[matched]
+        current = self.y[positions]
+        changed = ~((current == old_y) | (np.isnan(current) & np.isnan(old_y)))
+        patches = list(zip(positions[changed].tolist(), old_y[changed].tolist()))
+        return patches, (x[new], y[new])
+
+
+class LiveTab:
+    """1タブ分の図と、定期的に更新する系列の一覧
+
+    afetch を省略した場合は fetch をスレッドで実行します。
+    """
+
+    def __init__(
+        self,
+        tab: Tab,
+        fetch: Callable[[FetchRequest], Series],
+        build_tab: Callable[[Tab, SharedSources], Model],
+        options: LiveOptions,
+        now: Optional[datetime] = None,
+        afetch: Optional[Callable[[FetchRequest], Awaitable[Series]]] = None,
+    ):
+        self.tab = tab
+        self.fetch = fetch
+        self.afetch = afetch
+        self.options = options
+        now = now or datetime.now()
+
+        # 表示開始時の期間を now までに置き換え、間引き・系列の統合は行わない
+        # (ストリームで追加する行はそのまま描画し、系列ごとのソースに追加する)
+        conditions = [
+            condition.model_copy(
+                update={"start_date": self._start(condition, now), "end_date": now}
+            )
+            for condition in tab.data_conditions
+        ]
+        live_tab = tab.model_copy(
+            update={
+                "data_conditions": conditions,
+                "downsample": None,
+                "glyphs": None,
+                "graph_conditions": [
+                    graph.model_copy(update={"downsample": None, "glyphs": None})
+                    for graph in tab.graph_conditions
+                ],
+            }
+        )
+        sources = execute_plan_concurrent(plan_conditions(conditions), self._afetch)
+        self.layout = build_tab(live_tab, sources)
+
+        # 同じソースを参照する DataCondition は1度だけ更新する
+        self.series: List[LiveSeries] = []
+        seen = set()
+        for condition in conditions:
+            source = sources.source_for(condition)
+            if source.id not in seen:
+                seen.add(source.id)
+                self.series.append(LiveSeries(condition, source, options.rollover))
+
+    def _start(self, condition: DataCondition, now: datetime) -> datetime:
+        if self.options.history is None:
+            return min(condition.start_date, now)
+        return now - self.options.history
+
+    async def _afetch(self, request: FetchRequest) -> Series:
+        if self.afetch is not None:
+            return await self.afetch(request)
+        return await run_in_thread(self.fetch, request)
+
+    async def poll(self, now: Optional[datetime] = None) -> List[Tuple[Patches, Series]]:
+        """全系列を同時に取得し、系列ごとの (修正する行, 追加する行) を返します。
+
+        取得に失敗した系列は変更なしとし、次の更新で取得し直します。
+        """
+        now = now or datetime.now()
+        requests = [series.request(now, self.options.lookback) for series in self.series]
+        unchanged = [([], (series.x[:0], series.y[:0])) for series in self.series]
+        try:
+            sources = await execute_plan_async(FetchPlan(requests), self._afetch, warn=False)
+        except Exception as e:
+            # partial が無効な取得先の失敗はタブ全体を変更なしとする
+            logger.warning("live update failed for %s: %r", self.tab.tabname, e)
+            return unchanged
+
+        updates: List[Tuple[Patches, Series]] = []
+        for series, request, empty in zip(self.series, requests, unchanged):
+            if request in sources.failures:
+                logger.warning(
+                    "live update failed for %s/%s: %s",
+                    request.data_source,
+                    request.id,
+                    sources.failures[request],
+                )
+                updates.append(empty)
+                continue
+            updates.append(series.diff(*sources.series_of(request)))
+        return updates
+
+    def apply(self, doc: Optional[Document], updates: List[Tuple[Patches, Series]]) -> int:
+        """全系列の更新を Document.hold の間にまとめて適用します。
+
+        送った行数 (追加 + 修正) を返します。
+        """
+        if doc is not None:
+            doc.hold("combine")
+        rows = 0
+        try:
+            for series, (patches, (new_x, new_y)) in zip(self.series, updates):
+                # patch の行番号は rollover 前の内容に対するものなので、stream より先に適用する
+                if patches:
+                    series.source.patch({"y": patches})
+                if len(new_x):
+                    series.source.stream({"x": new_x, "y": new_y}, rollover=self.options.rollover)
+                rows += len(patches) + len(new_x)
+        finally:
+            if doc is not None:
+                doc.unhold()
+        return rows
+
+    async def tick(self, doc: Optional[Document] = None) -> int:
+        with span("live.tick", "tab", tab=self.tab.tabname) as stats:
+            updates = await self.poll()
+            stats["rows"] = self.apply(doc, updates)
+        return stats["rows"]
+
+
+def make_live_document(
+    pages: List[Page],
+    fetch: Callable[[FetchRequest], Series],
+    build_tab: Callable[[Tab, SharedSources], Model],
+    options: LiveOptions = LiveOptions(),
+    afetch: Optional[Callable[[FetchRequest], Awaitable[Series]]] = None,
+):
+    """Bokeh サーバのセッションごとにライブ表示のドキュメントを作成する関数を返します。
+
+    タブは最初に表示されたときに取得・作成し、表示中のタブだけを更新します。
+    作成済みの他のタブは再び表示されたときの更新で、ウォーターマーク以降の差分を
+    まとめて取得します。
+    """
+
+    def modify_doc(doc: Document) -> None:
+        # 作成前のタブは None (表示されるまでは空の column を置いておく)
+        live_tabs: List[List[Optional[LiveTab]]] = [[None] * len(page.tabs) for page in pages]
+        page_tabs = [
+            Tabs(tabs=[Panel(child=column(), title=tab.tabname) for tab in page.tabs])
+            for page in pages
+        ]
+        root = Tabs(
+            tabs=[
+                Panel(child=inner, title=page.page_title) for page, inner in zip(pages, page_tabs)
+            ]
+        )
+
+        def active() -> Optional[Tuple[int, int]]:
+            if not pages or not pages[root.active].tabs:
+                return None
+            return root.active, page_tabs[root.active].active
+
+        def build_active() -> None:
+            position = active()
+            if position is None or live_tabs[position[0]][position[1]] is not None:
+                return
+            page, index = position
+            live = LiveTab(pages[page].tabs[index], fetch, build_tab, options, afetch=afetch)
+            live_tabs[page][index] = live
+            page_tabs[page].tabs[index].child.children = [live.layout]
+
+        def on_active(attr: str, old: int, new: int) -> None:
+            build_active()
+
+        build_active()
+        root.on_change("active", on_active)
+        for inner in page_tabs:
+            inner.on_change("active", on_active)
+        doc.add_root(root)
+
+        async def tick() -> None:
+            position = active()
+            live = None if position is None else live_tabs[position[0]][position[1]]
+            if live is not None:
+                await live.tick(doc)
+
+        doc.add_periodic_callback(tick, int(options.poll_seconds * 1000))
+
+    return modify_doc
+
+
+def serve_live(
+    pages: List[Page],
+    fetch: Callable[[FetchRequest], Series],
+    build_tab: Callable[[Tab, SharedSources], Model],
+    options: LiveOptions = LiveOptions(),
+    port: int = 5006,
+    show: bool = True,
+    afetch: Optional[Callable[[FetchRequest], Awaitable[Series]]] = None,
+) -> None:
+    """ローカルの Bokeh サーバでライブ表示モードを起動します。"""
+    app = Application(
+        FunctionHandler(make_live_document(pages, fetch, build_tab, options, afetch=afetch))
+    )
+    server = Server({"/": app}, port=port)
+    server.start()
+    if show:
+        server.io_loop.add_callback(server.show, "/")
+    server.io_loop.start()
+
+
+def clock_fetch(request: FetchRequest) -> Series:
+    """動作確認用に、現在時刻までの1秒間隔の系列を生成します (同じ時刻は同じ値)。"""
+    end = min(request.end_date, datetime.now())
+    x = np.arange(
+        np.datetime64(request.start_date, "s"),
+        np.datetime64(end, "s") + np.timedelta64(1, "s"),
+        np.timedelta64(1, "s"),
+    )
+    seconds = x.astype(np.int64)
+    noise = np.sin(seconds * 12.9898 + len(request.id) * 78.233) * 43758.5453 % 1
+    y = 50 + 10 * np.sin(seconds / 60) + noise
+    return x.astype("datetime64[ms]"), y
+
+
+if __name__ == "__main__":
+    from bokeh.layouts import gridplot
+    from bokeh.plotting import figure
+
+    from ..model.graph import GraphCondition, XAxis, YAxis
+    from ..model.page import GraphLayout
+
+    def build_tab(tab: Tab, sources: SharedSources):
+        plots = []
+        for graph in tab.graph_conditions:
+            p = figure(title=tab.tabtitle, x_axis_type="datetime")
+            for condition in tab.data_conditions:
+                p.line(
+                    x="x",
+                    y="y",
+                    source=sources.source_for(condition),
+                    legend_label=condition.id,
+                    color=condition.graph_color,
+                )
+            plots.append(p)
+        return gridplot(plots, ncols=tab.layout.columns, sizing_mode="stretch_both")
+
+    now = datetime.now()
+    conditions = [
+        DataCondition(
+            id=f"data{i}",
+            tabname="Tab 1",
+            unit="Unit A",
+            start_date=now - timedelta(hours=1),
+            end_date=now,
+            interval="1s",
+            data_source="clock",
+            graph_color=color,
+        )
+        for i, color in enumerate(["blue", "green"])
+    ]
+    graph = GraphCondition(
+        id="graph1",
+        tabname="Tab 1",
+        x_axis=XAxis(param="date", unit="datetime", range=(0, 10), label="Date"),
+        y_axes=[YAxis(param="value", unit="units", range=(0, 100), color="blue", label="Value")],
+    )
+    tab = Tab(
+        tabname="Tab 1",
+        tabtitle="Live test",
+        layout=GraphLayout(tabname="Tab 1", columns=1, rows=1),
+        data_conditions=conditions,
+        graph_conditions=[graph],
+    )
+    serve_live(
+        [Page(page_title="Live", tabs=[tab])],
+        clock_fetch,
+        build_tab,
+        LiveOptions(poll_seconds=1, history=timedelta(minutes=10)),
+    )
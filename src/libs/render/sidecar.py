@@ -0,0 +1,193 @@
+"""系列データを別ファイル (サイドカー) に書き出すエクスポート
+
+大きなレポートでは全系列を HTML に埋め込むと、開くのに時間がかかり、開かないタブの
+データまでブラウザのメモリに載ります。このモードでは最初に表示するタブ以外の
+ColumnDataSource の配列を、出力ファイルの隣のフォルダにソースごとのバイナリファイル
+(リトルエンディアンの Float64Array / Float32Array をそのまま並べたもの) として書き出し、
+ドキュメントには空の配列と読み込み用の CustomJS だけを残します。サイドカーはタブが
+選択されたときに fetch で読み込まれます。
+
+ブラウザは file:// からの fetch を許可しないため、サイドカー付きのレポートは
+HTTP で配信して開いてください (例: 出力フォルダで python -m http.server)。
+json_item を別のページ (Tauri のブリッジなど) に埋め込む場合は、相対 URL が埋め込み先の
+ページを基準に解決されるため、base_url に出力フォルダを配信する URL を指定してください。
+
+ドキュメントのソースは描画に使ったソース (SharedSources が複数の図・タブで共有する) を
+書き換えず、空の配列だけを持つ複製に差し替えます。
+"""
+
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+from bokeh.model import Model
+from bokeh.models import ColumnDataSource, CustomJS, Tabs
+
+# 配列の先頭位置を揃える単位 (Float64Array はオフセットが8の倍数である必要がある)
+ALIGNMENT = 8
+
+# タブが選択されたら、そのタブのソースをサイドカーから読み込む
+_LOADER_JS = """
+const TYPES = {float64: Float64Array, float32: Float32Array}
+for (const entry of entries[cb_obj.active] || []) {
+  const source = entry.source
+  if (source._sidecar_requested)
+    continue
+  source._sidecar_requested = true
+  fetch(entry.url)
+    .then((response) => {
+      if (!response.ok)
+        throw new Error(`${response.status} ${response.statusText}: ${entry.url}`)
+      return response.arrayBuffer()
+    })
+    .then((buffer) => {
+      const data = Object.assign({}, source.data)
+      for (const [name, column] of Object.entries(entry.columns)) {
+        const Type = TYPES[column.dtype]
+        const arrays = column.parts.map(([offset, length]) => new Type(buffer, offset, length))
+        data[name] = column.ragged ? arrays : arrays[0]
+      }
+      source.data = data
+    })
+    .catch((error) => {
+      source._sidecar_requested = false
+      console.error("failed to load series sidecar", error)
+    })
+}
+"""
+
+
+def _as_float_array(values: Any) -> Optional[np.ndarray]:
+    """サイドカーに書き出せる数値の配列に変換します (書き出せない場合は None)。
+
+    時刻は Bokeh と同じく UNIX 時刻 (ミリ秒) の float64 にします。
+    """
+    if not isinstance(values, np.ndarray):
+        return None
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[ms]").astype(np.int64).astype(np.float64)
+    if values.dtype in (np.float64, np.float32):
+        return values
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.float64)
+    return None
+
+
+def _column_parts(values: Any) -> Optional[List[np.ndarray]]:
+    """列を書き出す配列の一覧にします。multi_line の xs / ys は1行ごとの配列の一覧です。"""
+    if isinstance(values, np.ndarray):
+        array = _as_float_array(values)
+        return None if array is None else [array]
+    if isinstance(values, list) and values:
+        arrays = [_as_float_array(value) for value in values]
+        if all(array is not None for array in arrays):
+            return arrays
+    return None
+
+
+def _replace_references(layout: Model, old: Model, new: Model) -> None:
+    """layout 以下のモデルが参照する old を new に差し替えます (レンダラー・CDSView など)。"""
+    for model in layout.references():
+        for name in model.properties_with_refs():
+            value = getattr(model, name)
+            if value is old:
+                setattr(model, name, new)
+            elif isinstance(value, list) and any(item is old for item in value):
+                setattr(model, name, [new if item is old else item for item in value])
+            elif isinstance(value, dict) and any(item is old for item in value.values()):
+                # CustomJS の args など
+                setattr(model, name, {k: new if v is old else v for k, v in value.items()})
+
+
+class SidecarWriter:
+    """1ページ分のサイドカーをタブごとに書き出し、読み込み用の CustomJS を作成する"""
+
+    def __init__(self, directory: Path, url_prefix: str):
+        self.directory = Path(directory)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.bytes_written = 0
+        # タブの番号 → そのタブで読み込むソース
+        self._entries: List[List[Dict[str, Any]]] = []
+        # 元のソースの ID → 読み込み方法 (同じソースを参照する別のタブでは書き出さない)
+        self._written: Dict[str, Dict[str, Any]] = {}
+        self._inline: Set[str] = set()
+        # 前回の出力が残っていると不要なファイルが混ざるため作り直す
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @classmethod
+    def for_output(cls, path: str, base_url: Optional[str] = None) -> "SidecarWriter":
+        """出力ファイル (<name>.html) の隣の <name>_series フォルダに書き出します。
+
+        base_url は出力フォルダを配信する URL です (省略時は出力ファイルからの相対 URL)。
+        """
+        folder = Path(path).stem + "_series"
+        prefix = f"{base_url.rstrip('/')}/{folder}" if base_url else folder
+        return cls(Path(path).parent / folder, prefix)
+
+    def add_tab(self, layout: Model, inline: bool = False) -> None:
+        """1タブ分のソースをサイドカーに書き出します。
+
+        inline=True のタブ (最初に表示するタブ) のソースはドキュメントに埋め込んだままにします。
+        """
+        entries = []
+        for source in list(layout.select({"type": ColumnDataSource})):
+            if inline:
+                self._inline.add(source.id)
+                continue
+            if source.id in self._inline:
+                continue
+            entry = self._written.get(source.id)
+            if entry is None:
+                entry = self._write(source)
+            if entry is not None:
+                _replace_references(layout, source, entry["source"])
+                entries.append(entry)
+        self._entries.append(entries)
+
+    def _write(self, source: ColumnDataSource) -> Optional[Dict[str, Any]]:
+        columns = {}
+        for column, values in source.data.items():
+            parts = _column_parts(values)
+            if parts is not None:
+                columns[column] = parts
+        if not columns:
+            return None
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{len(self._written)}.bin"
+        layout: Dict[str, Any] = {}
+        offset = 0
+        with open(self.directory / name, "wb") as f:
+            for column, parts in columns.items():
+                dtype = parts[0].dtype if len({part.dtype for part in parts}) == 1 else np.float64
+                placements = []
+                for part in parts:
+                    data = np.ascontiguousarray(part, dtype=np.dtype(dtype).newbyteorder("<"))
+                    padding = -offset % ALIGNMENT
+                    f.write(b"\0" * padding)
+                    offset += padding
+                    f.write(data.tobytes())
+                    placements.append([offset, len(data)])
+                    offset += data.nbytes
+                layout[column] = {
+                    "dtype": np.dtype(dtype).name,
+                    "parts": placements,
+                    "ragged": not isinstance(source.data[column], np.ndarray),
+                }
+
+        # ドキュメントには空の配列だけを持つ複製を残す (列の長さは揃えたままにする)
+        data = dict(source.data)
+        for column, parts in columns.items():
+            empty = np.array([], dtype=layout[column]["dtype"])
+            data[column] = [empty] * len(parts) if layout[column]["ragged"] else empty
+        stub = ColumnDataSource(data=data)
+
+        self.bytes_written += offset
+        entry = {"source": stub, "url": f"{self.url_prefix}/{name}", "columns": layout}
+        self._written[source.id] = entry
+        return entry
+
+    def attach(self, tabs: Tabs) -> None:
+        """タブが選択されたときにサイドカーを読み込む CustomJS を Tabs に設定します。"""
+        tabs.js_on_change("active", CustomJS(args=dict(entries=self._entries), code=_LOADER_JS))
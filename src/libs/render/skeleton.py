@@ -0,0 +1,129 @@
+"""図の骨組み (軸・グリッド・ツール・スタイル) のテンプレート
+
+figure() は軸・グリッド・ツールバーなど数十個のモデルを作成し、ツールの重複確認なども
+行うため、小さな図が多いタブでは図の作成が描画時間の大きな割合を占めます。
+同じ設定の図は骨組みを1度だけ作成しておき、2回目以降は複製 (プロパティの値をそのまま
+写す) してからタイトル・軸ラベル・グリフなど図ごとの内容を追加します。
+
+複製は既定値から変更されたプロパティ (properties_with_values) だけを写します。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type, TypeVar
+
+from bokeh.model import Model
+
+M = TypeVar("M", bound=Model)
+
+# 保持するテンプレートの数の上限 (設定の種類がこれを超えたら古いものから捨てる)
+MAX_TEMPLATES = 256
+
+
+# モデルの ID → (クラス, 既定値から変更されたプロパティの値)
+Snapshot = Dict[str, Tuple[Type[Model], Dict[str, Any]]]
+
+
+def snapshot(model: Model) -> Snapshot:
+    """モデルと参照先のモデルの、複製に使うプロパティの値を調べます。"""
+    models: Snapshot = {}
+
+    def visit(value: Any) -> None:
+        if isinstance(value, Model):
+            if value.id in models:
+                return
+            values = {
+                name: item
+                for name, item in value.properties_with_values(include_defaults=False).items()
+                # 参照しただけの空のリスト・辞書の既定値はシリアライズされるため写さない
+                # (add_layout などで要素を追加した既定値だけを写す)
+                if not (isinstance(item, (list, dict)) and not item)
+            }
+            models[value.id] = (type(value), values)
+            visit(list(values.values()))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                visit(item)
+        elif isinstance(value, dict):
+            visit(list(value.values()))
+
+    visit(model)
+    return models
+
+
+def _copy_value(value: Any, models: Snapshot, memo: Dict[str, Model]) -> Any:
+    if isinstance(value, Model):
+        return _clone(value.id, models, memo)
+    if isinstance(value, list):
+        return [_copy_value(item, models, memo) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_copy_value(item, models, memo) for item in value)
+    if isinstance(value, dict):
+        return {key: _copy_value(item, models, memo) for key, item in value.items()}
+    return value
+
+
+def _clone(model_id: str, models: Snapshot, memo: Dict[str, Model]) -> Model:
+    clone = memo.get(model_id)
+    if clone is not None:
+        return clone
+    cls, values = models[model_id]
+    # サブクラスの初期化 (figure() の軸・ツールの作成など) は行わず、既定値のモデルを作成する
+    # (__new__ で新しい ID が振られる)
+    clone = cls.__new__(cls)
+    Model.__init__(clone)
+    # 参照先より先に memo に入れる (循環した参照も同じ複製を指す)
+    memo[model_id] = clone
+    # 公開の update で設定し、リストなどの入れ物を変更通知付きの値として作り直す
+    clone.update(**{name: _copy_value(value, models, memo) for name, value in values.items()})
+    return clone
+
+
+def clone_model(model: M, models: Optional[Snapshot] = None) -> M:
+    """モデルと参照先のモデルを複製します (複製どうしの参照関係は元と同じになる)。
+
+    同じモデルを何度も複製する場合は snapshot(model) を渡すと調べ直しません
+    (複製元をその後変更しないこと)。ドキュメントやコールバックは引き継ぎません。
+    """
+    return _clone(model.id, models if models is not None else snapshot(model), {})
+
+
+class FigureTemplates:
+    """設定ごとに図の骨組みを1度だけ作成し、複製を返す"""
+
+    def __init__(self, max_templates: int = MAX_TEMPLATES):
+        self.max_templates = max_templates
+        self.hits = 0
+        self.misses = 0
+        # キー → (骨組み, 骨組みのプロパティの値)
+        self._templates: "OrderedDict[Hashable, Tuple[Model, Snapshot]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def figure(self, key: Hashable, build: Callable[[], M]) -> M:
+        """key の骨組みの複製を返します。初回は build() で骨組みを作成します。
+
+        key には骨組みの内容を決める設定 (frozen の設定モデル・軸の種類など) を渡します。
+        骨組みはどのドキュメントにも追加しないため、build() ではグリフを追加しないでください。
+        """
+        with self._lock:
+            entry = self._templates.get(key)
+            if entry is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is None:
+            template = build()
+            entry = (template, snapshot(template))
+            with self._lock:
+                self._templates[key] = entry
+                while len(self._templates) > self.max_templates:
+                    self._templates.popitem(last=False)
+        return clone_model(*entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+
+templates = FigureTemplates()
@@ -0,0 +1,17 @@
+from .downsample import downsample, lttb_indices, minmax_indices
+from .encoding import as_time_array, as_value_array
+from .interval import interval_step, parse_interval, sql_interval
+from .pyramid import ResolutionPyramid, aggregate
+
+__all__ = [
+    "ResolutionPyramid",
+    "aggregate",
+    "as_time_array",
+    "as_value_array",
+    "downsample",
+    "interval_step",
+    "lttb_indices",
+    "minmax_indices",
+    "parse_interval",
+    "sql_interval",
+]
@@ -0,0 +1,80 @@
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def _as_float(x: np.ndarray) -> np.ndarray:
+    """面積計算用に x を float に変換します (datetime64 は整数表現を使う)。"""
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("int64").astype(np.float64)
+    return x.astype(np.float64)
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """等間隔のバケットごとに最小値・最大値の点を残すインデックスを返します。
+
+    各バケットのピークが必ず残るため、トレンド監視で突発値を見落としません。
+    """
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    n_buckets = max(n_out // 2, 1)
+    size = -(-n // n_buckets)  # 切り上げ
+    n_buckets = -(-n // size)
+
+    values = np.asarray(y, dtype=np.float64)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = values
+    buckets = padded.reshape(n_buckets, size)
+    nan = np.isnan(buckets)
+    offsets = np.arange(n_buckets) * size
+    lo = np.where(nan, np.inf, buckets).argmin(axis=1) + offsets
+    hi = np.where(nan, -np.inf, buckets).argmax(axis=1) + offsets
+
+    indices = np.unique(np.concatenate([lo, hi, [0, n - 1]]))
+    return indices[indices < n]
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets で残す点のインデックスを返します。
+
+    バケット間の依存があるためバケット単位でループしますが、
+    バケット内の三角形面積の計算は NumPy でまとめて行います (ループ回数は出力点数で決まる)。
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    xf = _as_float(np.asarray(x))
+    yf = np.asarray(y, dtype=np.float64)
+    # 最初と最後の点を除いた範囲を n_out - 2 個のバケットに分ける
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    means_x = np.add.reduceat(xf[1 : n - 1], edges[:-1] - 1) / np.diff(edges)
+    means_y = np.add.reduceat(np.nan_to_num(yf[1 : n - 1]), edges[:-1] - 1) / np.diff(edges)
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 1 < n_out - 2:
+            cx, cy = means_x[i + 1], means_y[i + 1]
+        else:
+            cx, cy = xf[n - 1], yf[n - 1]
+        bx, by = xf[start:stop], yf[start:stop]
+        area = np.abs((xf[a] - cx) * (by - yf[a]) - (xf[a] - bx) * (cy - yf[a]))
+        a = start + int(np.nanargmax(area)) if not np.isnan(area).all() else start
+        indices[i + 1] = a
+    return indices
+
+
+def downsample(x: np.ndarray, y: np.ndarray, n_out: int, method: str = "minmax"):
+    """系列を n_out 点程度に間引いた (x, y) を返します。"""
+    if method not in METHODS:
+        raise ValueError(f"不明な間引き方法です: {method}")
+    if len(y) <= n_out:
+        return x, y
+    if method == "lttb":
+        indices = lttb_indices(x, y, n_out)
+    else:
+        indices = minmax_indices(y, n_out)
+    return x[indices], y[indices]
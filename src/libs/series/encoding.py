@@ -0,0 +1,25 @@
+from typing import Sequence
+
+import numpy as np
+
+TIME_DTYPE = np.dtype("datetime64[ms]")
+
+
+def as_time_array(values: Sequence) -> np.ndarray:
+    """時刻の列を datetime64[ms] の配列に変換します (既にその型ならコピーしない)。"""
+    return np.asarray(values, dtype=TIME_DTYPE)
+
+
+def as_value_array(values: Sequence, dtype=None) -> np.ndarray:
+    """値の列を浮動小数点の配列に変換します。
+
+    dtype を省略した場合、float32 / float64 の配列はそのまま使い、それ以外は float64 にします。
+    Bokeh は数値型の NumPy 配列を base64 のバイナリとしてシリアライズするため、
+    Python のリストのまま渡すよりも出力が小さく、読み込み側のパースも速くなります。
+    """
+    if dtype is None:
+        array = np.asarray(values)
+        if array.dtype in (np.float32, np.float64):
+            return array
+        dtype = np.float64
+    return np.asarray(values, dtype=dtype)
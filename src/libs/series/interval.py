@@ -0,0 +1,59 @@
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# DataCondition.interval → (数, 単位)。None は集計しない (生データ)
+INTERVALS: Dict[str, Optional[Tuple[int, str]]] = {
+    "raw": None,
+    "1s": (1, "s"),
+    "1min": (1, "m"),
+    "15min": (15, "m"),
+    "hourly": (1, "h"),
+    "daily": (1, "D"),
+    "monthly": (1, "M"),
+}
+
+# DuckDB の INTERVAL リテラルで使う単位
+_SQL_UNITS = {"s": "second", "m": "minute", "h": "hour", "D": "day", "M": "month"}
+
+AGGREGATIONS = ("mean", "min", "max", "last")
+
+
+def parse_interval(interval: str) -> Optional[Tuple[int, str]]:
+    """間隔の名前を (数, 単位) に変換します。未知の名前は ValueError。"""
+    try:
+        return INTERVALS[interval]
+    except KeyError:
+        raise ValueError(f"不明な間隔です: {interval} (使用可能: {', '.join(INTERVALS)})") from None
+
+
+def interval_step(interval: str) -> Optional[np.timedelta64]:
+    """間隔を NumPy の timedelta64 に変換します (生データは None)。"""
+    parsed = parse_interval(interval)
+    return None if parsed is None else np.timedelta64(*parsed)
+
+
+def sql_interval(interval: str) -> Optional[str]:
+    """間隔を DuckDB の INTERVAL リテラルに変換します (生データは None)。"""
+    parsed = parse_interval(interval)
+    if parsed is None:
+        return None
+    count, unit = parsed
+    return f"INTERVAL '{count} {_SQL_UNITS[unit]}'"
+
+
+def bucket_start(time: np.datetime64, interval: str) -> np.datetime64:
+    """時刻を含む区間 (集計の単位) の開始時刻を返します (生データは時刻をそのまま返す)。
+
+    区間は UNIX 時刻 0 (月は 1970-01) を起点に区切ります (DuckDB の time_bucket と同じ境界)。
+    """
+    parsed = parse_interval(interval)
+    time = np.datetime64(time, "ms")
+    if parsed is None:
+        return time
+    count, unit = parsed
+    if unit == "M":
+        months = int(time.astype("datetime64[M]").astype(np.int64))
+        return np.datetime64(months // count * count, "M").astype("datetime64[ms]")
+    step = int(np.timedelta64(count, unit).astype("timedelta64[ms]").astype(np.int64))
+    return np.datetime64(int(time.astype(np.int64)) // step * step, "ms")
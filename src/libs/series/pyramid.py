@@ -0,0 +1,109 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .encoding import as_time_array, as_value_array
+
+# 解像度ピラミッドの各段のバケット幅 (細かい順)
+DEFAULT_LEVELS: Tuple[Tuple[str, np.timedelta64], ...] = (
+    ("1min", np.timedelta64(1, "m")),
+    ("15min", np.timedelta64(15, "m")),
+    ("1h", np.timedelta64(1, "h")),
+    ("1d", np.timedelta64(1, "D")),
+)
+
+
+class Level:
+    """ピラミッドの1段分の系列 (バケットごとの平均・最小・最大と有効点数)"""
+
+    def __init__(self, name: str, x, mean, lo, hi, counts):
+        self.name = name
+        self.x = x
+        self.mean = mean
+        self.lo = lo
+        self.hi = hi
+        self.counts = counts
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def window(self, start: np.datetime64, end: np.datetime64) -> Tuple[int, int]:
+        """期間に含まれる範囲 (前後1点を含む) のインデックスを返します。"""
+        i0 = max(int(np.searchsorted(self.x, start, side="left")) - 1, 0)
+        i1 = min(int(np.searchsorted(self.x, end, side="right")) + 1, len(self.x))
+        return i0, i1
+
+    def slice(self, start: np.datetime64, end: np.datetime64) -> Dict[str, np.ndarray]:
+        i0, i1 = self.window(start, end)
+        return {
+            "x": self.x[i0:i1],
+            "y": self.mean[i0:i1],
+            "y_min": self.lo[i0:i1],
+            "y_max": self.hi[i0:i1],
+        }
+
+
+def _rollup(level: Level, name: str, width: np.timedelta64) -> Level:
+    """1つ細かい段を width 幅のバケットに集計し直します (生データを再走査しない)。"""
+    if len(level) == 0:
+        return Level(name, level.x, level.mean, level.lo, level.hi, level.counts)
+    step = width.astype("timedelta64[ms]").astype(np.int64)
+    buckets = level.x.astype(np.int64) // step
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(buckets)) + 1])
+
+    counts = np.add.reduceat(level.counts, starts)
+    sums = np.add.reduceat(np.where(level.counts > 0, level.mean * level.counts, 0.0), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(counts > 0, sums / counts, np.nan)
+    lo = np.fmin.reduceat(level.lo, starts)
+    hi = np.fmax.reduceat(level.hi, starts)
+    x = (buckets[starts] * step).astype("datetime64[ms]")
+    return Level(name, x, mean, lo, hi, counts)
+
+
+def raw_level(x: np.ndarray, y: np.ndarray) -> Level:
+    """生データをピラミッドの最下段に変換します。"""
+    x = as_time_array(x)
+    y = as_value_array(y, np.float64)
+    return Level("raw", x, y, y, y, (~np.isnan(y)).astype(np.int64))
+
+
+def aggregate(x: np.ndarray, y: np.ndarray, width: np.timedelta64) -> Tuple[np.ndarray, ...]:
+    """時刻順の系列を width 幅のバケットに集計し、(時刻, 平均, 最小, 最大) を返します。"""
+    level = _rollup(raw_level(x, y), "", width)
+    return level.x, level.mean, level.lo, level.hi
+
+
+class ResolutionPyramid:
+    """1系列分の解像度ピラミッド (生データ + 集計段)
+
+    表示期間と点数の上限から、期間内の点数が上限に収まる最も細かい段を選んで返します。
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, levels=DEFAULT_LEVELS):
+        self.levels: List[Level] = [raw_level(x, y)]
+        for name, width in levels:
+            level = _rollup(self.levels[-1], name, width)
+            # 集計しても点数が減らない段は不要
+            if len(level) < len(self.levels[-1]):
+                self.levels.append(level)
+
+    @property
+    def extent(self) -> Optional[Tuple[np.datetime64, np.datetime64]]:
+        raw = self.levels[0].x
+        return (raw[0], raw[-1]) if len(raw) else None
+
+    def select(self, start: np.datetime64, end: np.datetime64, max_points: int) -> Level:
+        """期間内の点数が max_points 以下になる最も細かい段を返します。"""
+        for level in self.levels:
+            i0, i1 = level.window(start, end)
+            if i1 - i0 <= max_points:
+                return level
+        return self.levels[-1]
+
+    def query(self, start, end, max_points: int) -> Tuple[str, Dict[str, np.ndarray]]:
+        """期間に合う段の名前と、その段の期間分のデータを返します。"""
+        start = np.datetime64(start, "ms")
+        end = np.datetime64(end, "ms")
+        level = self.select(start, end, max_points)
+        return level.name, level.slice(start, end)
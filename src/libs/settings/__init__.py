@@ -0,0 +1,12 @@
+from .bulk import SettingsIssue, SettingsValidationError, build_settings
+from .compiler import CompiledSettings, compile_settings, fetch_setteings, load_settings
+
+__all__ = [
+    "CompiledSettings",
+    "SettingsIssue",
+    "SettingsValidationError",
+    "build_settings",
+    "compile_settings",
+    "fetch_setteings",
+    "load_settings",
+]
@@ -0,0 +1,342 @@
+"""設定シートの列単位の一括検証・変換
+
+行ごとに辞書を作成してモデルを1件ずつ作成すると、数万行の設定では変換に時間がかかり、
+最初の誤りで止まるため直すたびに読み込み直す必要があります。ここではシートの列
+(DataFrame) に対して必須項目・日時の前後・タブ名の参照をまとめて検証し、残りの型の
+検証とモデルの作成はモデルの一覧ごとに TypeAdapter で1回ずつ行います。
+誤りはシート名・行番号・列名付きで全件を SettingsValidationError として報告します。
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+from ..model.calc import CalcDefinition
+from ..model.data import DataCondition
+from ..model.graph import GraphCondition
+from ..model.page import Page, Tab
+from ..profiling import span
+
+# fetch_setteings は2行目を見出しとして読み込むため、データは3行目から始まる
+FIRST_ROW = 3
+# 例外のメッセージに含める誤りの件数の上限 (全件は SettingsValidationError.issues にある)
+MAX_REPORTED = 20
+
+DATA_REQUIRED = [name for name, field in DataCondition.model_fields.items() if field.is_required()]
+DATE_COLUMNS = ["start_date", "end_date"]
+LAYOUT_REQUIRED = ["page_title", "tabname", "tabtitle", "columns", "rows"]
+GRAPH_X_COLUMNS = ["x_param", "x_unit", "x_min", "x_max", "x_label"]
+GRAPH_Y_COLUMNS = ["y_param", "y_unit", "y_min", "y_max", "y_color", "y_label"]
+GRAPH_REQUIRED = ["id", "tabname"] + GRAPH_X_COLUMNS + GRAPH_Y_COLUMNS
+CALC_REQUIRED = [name for name, field in CalcDefinition.model_fields.items() if field.is_required()]
+
+_data_adapter = TypeAdapter(List[DataCondition])
+_graph_adapter = TypeAdapter(List[GraphCondition])
+_tab_adapter = TypeAdapter(List[Tab])
+_page_adapter = TypeAdapter(List[Page])
+_calc_adapter = TypeAdapter(List[CalcDefinition])
+
+
+class SettingsIssue(BaseModel):
+    """設定シートの誤り1件"""
+
+    sheet: str = Field(description="シート名")
+    row: Optional[int] = Field(default=None, description="Excel の行番号/シート全体の場合は None")
+    column: Optional[str] = Field(default=None, description="列名")
+    message: str = Field(description="内容")
+
+    def __str__(self) -> str:
+        place = f"{self.sheet} シート"
+        if self.row is not None:
+            place += f" {self.row} 行目"
+        if self.column is not None:
+            place += f" ({self.column})"
+        return f"{place}: {self.message}"
+
+    class Config:
+        frozen = True
+
+
+class SettingsValidationError(ValueError):
+    """設定シートに誤りがある場合の例外 (issues に全件を保持する)"""
+
+    def __init__(self, issues: List[SettingsIssue]):
+        self.issues = issues
+        lines = [str(issue) for issue in issues[:MAX_REPORTED]]
+        if len(issues) > MAX_REPORTED:
+            lines.append(f"ほか {len(issues) - MAX_REPORTED} 件")
+        super().__init__(f"設定ファイルに {len(issues)} 件の誤りがあります:\n" + "\n".join(lines))
+
+
+class _Sheet:
+    """1シート分の列と、検証で見つかった誤りのある行"""
+
+    def __init__(self, name: str, df: pd.DataFrame, issues: List[SettingsIssue]):
+        self.name = name
+        # 空行は読み飛ばす (行番号は元の位置のまま)
+        self.df = df.dropna(how="all")
+        self.rows = self.df.index.to_numpy() + FIRST_ROW
+        self.bad = np.zeros(len(self.df), dtype=bool)
+        self.issues = issues
+        self.complete = True
+
+    def issue(self, message: str, row: Optional[int] = None, column: Optional[str] = None):
+        self.issues.append(
+            SettingsIssue(
+                sheet=self.name,
+                row=None if row is None else int(row),
+                column=column,
+                message=message,
+            )
+        )
+
+    def require(self, columns: Sequence[str]) -> None:
+        """必須の列と、必須の列の空欄を検証します。"""
+        missing = [column for column in columns if column not in self.df.columns]
+        for column in missing:
+            self.issue("列がありません", column=column)
+        if missing:
+            # 列が揃わないシートはモデルを作成しない
+            self.complete = False
+            return
+        for column in columns:
+            self.flag(self.df[column].isna().to_numpy(), column, "値が空欄です")
+
+    def flag(self, mask: np.ndarray, column: str, message: str) -> None:
+        """mask が True の行を誤りとします (message の {value} はセルの値に置き換える)。"""
+        positions = np.flatnonzero(mask & ~self.bad)
+        if not len(positions):
+            return
+        values = self.df[column].iloc[positions].tolist()
+        for position, value in zip(positions, values):
+            self.issue(message.format(value=value), self.rows[position], column)
+        self.bad[positions] = True
+
+    def check_references(self, column: str, names: Iterable[Any], target: str) -> None:
+        """column の値が target シートにあるかを検証します。"""
+        values = self.df[column]
+        unknown = (values.notna() & ~values.isin(list(names))).to_numpy()
+        self.flag(unknown, column, f"{target} シートにないタブです: {{value}}")
+
+    def dates(self, column: str) -> pd.Series:
+        """日時の列を datetime の配列に変換し、読めないセルを誤りとします。"""
+        values = self.df[column]
+        if not pd.api.types.is_datetime64_any_dtype(values):
+            values = pd.to_datetime(values, errors="coerce", format="mixed")
+        self.flag(
+            (values.isna() & self.df[column].notna()).to_numpy(), column, "日時として読めません"
+        )
+        return values
+
+    def columns(
+        self,
+        columns: Sequence[str],
+        converted: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """誤りのない行を {列名: 値} の辞書の一覧にし、(辞書の一覧, Excel の行番号) を返します。
+
+        列にない項目と空欄は辞書に含めません (モデルの既定値を使う)。
+        """
+        ok = np.flatnonzero(~self.bad)
+        names = [column for column in columns if column in self.df.columns]
+        arrays = []
+        for name in names:
+            values = (converted or {}).get(name, self.df[name])
+            if isinstance(values, pd.Series) and pd.api.types.is_datetime64_any_dtype(values):
+                array = values.to_numpy(dtype="datetime64[us]").astype(object)
+            else:
+                array = np.asarray(values, dtype=object)
+            arrays.append(array[ok])
+        records = [dict(zip(names, row)) for row in zip(*arrays)]
+        for name, array in zip(names, arrays):
+            for position in np.flatnonzero(pd.isna(array)):
+                del records[position][name]
+        return records, self.rows[ok]
+
+    def validate(
+        self, adapter: TypeAdapter, items: List[Dict[str, Any]], rows: Sequence[int]
+    ) -> Optional[list]:
+        """モデルの一覧をまとめて検証します。誤りは items の位置 → rows の行番号で報告します。"""
+        try:
+            return adapter.validate_python(items)
+        except ValidationError as e:
+            for error in e.errors(include_url=False):
+                loc = error["loc"]
+                column = next((part for part in reversed(loc) if isinstance(part, str)), None)
+                self.issue(error["msg"], rows[loc[0]], column)
+            return None
+
+
+def _graph_column(loc: tuple) -> Optional[str]:
+    """GraphCondition の誤りの位置を graph シートの列名に変換します。"""
+    if not loc:
+        return None
+    if loc[0] == "x_axis":
+        prefix, rest = "x_", loc[1:]
+    elif loc[0] == "y_axes":
+        prefix, rest = "y_", loc[2:]
+    else:
+        return str(loc[0])
+    if not rest:
+        return None
+    if rest[0] == "range":
+        return prefix + ("max" if rest[1:2] == (1,) else "min")
+    return prefix + str(rest[0])
+
+
+def _build_data_conditions(sheet: _Sheet) -> Dict[Any, List[DataCondition]]:
+    sheet.require(DATA_REQUIRED)
+    if not sheet.complete:
+        return {}
+    dates = {column: sheet.dates(column) for column in DATE_COLUMNS}
+    sheet.flag(
+        (dates["start_date"] >= dates["end_date"]).to_numpy(),
+        "start_date",
+        "開始日時は終了日時よりも前でなければなりません",
+    )
+    records, rows = sheet.columns(list(DataCondition.model_fields), dates)
+    conditions = sheet.validate(_data_adapter, records, rows) or []
+    by_tab: Dict[Any, List[DataCondition]] = {}
+    for condition in conditions:
+        by_tab.setdefault(condition.tabname, []).append(condition)
+    return by_tab
+
+
+def _build_graph_conditions(sheet: _Sheet) -> Dict[Any, List[GraphCondition]]:
+    """graph シート (Y軸1本につき1行) を (tabname, id) ごとの GraphCondition にまとめます。"""
+    sheet.require(GRAPH_REQUIRED)
+    if not sheet.complete:
+        return {}
+    records, rows = sheet.columns(GRAPH_REQUIRED)
+    graphs: List[Dict[str, Any]] = []
+    # グラフごとの行番号 (Y軸の順)
+    graph_rows: List[List[int]] = []
+    index: Dict[Tuple[Any, Any], int] = {}
+    for row, record in zip(rows, records):
+        key = (record["tabname"], record["id"])
+        if key not in index:
+            index[key] = len(graphs)
+            graphs.append(
+                {
+                    "id": record["id"],
+                    "tabname": record["tabname"],
+                    "x_axis": {
+                        "param": record["x_param"],
+                        "unit": record["x_unit"],
+                        "range": (record["x_min"], record["x_max"]),
+                        "label": record["x_label"],
+                    },
+                    "y_axes": [],
+                }
+            )
+            graph_rows.append([])
+        graphs[index[key]]["y_axes"].append(
+            {
+                "param": record["y_param"],
+                "unit": record["y_unit"],
+                "range": (record["y_min"], record["y_max"]),
+                "color": record["y_color"],
+                "label": record["y_label"],
+            }
+        )
+        graph_rows[index[key]].append(row)
+
+    try:
+        validated = _graph_adapter.validate_python(graphs)
+    except ValidationError as e:
+        # Y軸の誤りはその軸の行、それ以外はグラフの最初の行で報告する
+        for error in e.errors(include_url=False):
+            loc = error["loc"]
+            axis = loc[2] if loc[1:2] == ("y_axes",) and len(loc) > 2 else 0
+            sheet.issue(error["msg"], graph_rows[loc[0]][axis], _graph_column(loc[1:]))
+        return {}
+    by_tab: Dict[Any, List[GraphCondition]] = {}
+    for graph in validated:
+        by_tab.setdefault(graph.tabname, []).append(graph)
+    return by_tab
+
+
+def _build_pages(
+    sheet: _Sheet,
+    data_conditions: Dict[Any, List[DataCondition]],
+    graph_conditions: Dict[Any, List[GraphCondition]],
+) -> List[Page]:
+    """layout シート (タブ1つにつき1行) を Page / Tab にまとめます。"""
+    sheet.require(LAYOUT_REQUIRED)
+    if not sheet.complete:
+        return []
+    records, rows = sheet.columns(LAYOUT_REQUIRED + ["output_file_name"])
+    tabs = []
+    pages: Dict[Any, Dict[str, Any]] = {}
+    page_rows: List[int] = []
+    for row, record in zip(rows, records):
+        tabs.append(
+            {
+                "tabname": record["tabname"],
+                "tabtitle": record["tabtitle"],
+                "layout": {
+                    "tabname": record["tabname"],
+                    "columns": record["columns"],
+                    "rows": record["rows"],
+                },
+                "data_conditions": data_conditions.get(record["tabname"], []),
+                "graph_conditions": graph_conditions.get(record["tabname"], []),
+            }
+        )
+        page = pages.get(record["page_title"])
+        if page is None:
+            page = pages[record["page_title"]] = {"page_title": record["page_title"], "tabs": []}
+            page_rows.append(row)
+        if "output_file_name" in record:
+            page["output_file_name"] = str(record["output_file_name"])
+        page["tabs"].append(len(tabs) - 1)
+
+    validated_tabs = sheet.validate(_tab_adapter, tabs, rows)
+    if validated_tabs is None:
+        return []
+    items = list(pages.values())
+    for page in items:
+        page["tabs"] = [validated_tabs[index] for index in page["tabs"]]
+    return sheet.validate(_page_adapter, items, page_rows) or []
+
+
+def build_settings(
+    data_df: pd.DataFrame,
+    layout_df: pd.DataFrame,
+    graph_df: pd.DataFrame,
+    calc_df: pd.DataFrame,
+) -> Tuple[List[Page], List[CalcDefinition]]:
+    """設定シートを列単位で検証し、Page の一覧と CalcDefinition の一覧を作成します。
+
+    誤りがある場合は全シートを検証してから SettingsValidationError を送出します。
+    """
+    issues: List[SettingsIssue] = []
+    data = _Sheet("data", data_df, issues)
+    layout = _Sheet("layout", layout_df, issues)
+    graph = _Sheet("graph", graph_df, issues)
+    calc = _Sheet("calc", calc_df, issues)
+
+    with span("settings.validate", rows=len(data.df) + len(layout.df) + len(graph.df)):
+        if "tabname" in layout.df.columns:
+            tabnames = layout.df["tabname"].dropna().unique()
+            for sheet in (data, graph):
+                if "tabname" in sheet.df.columns:
+                    sheet.check_references("tabname", tabnames, "layout")
+        data_conditions = _build_data_conditions(data)
+        graph_conditions = _build_graph_conditions(graph)
+        pages = _build_pages(layout, data_conditions, graph_conditions)
+
+        calc.require(CALC_REQUIRED)
+        calcs: List[CalcDefinition] = []
+        if calc.complete:
+            records, rows = calc.columns(list(CalcDefinition.model_fields))
+            calcs = calc.validate(_calc_adapter, records, rows) or []
+
+    if issues:
+        # シートの順・行の順に並べる (シート全体の誤りは先頭)
+        order = {sheet.name: i for i, sheet in enumerate((data, layout, graph, calc))}
+        issues.sort(key=lambda issue: (order[issue.sheet], issue.row or 0))
+        raise SettingsValidationError(issues)
+    return pages, calcs
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from pydantic import BaseModel, Field
+
+from ..model.calc import CalcDefinition
+from ..model.page import Page
+from ..profiling import span
+from .bulk import build_settings
+
+# キャッシュの形式・モデル定義を変更したら上げる
+CACHE_VERSION = 5
+SHEET_NAMES = ["data", "layout", "graph", "calc"]
+
+
+class CompiledSettings(BaseModel):
+    """設定ファイルを検証済みのモデルに変換した結果"""
+
+    source: str = Field(description="設定ファイルのパス")
+    sha256: str = Field(description="設定ファイルのハッシュ値")
+    pages: List[Page] = Field(description="ページの一覧")
+    calcs: List[CalcDefinition] = Field(default_factory=list, description="派生系列の定義")
+
+
+def fetch_setteings(fp: str):
+    sheet_names = SHEET_NAMES
+    with span("settings.read_excel") as stats:
+        setting_df_dict = pd.read_excel(fp, sheet_name=sheet_names, header=1)
+        stats["rows"] = sum(len(df) for df in setting_df_dict.values())
+    data_df = setting_df_dict["data"]
+    layout_df = setting_df_dict["layout"]
+    graph_df = setting_df_dict["graph"]
+    calc_df = setting_df_dict["calc"]
+    return data_df, layout_df, graph_df, calc_df
+
+
+def file_hash(fp: str) -> str:
+    digest = hashlib.sha256()
+    with open(fp, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compile_settings(fp: str, sha256: Optional[str] = None) -> CompiledSettings:
+    """設定ファイルを読み込み、検証済みのモデルに変換します。
+
+    誤りがある場合は全シートの誤りを行番号付きでまとめた SettingsValidationError を送出します。
+    """
+    data_df, layout_df, graph_df, calc_df = fetch_setteings(fp)
+    with span("settings.build_models") as stats:
+        pages, calcs = build_settings(data_df, layout_df, graph_df, calc_df)
+        stats.update(pages=len(pages), tabs=sum(len(page.tabs) for page in pages))
+    return CompiledSettings(
+        source=str(fp), sha256=sha256 or file_hash(fp), pages=pages, calcs=calcs
+    )
+
+
+def default_cache_path(fp: str) -> Path:
+    """設定ファイルと同じフォルダに置くキャッシュファイルのパス"""
+    path = Path(fp)
+    return path.with_name(f".{path.name}.cache.pkl")
+
+
+def _read_cache_header(cache_path: Path) -> Optional[Dict[str, Any]]:
+    """キャッシュの先頭に書かれたヘッダだけを読み込みます。"""
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+
+def _read_cache_body(cache_path: Path) -> CompiledSettings:
+    with open(cache_path, "rb") as f:
+        pickle.load(f)  # ヘッダを読み飛ばす
+        return pickle.load(f)
+
+
+def _write_cache(cache_path: Path, header: Dict[str, Any], settings: CompiledSettings) -> None:
+    tmp_path = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(settings, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+
+def load_settings(fp: str, cache_path: Optional[str] = None) -> CompiledSettings:
+    """キャッシュを使って設定を読み込みます。
+
+    更新日時とサイズが一致すればキャッシュをそのまま使い、一致しない場合は
+    ハッシュ値を比較します。ハッシュ値も異なる場合だけ Excel を読み直して変換します。
+    キャッシュからの読み込みでは openpyxl と行ごとの検証を行いません。
+    """
+    with span("settings.load", path=str(fp)) as stats:
+        settings, stats["cache"] = _load_settings(fp, cache_path)
+        return settings
+
+
+def _load_settings(fp: str, cache_path: Optional[str]) -> Tuple[CompiledSettings, str]:
+    """設定を読み込み、(設定, キャッシュの使い方) を返します。"""
+    cache_path = Path(cache_path) if cache_path else default_cache_path(fp)
+    stat = os.stat(fp)
+    header = _read_cache_header(cache_path)
+    if header is not None and header.get("version") != CACHE_VERSION:
+        header = None
+
+    if header is not None and (header["mtime_ns"], header["size"]) == (
+        stat.st_mtime_ns,
+        stat.st_size,
+    ):
+        return _read_cache_body(cache_path), "hit"
+
+    sha256 = file_hash(fp)
+    if header is not None and header["sha256"] == sha256:
+        # 内容が変わっていなければ更新日時だけ書き換えて使う
+        settings = _read_cache_body(cache_path)
+        header.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        _write_cache(cache_path, header, settings)
+        return settings, "hash"
+
+    settings = compile_settings(fp, sha256=sha256)
+    header = {
+        "version": CACHE_VERSION,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": sha256,
+    }
+    _write_cache(cache_path, header, settings)
+    return settings, "miss"
@@ -0,0 +1,66 @@
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+from .base import (
+    DataSourceError,
+    SeriesSource,
+    TransientSourceError,
+    close_sources,
+    register_scheme,
+    register_source,
+    resolve_source,
+)
+
+if TYPE_CHECKING:
+    from .duck import ConnectionPool, DuckDBSource
+    from .http import HttpSource
+
+# duckdb / httpx は取得先を作成するときに読み込む (import するだけでは読み込まない)
+_EXPORTS = {
+    "ConnectionPool": ".duck",
+    "DuckDBSource": ".duck",
+    "HttpSource": ".http",
+}
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def _duckdb_source(rest: str) -> SeriesSource:
+    from .duck import DuckDBSource
+
+    return DuckDBSource.from_uri(rest)
+
+
+def _http_source(scheme: str):
+    # URL をそのまま REST API のベース URL として使う
+    def factory(rest: str) -> SeriesSource:
+        from .http import HttpSource
+
+        return HttpSource(scheme + rest)
+
+    return factory
+
+
+register_scheme("duckdb://", _duckdb_source)
+register_scheme("http://", _http_source("http://"))
+register_scheme("https://", _http_source("https://"))
+
+__all__ = [
+    "ConnectionPool",
+    "DataSourceError",
+    "DuckDBSource",
+    "HttpSource",
+    "SeriesSource",
+    "TransientSourceError",
+    "close_sources",
+    "register_scheme",
+    "register_source",
+    "resolve_source",
+]
@@ -0,0 +1,108 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from ..fetch.planner import FetchRequest
+
+Columns = Tuple[np.ndarray, np.ndarray]
+
+T = TypeVar("T")
+
+
+class DataSourceError(Exception):
+    """データ取得先の設定・取得時のエラー"""
+
+
+class TransientSourceError(DataSourceError):
+    """再試行すれば解消する可能性のある取得時のエラー (通信エラー・5xx 応答など)"""
+
+
+async def run_in_thread(func: Callable[..., T], *args) -> T:
+    """func をスレッドで実行します (asyncio.to_thread の代わりに使う)。
+
+    スレッドは途中で止められないため、取り消された場合もスレッドの終了を待ってから
+    CancelledError を送出します。タイムアウトした取得のスレッドが動いている間に
+    同時実行数の制限が解除され、取得先に要求が溜まることを防ぎます。
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        while not future.done():
+            try:
+                await asyncio.wait({future})
+            except asyncio.CancelledError:
+                continue
+        if not future.cancelled():
+            # 取り消し後に終わったスレッドの結果・例外は使わない
+            future.exception()
+        raise
+
+
+class SeriesSource(ABC):
+    """DataCondition の系列を取得するデータ取得先の基底クラス"""
+
+    # 取得した系列をローカルストア (store.LocalStore) に保存してよいか
+    storable = True
+
+    @abstractmethod
+    def fetch(self, request: FetchRequest) -> Columns:
+        """取得要求の期間の系列を (時刻, 値) の NumPy 配列で返します。"""
+
+    async def afetch(self, request: FetchRequest) -> Columns:
+        """fetch の非同期版 (既定では fetch をスレッドで実行する)。
+
+        HTTP など非同期の I/O が使える取得先はこちらを上書きします。
+        """
+        return await run_in_thread(self.fetch, request)
+
+    async def aclose(self) -> None:
+        """非同期の取得で使ったリソース (イベントループごとのクライアントなど) を解放します。"""
+
+    def watermark(self, request: FetchRequest) -> Optional[str]:
+        """取得要求の期間のデータの更新状況を表す文字列を返します。
+
+        データが変わると値も変わる文字列 (件数と最終時刻など) を返します。
+        None は更新状況が分からないことを表し、描画結果はキャッシュされません。
+        """
+        return None
+
+    def close(self) -> None:
+        """保持しているリソースを解放します。"""
+
+
+# data_source 名 → 取得先
+_registry: Dict[str, SeriesSource] = {}
+# data_source の接頭辞 (例: "duckdb://") → 取得先を作成する関数
+_schemes: Dict[str, Callable[[str], SeriesSource]] = {}
+
+
+def register_source(name: str, source: SeriesSource) -> None:
+    """data_source 名に取得先を登録します。"""
+    _registry[name] = source
+
+
+def register_scheme(prefix: str, factory: Callable[[str], SeriesSource]) -> None:
+    """data_source の接頭辞に対応する取得先の作成関数を登録します。"""
+    _schemes[prefix] = factory
+
+
+def resolve_source(data_source: str) -> Optional[SeriesSource]:
+    """data_source に対応する取得先を返します。該当が無い場合は None を返します。"""
+    source = _registry.get(data_source)
+    if source is not None:
+        return source
+    for prefix, factory in _schemes.items():
+        if data_source.startswith(prefix):
+            source = factory(data_source[len(prefix) :])
+            _registry[data_source] = source
+            return source
+    return None
+
+
+def close_sources() -> None:
+    """登録済みの全取得先のリソースを解放します。"""
+    for source in _registry.values():
+        source.close()
@@ -0,0 +1,262 @@
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl
+
+import duckdb
+import numpy as np
+
+from ..fetch.planner import FetchRequest
+from ..series.interval import sql_interval
+from .base import Columns, DataSourceError, SeriesSource
+
+# 生データを間隔ごとに集計する式 ({value} / {time} は列名)
+AGGREGATE_EXPRESSIONS = {
+    "mean": "avg({value})",
+    "min": "min({value})",
+    "max": "max({value})",
+    "last": "arg_max({value}, {time})",
+}
+
+# 集計テーブルの更新状況 (テーブル・間隔ごとの最終時刻) を記録するテーブル
+STATE_TABLE = "_rollup_state"
+
+# 集計テーブル (rollup.RollupJob が作成する) の列から各集計方法の値を求める式
+ROLLUP_EXPRESSIONS = {
+    "mean": "total / n",
+    "min": "lo",
+    "max": "hi",
+    "last": "last_value",
+}
+
+
+def quote_identifier(name: str) -> str:
+    """SQL の識別子 (テーブル名・列名) をクォートします。"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def rollup_table_name(table: str, interval: str) -> str:
+    """集計テーブルの名前 (例: series__daily)"""
+    return f"{table}__{interval}"
+
+
+class ConnectionPool:
+    """DuckDB ファイルごとに読み取り専用の接続を1つ保持し、カーソルを払い出すプール
+
+    レンダリング中は同じ接続を使い回し、取得要求ごとに接続を開き直さないようにします。
+    """
+
+    def __init__(self):
+        self._connections: Dict[str, duckdb.DuckDBPyConnection] = {}
+        self._lock = threading.Lock()
+
+    def connection(self, database: str) -> duckdb.DuckDBPyConnection:
+        """データベースファイルへの読み取り専用接続を返します。"""
+        key = str(Path(database).resolve())
+        with self._lock:
+            conn = self._connections.get(key)
+            if conn is None:
+                conn = duckdb.connect(key, read_only=True)
+                self._connections[key] = conn
+            return conn
+
+    def release(self, database: str) -> None:
+        """データベースファイルへの接続を閉じます (書き込むプロセス・接続に譲る場合など)。
+
+        次の取得では接続を開き直すため、集計テーブルの一覧なども調べ直されます。
+        """
+        key = str(Path(database).resolve())
+        with self._lock:
+            conn = self._connections.pop(key, None)
+            if conn is not None:
+                conn.close()
+
+    @contextmanager
+    def cursor(self, database: str) -> Iterator[duckdb.DuckDBPyConnection]:
+        """プールされた接続からカーソルを取得します (スレッドごとに別のカーソルを使う)。"""
+        cursor = self.connection(database).cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def close(self) -> None:
+        """保持している全ての接続を閉じます。"""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+
+
+default_pool = ConnectionPool()
+
+
+class DuckDBSource(SeriesSource):
+    """DuckDB のテーブルから系列を取得するデータ取得先
+
+    id_column を指定した場合は縦持ち (id, 時刻, 値) のテーブル、
+    指定しない場合は DataCondition.id を列名とする横持ちのテーブルとして扱います。
+
+    DataCondition.interval が生データ (raw) 以外の場合は DuckDB 側で間隔ごとに集計し、
+    縦持ちのテーブルで集計テーブル (rollup.RollupJob で作成) があればそちらを読みます。
+    集計テーブルは最後に更新した時点のバケットまでを読み、それより後 (更新後に追記された
+    行) は生データをその場で集計します。
+    """
+
+    def __init__(
+        self,
+        database: str,
+        table: str = "series",
+        time_column: str = "timestamp",
+        id_column: Optional[str] = None,
+        value_column: str = "value",
+        pool: ConnectionPool = default_pool,
+    ):
+        self.database = database
+        self.table = table
+        self.time_column = time_column
+        self.id_column = id_column
+        self.value_column = value_column
+        self.pool = pool
+        # 集計テーブルの一覧と、それを調べた接続 (接続を開き直したら調べ直す)
+        self._rollups: Optional[Tuple[duckdb.DuckDBPyConnection, Set[str]]] = None
+
+    @classmethod
+    def from_uri(cls, uri: str) -> "DuckDBSource":
+        """<path>?table=...&time_column=... 形式の文字列から作成します。"""
+        database, _, query = uri.partition("?")
+        options = dict(parse_qsl(query))
+        unknown = set(options) - {"table", "time_column", "id_column", "value_column"}
+        if unknown:
+            raise DataSourceError(f"不明なオプションです: {', '.join(sorted(unknown))}")
+        return cls(database, **options)
+
+    def rollup_tables(self) -> Set[str]:
+        """データベースにある集計テーブルの名前。
+
+        接続ごとに1度だけ調べます。集計テーブルの更新 (RollupJob.refresh) は読み取り専用の
+        接続を閉じてから行うため、更新後の取得では開き直した接続で調べ直されます。
+        """
+        conn = self.pool.connection(self.database)
+        if self._rollups is None or self._rollups[0] is not conn:
+            prefix = rollup_table_name(self.table, "")
+            with self.pool.cursor(self.database) as cursor:
+                rows = cursor.execute(
+                    "SELECT table_name FROM information_schema.tables"
+                    " WHERE starts_with(table_name, ?)",
+                    [prefix],
+                ).fetchall()
+            self._rollups = (conn, {name for (name,) in rows})
+        return self._rollups[1]
+
+    def _series_filter(self, request: FetchRequest) -> Tuple[str, List[str], List]:
+        """(値の列, 系列を絞り込む WHERE 条件, パラメータ) を返します。"""
+        if self.id_column is None:
+            return quote_identifier(request.id), [], []
+        return (
+            quote_identifier(self.value_column),
+            [f"{quote_identifier(self.id_column)} = ?"],
+            [request.id],
+        )
+
+    def _time_filter(self, request: FetchRequest, bucket_width: Optional[str]) -> Tuple[str, List]:
+        """期間の WHERE 条件とパラメータ (集計する場合は期間の両端を含むバケット全体)。"""
+        time_column = quote_identifier(self.time_column)
+        params = [request.start_date, request.end_date]
+        if bucket_width is None:
+            return f"{time_column} BETWEEN ? AND ?", params
+        return (
+            f"{time_column} >= time_bucket({bucket_width}, ?::TIMESTAMP)"
+            f" AND {time_column} < time_bucket({bucket_width}, ?::TIMESTAMP) + {bucket_width}",
+            params,
+        )
+
+    def build_query(self, request: FetchRequest) -> Tuple[str, List]:
+        """取得要求を、期間と列を絞り込んだパラメータ付きクエリに変換します。"""
+        try:
+            bucket_width = sql_interval(request.interval)
+        except ValueError as e:
+            raise DataSourceError(str(e)) from e
+
+        time_column = quote_identifier(self.time_column)
+        table = quote_identifier(self.table)
+        value_column, where, params = self._series_filter(request)
+        time_filter, time_params = self._time_filter(request, bucket_width)
+        where.append(time_filter)
+        params += time_params
+
+        if bucket_width is None:
+            sql = (
+                f"SELECT {time_column}, {value_column} FROM {table}"
+                f" WHERE {' AND '.join(where)} ORDER BY {time_column}"
+            )
+            return sql, params
+
+        aggregate = AGGREGATE_EXPRESSIONS[request.aggregation].format(
+            value=value_column, time=time_column
+        )
+        raw = (
+            f"SELECT time_bucket({bucket_width}, {time_column}) AS bucket, {aggregate} FROM {table}"
+        )
+        rollup = rollup_table_name(self.table, request.interval)
+        if self.id_column is None or rollup not in self.rollup_tables():
+            # 集計テーブルと同じく、期間の両端を含むバケットは全体を集計する
+            sql = f"{raw} WHERE {' AND '.join(where)} GROUP BY bucket ORDER BY bucket"
+            return sql, params
+
+        # 最後に更新した時点の最終時刻を含むバケット (edge) より前は集計テーブルを読み、
+        # edge 以降は生データを集計する (更新時に途中だったバケットも集計し直す)
+        sql = (
+            f"WITH mark AS (SELECT coalesce(max(time_bucket({bucket_width}, watermark)),"
+            f" '-infinity'::TIMESTAMP) AS edge FROM {STATE_TABLE}"
+            " WHERE source_table = ? AND interval = ?)"
+            f" SELECT bucket, {ROLLUP_EXPRESSIONS[request.aggregation]}"
+            f" FROM {quote_identifier(rollup)}, mark"
+            f" WHERE id = ? AND bucket BETWEEN time_bucket({bucket_width}, ?::TIMESTAMP) AND ?"
+            " AND bucket < mark.edge"
+            f" UNION ALL {raw}, mark WHERE {' AND '.join(where)} AND {time_column} >= mark.edge"
+            " GROUP BY bucket ORDER BY bucket"
+        )
+        rollup_params = [request.id, request.start_date, request.end_date]
+        return sql, [self.table, request.interval] + rollup_params + params
+
+    def watermark(self, request: FetchRequest) -> Optional[str]:
+        """期間内の件数と最終時刻 (追記・削除・過去データの修正件数の変化で変わる)。
+
+        集計する場合は取得と同じく期間の両端を含むバケット全体の行を数えます。
+        """
+        try:
+            bucket_width = sql_interval(request.interval)
+        except ValueError as e:
+            raise DataSourceError(str(e)) from e
+        time_column = quote_identifier(self.time_column)
+        value_column, where, params = self._series_filter(request)
+        time_filter, time_params = self._time_filter(request, bucket_width)
+        where.append(time_filter)
+        params += time_params
+        sql = (
+            f"SELECT count({value_column}), max({time_column}), sum({value_column})"
+            f" FROM {quote_identifier(self.table)} WHERE {' AND '.join(where)}"
+        )
+        try:
+            with self.pool.cursor(self.database) as cursor:
+                count, last, total = cursor.execute(sql, params).fetchone()
+        except duckdb.Error as e:
+            raise DataSourceError(f"Database error: {e}") from e
+        return f"{count}:{last}:{total!r}"
+
+    def fetch(self, request: FetchRequest) -> Columns:
+        sql, params = self.build_query(request)
+        try:
+            with self.pool.cursor(self.database) as cursor:
+                table = cursor.execute(sql, params).arrow()
+        except duckdb.Error as e:
+            raise DataSourceError(f"Database error: {e}") from e
+        # pandas の DataFrame を経由せず Arrow の列をそのまま NumPy 配列にする
+        x, y = (column.to_numpy() for column in table.columns)
+        return x, np.asarray(y, dtype=np.float64)
+
+    def close(self) -> None:
+        self.pool.close()
+        self._rollups = None
@@ -0,0 +1,114 @@
+import asyncio
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+import httpx
+import numpy as np
+
+from ..fetch.planner import FetchRequest
+from ..series.encoding import TIME_DTYPE
+from .base import Columns, DataSourceError, SeriesSource, TransientSourceError
+
+
+def parse_series(payload: Dict[str, Any]) -> Columns:
+    """{"x": [...], "y": [...]} 形式の応答を (時刻, 値) の配列に変換します。
+
+    時刻は ISO 8601 の文字列か、UNIX 時刻 (ミリ秒) の数値のどちらでも受け付けます。
+    """
+    try:
+        x, y = payload["x"], payload["y"]
+    except (KeyError, TypeError) as e:
+        raise DataSourceError(f"応答の形式が正しくありません: {e!r}") from e
+    if len(x) != len(y):
+        raise DataSourceError("応答の x と y の長さが異なります")
+    if len(x) and isinstance(x[0], (int, float)):
+        times = np.asarray(x, dtype=np.int64).view(TIME_DTYPE)
+    else:
+        times = np.asarray(x, dtype=TIME_DTYPE)
+    values = np.asarray([np.nan if value is None else value for value in y], dtype=np.float64)
+    return times, values
+
+
+class HttpSource(SeriesSource):
+    """REST API (ヒストリアンなど) から系列を取得するデータ取得先
+
+    GET {base_url}{path}?start=...&end=...&interval=...&aggregation=... を送り、
+    {"x": [...], "y": [...]} 形式の JSON を受け取ります。path の {id} は DataCondition.id です。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        path: str = "/series/{id}",
+        timeout: float = 30.0,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.path = path
+        self.timeout = timeout
+        self.headers = headers or {}
+        self._client: Optional[httpx.Client] = None
+        # イベントループごとの非同期クライアント (ループをまたいで使えないため)
+        self._async_clients: Dict[int, httpx.AsyncClient] = {}
+
+    def url_for(self, request: FetchRequest) -> str:
+        return self.base_url + self.path.format(id=quote(request.id, safe=""))
+
+    @staticmethod
+    def params_for(request: FetchRequest) -> Dict[str, str]:
+        return {
+            "start": request.start_date.isoformat(),
+            "end": request.end_date.isoformat(),
+            "interval": request.interval,
+            "aggregation": request.aggregation,
+        }
+
+    @staticmethod
+    def _parse_response(response: httpx.Response) -> Columns:
+        try:
+            response.raise_for_status()
+            return parse_series(response.json())
+        except httpx.HTTPStatusError as e:
+            # サーバー側の障害と流量制限だけを再試行の対象にする (4xx は設定の誤り)
+            status = e.response.status_code
+            error = TransientSourceError if status >= 500 or status == 429 else DataSourceError
+            raise error(f"HTTP error: {e}") from e
+        except ValueError as e:
+            raise DataSourceError(f"HTTP error: {e}") from e
+
+    @staticmethod
+    def _request_error(e: httpx.HTTPError) -> DataSourceError:
+        # 接続・タイムアウトなどの通信エラーは再試行の対象にする
+        error = TransientSourceError if isinstance(e, httpx.TransportError) else DataSourceError
+        return error(f"HTTP error: {e!r}")
+
+    def fetch(self, request: FetchRequest) -> Columns:
+        if self._client is None:
+            self._client = httpx.Client(timeout=self.timeout, headers=self.headers)
+        try:
+            response = self._client.get(self.url_for(request), params=self.params_for(request))
+        except httpx.HTTPError as e:
+            raise self._request_error(e) from e
+        return self._parse_response(response)
+
+    async def afetch(self, request: FetchRequest) -> Columns:
+        loop = id(asyncio.get_running_loop())
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(timeout=self.timeout, headers=self.headers)
+            self._async_clients[loop] = client
+        try:
+            response = await client.get(self.url_for(request), params=self.params_for(request))
+        except httpx.HTTPError as e:
+            raise self._request_error(e) from e
+        return self._parse_response(response)
+
+    async def aclose(self) -> None:
+        client = self._async_clients.pop(id(asyncio.get_running_loop()), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
@@ -0,0 +1,152 @@
+"""集計済みテーブル (ロールアップ) の差分更新ジョブ
+
+縦持ち (id, 時刻, 値) のテーブルから hourly / daily / monthly の集計テーブルを作成し、
+前回の更新以降に追加された行だけを集計し直します。DuckDBSource は集計テーブルが
+あればそちらを読むため、1年分の daily のグラフは数百万行ではなく365行の読み込みで済みます。
+
+    python -m src.libs.source.rollup data.duckdb --table series --id-column id
+"""
+
+import argparse
+from typing import Dict, Iterable, List, Optional
+
+import duckdb
+
+from ..series.interval import sql_interval
+from .base import DataSourceError
+from .duck import STATE_TABLE, ConnectionPool, default_pool, quote_identifier, rollup_table_name
+
+ROLLUP_INTERVALS = ("hourly", "daily", "monthly")
+
+
+class RollupJob:
+    """縦持ちのテーブルの集計テーブルを差分更新するジョブ
+
+    各集計テーブルには件数・合計・最小・最大・最後の値を保持するため、
+    mean / min / max / last のどの集計方法でも集計テーブルから読めます。
+    """
+
+    def __init__(
+        self,
+        database: str,
+        table: str = "series",
+        time_column: str = "timestamp",
+        id_column: str = "id",
+        value_column: str = "value",
+        intervals: Iterable[str] = ROLLUP_INTERVALS,
+        pool: ConnectionPool = default_pool,
+    ):
+        self.database = database
+        self.pool = pool
+        self.table = table
+        self.time_column = time_column
+        self.id_column = id_column
+        self.value_column = value_column
+        self.intervals = list(intervals)
+
+    def _ensure_tables(self, conn: duckdb.DuckDBPyConnection, interval: str) -> None:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} ("
+            "source_table VARCHAR, interval VARCHAR, watermark TIMESTAMP, "
+            "PRIMARY KEY (source_table, interval))"
+        )
+        rollup = quote_identifier(rollup_table_name(self.table, interval))
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {rollup} ("
+            "id VARCHAR, bucket TIMESTAMP, n BIGINT, total DOUBLE, lo DOUBLE, hi DOUBLE, "
+            "last_time TIMESTAMP, last_value DOUBLE)"
+        )
+
+    def refresh_interval(self, conn: duckdb.DuckDBPyConnection, interval: str) -> int:
+        """1つの間隔の集計テーブルを差分更新し、書き込んだ行数を返します。"""
+        bucket_width = sql_interval(interval)
+        if bucket_width is None:
+            raise DataSourceError(f"生データの間隔は集計できません: {interval}")
+        self._ensure_tables(conn, interval)
+
+        table = quote_identifier(self.table)
+        rollup = quote_identifier(rollup_table_name(self.table, interval))
+        time_column = quote_identifier(self.time_column)
+        id_column = quote_identifier(self.id_column)
+        value_column = quote_identifier(self.value_column)
+
+        row = conn.execute(
+            f"SELECT watermark FROM {STATE_TABLE} WHERE source_table = ? AND interval = ?",
+            [self.table, interval],
+        ).fetchone()
+        watermark = row[0] if row else None
+
+        # 前回の最終時刻を含むバケットから後ろだけを集計し直す (追記のみのデータを想定)
+        where, params = "", []
+        if watermark is not None:
+            where = f"WHERE {time_column} >= time_bucket({bucket_width}, ?::TIMESTAMP)"
+            params = [watermark]
+            conn.execute(
+                f"DELETE FROM {rollup} WHERE bucket >= time_bucket({bucket_width}, ?::TIMESTAMP)",
+                params,
+            )
+        # INSERT の結果は書き込んだ行数
+        written = conn.execute(
+            f"INSERT INTO {rollup} "
+            f"SELECT {id_column}::VARCHAR, time_bucket({bucket_width}, {time_column}) AS bucket, "
+            f"count({value_column}), sum({value_column}), min({value_column}), "
+            f"max({value_column}), max({time_column}), arg_max({value_column}, {time_column}) "
+            f"FROM {table} {where} GROUP BY ALL",
+            params,
+        ).fetchone()[0]
+
+        new_watermark = conn.execute(f"SELECT max({time_column}) FROM {table}").fetchone()[0]
+        conn.execute(
+            f"INSERT OR REPLACE INTO {STATE_TABLE} VALUES (?, ?, ?)",
+            [self.table, interval, new_watermark],
+        )
+        return written
+
+    def refresh(self) -> Dict[str, int]:
+        """全ての間隔の集計テーブルを差分更新します。
+
+        このプロセスの読み取り専用の接続は閉じてから更新します (DuckDB はファイルへの
+        書き込み中に別の設定の接続を開けない)。DuckDBSource は次の取得で接続を開き直し、
+        更新後の集計テーブルを読みます。
+        """
+        written: Dict[str, int] = {}
+        self.pool.release(self.database)
+        try:
+            with duckdb.connect(self.database) as conn:
+                for interval in self.intervals:
+                    conn.execute("BEGIN TRANSACTION")
+                    try:
+                        written[interval] = self.refresh_interval(conn, interval)
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+        except duckdb.Error as e:
+            raise DataSourceError(f"Database error: {e}") from e
+        return written
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="集計テーブルの差分更新")
+    parser.add_argument("database", help="DuckDB のファイル")
+    parser.add_argument("--table", default="series")
+    parser.add_argument("--time-column", default="timestamp")
+    parser.add_argument("--id-column", default="id")
+    parser.add_argument("--value-column", default="value")
+    parser.add_argument("--intervals", nargs="*", default=list(ROLLUP_INTERVALS))
+    args = parser.parse_args(argv)
+
+    job = RollupJob(
+        args.database,
+        table=args.table,
+        time_column=args.time_column,
+        id_column=args.id_column,
+        value_column=args.value_column,
+        intervals=args.intervals,
+    )
+    for interval, rows in job.refresh().items():
+        print(f"{rollup_table_name(args.table, interval)}: {rows} rows refreshed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""HttpSource の動作確認用のローカルスタブサーバー
+
+GET /series/{id}?start=...&end=...&interval=... に合成データを返します。応答の遅延や、
+常に失敗する ID・初回だけ失敗する ID を指定でき、タイムアウト・再試行・部分結果の
+動作を実際の HTTP 通信で確認できます。
+
+    python -m src.libs.source.stub --port 8765 --delay 0.2 --fail broken
+
+    with StubHistorian(delay=0.1, fail_ids={"broken"}) as stub:
+        register_source("historian", HttpSource(stub.url))
+"""
+
+import argparse
+import json
+import threading
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+
+from ..series.interval import interval_step
+
+
+class StubHistorian:
+    """別スレッドで動く合成データの HTTP サーバー"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        delay: float = 0.0,
+        fail_ids: Iterable[str] = (),
+        flaky_ids: Iterable[str] = (),
+    ):
+        self.delay = delay
+        self.fail_ids = set(fail_ids)
+        # 初回の要求だけ 503 を返す ID (再試行の確認用)
+        self.flaky_ids = set(flaky_ids)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def series(self, series_id: str, start: str, end: str, interval: str):
+        step = interval_step(interval) or np.timedelta64(1, "h")
+        x = np.arange(
+            np.datetime64(datetime.fromisoformat(start), "ms"),
+            np.datetime64(datetime.fromisoformat(end), "ms") + np.timedelta64(1, "ms"),
+            step,
+        )
+        rng = np.random.default_rng(zlib.crc32(series_id.encode("utf-8")))
+        y = 50 + np.cumsum(rng.standard_normal(len(x)))
+        return {"x": x.astype(np.int64).tolist(), "y": y.round(3).tolist()}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):  # noqa: A002 - 標準ライブラリの引数名
+                pass
+
+            def _reply(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # クライアントがタイムアウトで切断した
+                    pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                if len(parts) != 2 or parts[0] != "series":
+                    return self._reply(404, {"error": "not found"})
+                series_id = unquote(parts[1])
+                with stub._lock:
+                    stub.requests += 1
+                    flaky = series_id in stub.flaky_ids
+                    stub.flaky_ids.discard(series_id)
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if series_id in stub.fail_ids:
+                    return self._reply(500, {"error": f"series {series_id} is broken"})
+                if flaky:
+                    return self._reply(503, {"error": "try again"})
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                try:
+                    body = stub.series(
+                        series_id, query["start"], query["end"], query.get("interval", "hourly")
+                    )
+                except (KeyError, ValueError) as e:
+                    return self._reply(400, {"error": repr(e)})
+                self._reply(200, body)
+
+        return Handler
+
+    def start(self) -> "StubHistorian":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubHistorian":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="HttpSource 用のスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="応答の遅延 (秒)")
+    parser.add_argument("--fail", nargs="*", default=[], help="常に 500 を返す ID")
+    parser.add_argument("--flaky", nargs="*", default=[], help="初回だけ 503 を返す ID")
+    args = parser.parse_args(argv)
+
+    stub = StubHistorian(args.host, args.port, args.delay, args.fail, args.flaky)
+    print(f"serving on {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+from .local import LocalStore, find_gaps, merge_windows
+
+__all__ = ["LocalStore", "find_gaps", "merge_windows"]
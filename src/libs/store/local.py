@@ -0,0 +1,377 @@
+"""取得済み系列のローカル列指向ストア
+
+系列は (data_source, DataCondition.id, 間隔, 集計方法) ごとのフォルダに、Arrow IPC 形式の
+セグメントとして保存します。読み込みはメモリマップで行うため、Python のヒープに
+系列全体を持たずに済みます。取得済みの期間は manifest.json で管理し、要求された期間の
+うち未取得の部分 (ギャップ) だけを取得元から取得して追加します。
+
+複数のプロセス (バッチのワーカー・常駐ワーカーなど) が同じフォルダを使えるよう、
+マニフェストの読み書きはフォルダごとのロックファイルで排他制御します。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+
+from ..fetch.planner import FetchRequest, Series
+from ..series.encoding import TIME_DTYPE, as_time_array, as_value_array
+from ..series.interval import INTERVALS, bucket_start
+
+# 取得済みの期間 (両端を含む)
+Window = Tuple[np.datetime64, np.datetime64]
+
+SCHEMA = pa.schema([("x", pa.timestamp("ms")), ("y", pa.float64())])
+MANIFEST = "manifest.json"
+LOCK = "manifest.lock"
+# 置き換えたセグメント・マニフェストに載っていないファイルを削除するまでの猶予 (秒)
+# (他のプロセスが読み込み中・書き込み中のファイルを削除しないようにする)
+DELETE_GRACE = 600.0
+
+
+_MS = np.timedelta64(1, "ms")
+
+
+def _to_time(value) -> np.datetime64:
+    return np.datetime64(value, "ms")
+
+
+def _horizon(interval: str) -> np.datetime64:
+    """この時刻以降のデータはまだ揃っていない (取得済みにしない) 時刻を返します。
+
+    生データは現在時刻の直後、集計値は現在時刻を含む区間 (集計中の区間) の開始時刻です。
+    """
+    now = _to_time(datetime.now())
+    if INTERVALS.get(interval) is None:
+        return now + _MS
+    return bucket_start(now, interval)
+
+
+def merge_windows(windows: List[Window]) -> List[Window]:
+    """重なる・接する期間をまとめ、開始時刻順に並べます。"""
+    merged: List[Window] = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def find_gaps(covered: List[Window], start: np.datetime64, end: np.datetime64) -> List[Window]:
+    """期間 [start, end] のうち covered に含まれない部分を返します。
+
+    ギャップの端が取得済みの期間に接する場合、その時刻は取得済みとして扱います
+    (取得した系列から covered_mask で除く)。
+    """
+    overlapping = [(s, e) for s, e in covered if e >= start and s <= end]
+    if not overlapping:
+        return [(start, end)]
+    gaps: List[Window] = []
+    cursor = start
+    for covered_start, covered_end in overlapping:
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def covered_mask(x: np.ndarray, covered: List[Window]) -> np.ndarray:
+    """各時刻が取得済みの期間に含まれるかどうかを配列単位で判定します。"""
+    if not covered:
+        return np.zeros(len(x), dtype=bool)
+    starts = np.array([start for start, _ in covered], dtype=TIME_DTYPE)
+    ends = np.array([end for _, end in covered], dtype=TIME_DTYPE)
+    # x 以前に始まる最後の期間の終了時刻と比較する
+    index = np.searchsorted(starts, x, side="right") - 1
+    return (index >= 0) & (x <= ends[np.clip(index, 0, None)])
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """ロックファイル path でプロセス間の排他制御を行います (取得できるまで待つ)。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK は10秒間再試行しても取得できなければ OSError を送出する
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _remove(path: Path) -> bool:
+    """ファイルを削除します。削除できなかった場合は False を返します。
+
+    Windows ではメモリマップ中のファイルは削除できないため、次の compact で削除し直します。
+    """
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        return False
+    return True
+
+
+class SeriesKeyStore:
+    """1系列分 (取得先・ID・間隔・集計方法) のセグメントと取得済み期間"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.manifest_path = directory / MANIFEST
+        self.lock_path = directory / LOCK
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """このプロセスの他のスレッド・他のプロセスとマニフェストの更新を排他制御します。"""
+        with self._lock, _file_lock(self.lock_path):
+            yield
+
+    def read_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"covered": [], "segments": []}
+
+    def _write_manifest(self, manifest: Dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_name(f"{MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def covered(self, manifest: Optional[Dict] = None) -> List[Window]:
+        manifest = manifest if manifest is not None else self.read_manifest()
+        return [(_to_time(start), _to_time(end)) for start, end in manifest["covered"]]
+
+    def _write_segment(self, x: np.ndarray, y: np.ndarray) -> Dict:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{uuid.uuid4().hex}.arrow"
+        table = pa.table({"x": x, "y": y}, schema=SCHEMA)
+        tmp_path = self.directory / f"{name}.tmp"
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, SCHEMA) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, self.directory / name)
+        return {"name": name, "start": str(x[0]), "end": str(x[-1]), "rows": len(x)}
+
+    def add(self, pieces: List[Tuple[np.ndarray, np.ndarray]], windows: List[Window]) -> None:
+        """取得した系列 (x, y) をそれぞれ新しいセグメントとして保存します。
+
+        windows (取得した期間。データの無い期間も含む) は取得済みにします。
+        """
+        with self.locked():
+            manifest = self.read_manifest()
+            covered = self.covered(manifest)
+            added = merge_windows(windows)
+            for x, y in pieces:
+                # 既に取得済みの時刻 (ギャップの端の重複) と、取得済みにしない期間の時刻は保存しない
+                keep = ~covered_mask(x, covered) & covered_mask(x, added)
+                if keep.any():
+                    x, y = x[keep], y[keep]
+                    order = np.argsort(x, kind="stable")
+                    manifest["segments"].append(self._write_segment(x[order], y[order]))
+            covered = merge_windows(covered + added)
+            manifest["covered"] = [[str(start), str(end)] for start, end in covered]
+            self._write_manifest(manifest)
+
+    def read(
+        self, start: Optional[np.datetime64] = None, end: Optional[np.datetime64] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """期間 [start, end] (省略時は全期間) の系列をメモリマップしたセグメントから読み込みます。
+
+        該当するセグメントが1つの場合はメモリマップ上の配列をそのまま参照します。
+        """
+        xs, ys = [], []
+        for segment in sorted(self.read_manifest()["segments"], key=lambda s: s["start"]):
+            if start is not None and _to_time(segment["end"]) < start:
+                continue
+            if end is not None and _to_time(segment["start"]) > end:
+                continue
+            # 配列がマップを参照し続けるため、ファイルは明示的に閉じない
+            source = pa.memory_map(str(self.directory / segment["name"]))
+            table = pa.ipc.open_file(source).read_all()
+            x = table.column("x").to_numpy()
+            y = table.column("y").to_numpy()
+            lo = 0 if start is None else np.searchsorted(x, start, side="left")
+            hi = len(x) if end is None else np.searchsorted(x, end, side="right")
+            xs.append(x[lo:hi])
+            ys.append(y[lo:hi])
+        if not xs:
+            return np.array([], dtype=TIME_DTYPE), np.array([], dtype=np.float64)
+        if len(xs) == 1:
+            return xs[0], ys[0]
+        x, y = np.concatenate(xs), np.concatenate(ys)
+        # ギャップごとにセグメントを作るため通常は連結するだけで時刻順になる
+        if (x[1:] < x[:-1]).any():
+            order = np.argsort(x, kind="stable")
+            x, y = x[order], y[order]
+        return x, y
+
+    def segment_count(self) -> int:
+        return len(self.read_manifest()["segments"])
+
+    def compact(self, grace: float = DELETE_GRACE) -> int:
+        """全セグメントを1つにまとめ、不要になったファイルを削除します。削除数を返します。
+
+        置き換えたセグメントは他のプロセスが読み込み中の場合があるため、マニフェストの
+        retired に記録して grace 秒が過ぎてから削除します (削除できなかったものは次回に
+        削除し直す)。マニフェストに載っていないファイル (異常終了したプロセスが残したものなど)
+        も書き込み中の場合があるため、更新から grace 秒以上過ぎたものだけを削除します。
+        """
+        with self.locked():
+            manifest = self.read_manifest()
+            now = time.time()
+            retired = manifest.get("retired", [])
+            if len(manifest["segments"]) > 1:
+                x, y = self.read()
+                retired += [
+                    {"name": segment["name"], "at": now} for segment in manifest["segments"]
+                ]
+                manifest["segments"] = [self._write_segment(x, y)] if len(x) else []
+            removed = 0
+            manifest["retired"] = []
+            for entry in retired:
+                if now - entry["at"] >= grace and _remove(self.directory / entry["name"]):
+                    removed += 1
+                else:
+                    manifest["retired"].append(entry)
+            self._write_manifest(manifest)
+
+            known = {MANIFEST, LOCK}
+            known.update(segment["name"] for segment in manifest["segments"])
+            known.update(entry["name"] for entry in manifest["retired"])
+            for path in self.directory.iterdir():
+                if path.name in known:
+                    continue
+                try:
+                    age = now - path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if age >= grace and _remove(path):
+                    removed += 1
+            return removed
+
+
+class LocalStore:
+    """取得済み系列をローカルに保持し、未取得の期間だけを取得元から取得するストア
+
+    取得関数を包んで使います。
+
+        store = LocalStore("cache/series")
+        fetch = store.cached(fetch_series)   # 取得関数を包む
+    """
+
+    def __init__(self, directory: str, max_segments: int = 16):
+        self.directory = Path(directory)
+        self.max_segments = max_segments
+        self._keys: Dict[Tuple[str, ...], SeriesKeyStore] = {}
+        self._lock = threading.Lock()
+
+    def key_store(self, request: FetchRequest) -> SeriesKeyStore:
+        key = request.key
+        with self._lock:
+            store = self._keys.get(key)
+            if store is None:
+                # 取得先の URI などはファイル名に使えないためハッシュ値にする
+                digest = hashlib.sha256("\0".join(key).encode("utf-8")).hexdigest()[:32]
+                store = SeriesKeyStore(self.directory / digest)
+                self._keys[key] = store
+            return store
+
+    def fetch(self, request: FetchRequest, upstream: Callable[[FetchRequest], Series]) -> Series:
+        """ストアから系列を返します。未取得の期間は upstream で取得して保存します。"""
+        store = self.key_store(request)
+        start, end = _to_time(request.start_date), _to_time(request.end_date)
+        aggregated = INTERVALS.get(request.interval) is not None
+        if aggregated:
+            # 集計値は区間の開始時刻に置かれるため、区間の途中から始まる要求も区間の先頭から調べる
+            start = bucket_start(start, request.interval)
+        gaps = find_gaps(store.covered(), start, end)
+        if gaps:
+            # horizon 以降 (現在時刻より先・集計値では現在時刻を含む最新の区間) はまだデータが
+            # 揃っていないため取得済みとして扱わない
+            horizon = _horizon(request.interval)
+            pieces, windows = [], []
+            for gap_start, gap_end in gaps:
+                gap = request.model_copy(
+                    update={
+                        "start_date": gap_start.astype(datetime),
+                        "end_date": gap_end.astype(datetime),
+                    }
+                )
+                x, y = upstream(gap)
+                pieces.append((as_time_array(x), as_value_array(y, np.float64)))
+                if gap_start < horizon:
+                    windows.append((gap_start, min(gap_end, horizon - _MS)))
+            store.add(pieces, windows)
+            if store.segment_count() > self.max_segments:
+                store.compact()
+            # horizon 以降のデータ (保存しない) も今回の結果には含める
+            fresh = [
+                (x[x >= horizon], y[x >= horizon]) for x, y in pieces if len(x) and x[-1] >= horizon
+            ]
+            if fresh:
+                x, y = store.read(start, horizon - _MS)
+                return (
+                    np.concatenate([x] + [fx for fx, _ in fresh]),
+                    np.concatenate([y] + [fy for _, fy in fresh]),
+                )
+        return store.read(start, end)
+
+    def append(self, request: FetchRequest, x, y) -> None:
+        """request の系列に新しいデータを追記します (取得済みの時刻のデータは無視する)。
+
+        request の期間 (通常は前回の最終時刻から最新のデータの時刻まで) を取得済みにします。
+        集計値の最新の区間はまだ値が変わるため、取得済みにも保存もしません。
+        """
+        start = _to_time(request.start_date)
+        end = min(_to_time(request.end_date), _horizon(request.interval) - _MS)
+        pieces = [(as_time_array(x), as_value_array(y, np.float64))]
+        self.key_store(request).add(pieces, [(start, end)] if start <= end else [])
+
+    def compact(self) -> int:
+        """全系列のセグメントをまとめます。削除したファイル数を返します。"""
+        removed = 0
+        if not self.directory.exists():
+            return removed
+        for path in self.directory.iterdir():
+            if (path / MANIFEST).exists():
+                removed += SeriesKeyStore(path).compact()
+        return removed
+
+    def cached(
+        self, upstream: Callable[[FetchRequest], Series]
+    ) -> Callable[[FetchRequest], Series]:
+        """upstream をストア経由で呼ぶ取得関数を返します。"""
+        return lambda request: self.fetch(request, upstream)
@@ -0,0 +1,417 @@
+"""常駐レンダリングワーカー
+
+改行区切りの JSON-RPC 2.0 リクエストを標準入出力 (またはローカルソケット) で受け取り、
+ページ・タブの json_item を返します。プロセスを使い回すため、bokeh / pandas / pydantic の
+import、読み込んだ設定、取得済みデータはリクエスト間で保持されます。
+
+    python -m src.worker                      # 標準入出力
+    python -m src.worker --socket 127.0.0.1:8765
+
+例:
+    {"jsonrpc": "2.0", "id": 1, "method": "load", "params": {"settings": "settings.xlsx"}}
+    {"jsonrpc": "2.0", "id": 2, "method": "render", "params": {"page": 0, "tab": "Tab 1"}}
+"""
+
+import argparse
+import inspect
+import json
+import os
+import socketserver
+import subprocess
+import sys
+import tempfile
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+if TYPE_CHECKING:
+    from src.libs.calc import CalcEngine
+    from src.libs.fetch import FetchRequest
+    from src.libs.fetch.planner import Series
+    from src.libs.model.page import Page
+    from src.libs.render.cache import RenderCache
+
+# bokeh / pandas などはワーカーを起動したときに読み込む
+# (WorkerClient を使うだけのプロセスでは読み込まない)
+
+# JSON-RPC 2.0 のエラーコード
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class RpcError(Exception):
+    """JSON-RPC のエラー応答に変換される例外"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class RenderWorker:
+    """設定とデータを保持したままレンダリング要求に応えるワーカー"""
+
+    def __init__(
+        self,
+        fetch: Optional[Callable[["FetchRequest"], "Series"]] = None,
+        cache: Optional["RenderCache"] = None,
+    ):
+        from src.graph import afetch_series, create_bokeh_graph, fetch_series
+        from src.libs.render.lazy import LazyReport
+
+        self.fetch = fetch or fetch_series
+        # 取得関数を指定した場合はその関数をスレッドで実行する
+        self.afetch = afetch_series if fetch is None else None
+        self.cache = cache
+        # load で calc シートを読み込んだ場合の派生系列の計算エンジン
+        self.calcs: Optional["CalcEngine"] = None
+        self.report = LazyReport(
+            [], build_tab=create_bokeh_graph, fetch=self.fetch, cache=cache, afetch=self.afetch
+        )
+        self.started_at = time.time()
+        self.requests_served = 0
+        self.running = True
+        self.restart_requested = False
+        self.methods: Dict[str, Callable[..., Any]] = {
+            "ping": self.ping,
+            "health": self.health,
+            "load": self.load,
+            "list_tabs": self.list_tabs,
+            "render": self.render,
+            "clear_cache": self.clear_cache,
+            "restart": self.restart,
+            "shutdown": self.shutdown,
+        }
+
+    @property
+    def pages(self) -> List["Page"]:
+        return self.report.pages
+
+    # --- RPC メソッド ---
+
+    def ping(self) -> str:
+        return "pong"
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "uptime": time.time() - self.started_at,
+            "requests_served": self.requests_served,
+            "pages": len(self.pages),
+            "cached_series": self.report.cached_series,
+            "rendered_tabs": self.report.rendered_tabs,
+            "cache_hits": self.cache.hits if self.cache else 0,
+            "cache_misses": self.cache.misses if self.cache else 0,
+        }
+
+    def load(
+        self,
+        pages: Optional[List[dict]] = None,
+        path: Optional[str] = None,
+        settings: Optional[str] = None,
+    ) -> int:
+        """Page の一覧 (JSON) または設定ファイル (Excel) を読み込みます。"""
+        from pydantic import ValidationError
+
+        from src.graph import create_bokeh_graph
+        from src.libs.calc import condition_sources, install_calcs
+        from src.libs.model.page import Page
+        from src.libs.render.lazy import LazyReport
+        from src.libs.settings import load_settings
+
+        if settings is not None:
+            compiled = load_settings(settings)
+            # calc シートの派生系列を data_source "calc" として使えるようにする
+            self.calcs = install_calcs(
+                compiled.calcs, condition_sources(compiled.pages), self.fetch
+            )
+            loaded = compiled.pages
+        else:
+            if path is not None:
+                with open(path, encoding="utf-8") as f:
+                    pages = json.load(f)
+            if pages is None:
+                raise RpcError(
+                    INVALID_PARAMS, "pages / path / settings のいずれかを指定してください"
+                )
+            try:
+                loaded = [Page.model_validate(page) for page in pages]
+            except ValidationError as e:
+                raise RpcError(INVALID_PARAMS, str(e)) from e
+        self.report = LazyReport(
+            loaded,
+            build_tab=create_bokeh_graph,
+            fetch=self.fetch,
+            cache=self.cache,
+            afetch=self.afetch,
+        )
+        return len(loaded)
+
+    def list_tabs(self) -> List[Dict[str, Any]]:
+        """タブ一覧を返します (描画は行わないため、タブ数に関係なくすぐに返る)。"""
+        return [entry.model_dump() for entry in self.report.index()]
+
+    def render(self, page: Union[int, str] = 0, tab: Optional[str] = None) -> Dict[str, Any]:
+        """ページ (tab 指定時はそのタブのみ) の json_item を返します。"""
+        from bokeh.embed import json_item
+
+        from src.graph import create_page_tabs
+
+        try:
+            if tab is not None:
+                return self.report.tab_json(page, tab)
+            target = self.pages[self.report.page_index(page)]
+        except KeyError as e:
+            raise RpcError(INVALID_PARAMS, e.args[0]) from e
+        return json_item(create_page_tabs(target, self.report.sources_for(target.tabs)))
+
+    def clear_cache(self) -> int:
+        cleared = self.report.cached_series
+        self.report.clear()
+        if self.calcs is not None:
+            # 派生系列の計算に使った系列も取得し直す
+            self.calcs.clear()
+        return cleared
+
+    def restart(self) -> str:
+        """応答を返した後にプロセスを起動し直します (読み込み済みの設定は破棄される)。"""
+        self.running = False
+        self.restart_requested = True
+        return "restarting"
+
+    def shutdown(self) -> str:
+        self.running = False
+        return "bye"
+
+    # --- プロトコル処理 ---
+
+    def handle(self, line: str) -> Optional[Dict[str, Any]]:
+        """1行分のリクエストを処理し、応答 (通知の場合は None) を返します。
+
+        id の無いリクエスト (通知) には、エラーになった場合も応答しません。
+        """
+        request_id = None
+        notification = False
+        try:
+            request = _parse_request(line)
+            if isinstance(request, dict):
+                notification = "id" not in request
+                request_id = request.get("id")
+            method, bound = self._bind(request)
+            result = method(*bound.args, **bound.kwargs)
+            self.requests_served += 1
+            if notification:
+                return None
+            return {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except RpcError as e:
+            error = {"code": e.code, "message": e.message}
+        except Exception as e:
+            error = {"code": INTERNAL_ERROR, "message": f"{type(e).__name__}: {e}"}
+        if notification:
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "error": error}
+
+    def _bind(self, request: Any) -> Tuple[Callable[..., Any], inspect.BoundArguments]:
+        """リクエストのメソッドを探し、params をメソッドの引数に対応付けます。"""
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            raise RpcError(INVALID_REQUEST, "Invalid Request")
+        method = self.methods.get(request["method"])
+        if method is None:
+            raise RpcError(METHOD_NOT_FOUND, f"Method not found: {request['method']}")
+        params = request.get("params") or {}
+        if not isinstance(params, (list, dict)):
+            raise RpcError(INVALID_PARAMS, "params は配列かオブジェクトで指定してください")
+        # 引数の対応付けの失敗だけを INVALID_PARAMS にする
+        # (メソッドの中で起きた TypeError は INTERNAL_ERROR として返す)
+        signature = inspect.signature(method)
+        try:
+            if isinstance(params, list):
+                return method, signature.bind(*params)
+            return method, signature.bind(**params)
+        except TypeError as e:
+            raise RpcError(INVALID_PARAMS, str(e)) from e
+
+
+def _parse_request(line: str) -> Any:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        raise RpcError(PARSE_ERROR, f"Parse error: {e}") from e
+
+
+def _dumps(response: Dict[str, Any]) -> str:
+    return json.dumps(response, ensure_ascii=False, separators=(",", ":"))
+
+
+class StdinLines:
+    """標準入力のファイル記述子から1行ずつ読み込む (読み込み済みで未処理の行を取り出せる)
+
+    sys.stdin は先読みしたデータを内部に持つため、プロセスを起動し直すと未処理の
+    リクエストが失われます。自前で先読みを管理し、pending を新しいプロセスに引き継ぎます。
+    """
+
+    def __init__(self, fd: int, pending: bytes = b""):
+        self.fd = fd
+        self.pending = pending
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            end = self.pending.find(b"\n")
+            if end < 0:
+                chunk = os.read(self.fd, 65536)
+                if chunk:
+                    self.pending += chunk
+                    continue
+                # 改行の無い最後の行
+                if not self.pending:
+                    return
+                end = len(self.pending)
+            line, self.pending = self.pending[: end + 1], self.pending[end + 1 :]
+            yield line.decode("utf-8")
+
+
+def serve_stdio(worker: RenderWorker, stdin: Iterable[str], stdout: TextIO) -> None:
+    """標準入出力で1行1リクエストを処理します。"""
+    for line in stdin:
+        if not line.strip():
+            continue
+        response = worker.handle(line)
+        if response is not None:
+            stdout.write(_dumps(response) + "\n")
+            stdout.flush()
+        if not worker.running:
+            break
+
+
+def serve_socket(worker: RenderWorker, host: str, port: int) -> None:
+    """ローカルソケットで1行1リクエストを処理します (接続は順番に処理する)。"""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                response = worker.handle(raw.decode("utf-8"))
+                if response is not None:
+                    self.wfile.write((_dumps(response) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                if not worker.running:
+                    break
+
+    with socketserver.TCPServer((host, port), Handler) as server:
+        while worker.running:
+            server.handle_request()
+
+
+class WorkerClient:
+    """ワーカーを子プロセスとして起動し、標準入出力で呼び出す簡易クライアント"""
+
+    def __init__(self, args: Optional[List[str]] = None):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "src.worker", *(args or [])],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            env={**os.environ, "PYTHONUNBUFFERED": "1"},
+        )
+        self._next_id = 0
+
+    def call(self, method: str, **params) -> Any:
+        self._next_id += 1
+        request = {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        response = json.loads(self.process.stdout.readline())
+        if "error" in response:
+            raise RpcError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            self.call("shutdown")
+            self.process.wait()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="常駐レンダリングワーカー")
+    parser.add_argument("--socket", help="HOST:PORT で待ち受ける (省略時は標準入出力)")
+    parser.add_argument("--pages", help="起動時に読み込む Page 一覧の JSON ファイル")
+    parser.add_argument("--settings", help="起動時に読み込む設定ファイル (Excel)")
+    parser.add_argument(
+        "--cache-dir", help="描画結果のキャッシュフォルダ (省略時はキャッシュしない)"
+    )
+    parser.add_argument("--store-dir", help="取得した系列を保存するフォルダ (省略時は保存しない)")
+    # 起動し直す前のプロセスが読み込んだ未処理のリクエスト (restart で内部的に使う)
+    parser.add_argument("--pending", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    from src.graph import use_local_store
+    from src.libs.profiling import configure_from_env, finish
+    from src.libs.render.cache import RenderCache
+
+    use_local_store(args.store_dir)
+    # 環境変数 GRAPH_PROFILE が設定されていれば終了時にトレースを書き出す
+    configure_from_env()
+    worker = RenderWorker(cache=RenderCache(args.cache_dir) if args.cache_dir else None)
+    if args.settings:
+        worker.load(settings=args.settings)
+    elif args.pages:
+        worker.load(path=args.pages)
+
+    stdin = None
+    if args.socket:
+        host, _, port = args.socket.rpartition(":")
+        serve_socket(worker, host or "127.0.0.1", int(port))
+    else:
+        pending = b""
+        if args.pending:
+            with open(args.pending, "rb") as f:
+                pending = f.read()
+            os.unlink(args.pending)
+        stdin = StdinLines(sys.stdin.fileno(), pending)
+        # 応答以外の出力 (print や警告) で標準出力の JSON が壊れないようにする
+        protocol_out = sys.stdout
+        sys.stdout = sys.stderr
+        serve_stdio(worker, stdin, protocol_out)
+
+    finish()
+    if worker.restart_requested:
+        sys.stdout.flush()
+        restart_args = list(_without_pending(sys.argv[1:]))
+        if stdin is not None and stdin.pending:
+            # 読み込み済みで未処理のリクエストは新しいプロセスが最初に処理する
+            fd, path = tempfile.mkstemp(prefix="worker-pending-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(stdin.pending)
+            restart_args += ["--pending", path]
+        # 同じ標準入出力を引き継いだまま新しいインタプリタに置き換える
+        os.execv(sys.executable, [sys.executable, "-m", "src.worker", *restart_args])
+
+
+def _without_pending(args: List[str]) -> Iterator[str]:
+    """引数から --pending (前回の起動で引き継いだファイル) を除きます。"""
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg == "--pending":
+            skip = True
+        elif not arg.startswith("--pending="):
+            yield arg
+
+
+if __name__ == "__main__":
+    main()
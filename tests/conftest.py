@@ -0,0 +1,62 @@
+from datetime import datetime
+from typing import Iterable
+
+import pytest
+
+from src.libs.fetch import concurrent
+from src.libs.model.graph import GraphCondition, XAxis, YAxis
+from src.libs.model.page import DataCondition, GraphLayout, Page, Tab
+from src.libs.source import base
+
+START = datetime(2024, 1, 1)
+END = datetime(2024, 1, 2)
+
+
+def make_tab(
+    ids: Iterable[str],
+    data_source: str = "dummy",
+    tabname: str = "tab",
+    interval: str = "hourly",
+) -> Tab:
+    """系列ごとに1つのグラフを並べたタブを作成します。"""
+    ids = list(ids)
+    return Tab(
+        tabname=tabname,
+        tabtitle=f"{tabname} title",
+        layout=GraphLayout(tabname=tabname, columns=1, rows=len(ids)),
+        data_conditions=[
+            DataCondition(
+                id=series_id,
+                tabname=tabname,
+                unit="unit",
+                start_date=START,
+                end_date=END,
+                interval=interval,
+                data_source=data_source,
+                graph_color="blue",
+            )
+            for series_id in ids
+        ],
+        graph_conditions=[
+            GraphCondition(
+                id=f"graph-{series_id}",
+                tabname=tabname,
+                x_axis=XAxis(param="date", unit="datetime", range=(0, 1), label="Date"),
+                y_axes=[
+                    YAxis(param="value", unit="u", range=(0, 100), color="blue", label=series_id)
+                ],
+            )
+            for series_id in ids
+        ],
+    )
+
+
+def make_page(*tabs: Tab, title: str = "page") -> Page:
+    return Page(page_title=title, output_file_name=title, tabs=list(tabs))
+
+
+@pytest.fixture
+def isolated_sources(monkeypatch):
+    """テスト中に登録した取得先・取得方法を終了時に元に戻す"""
+    monkeypatch.setattr(base, "_registry", dict(base._registry))
+    monkeypatch.setattr(concurrent, "_policies", dict(concurrent._policies))
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+
+import pytest
+
+from src.batch import render_pages
+from src.libs.fetch.concurrent import FetchFailedWarning
+from src.libs.render.cache import RenderCache
+from src.libs.source import DataSourceError, SeriesSource, register_source
+
+from .conftest import END, START, make_page, make_tab
+
+
+class CrashingSource(SeriesSource):
+    """ID が "crash" の系列を取得するとプロセスごと終了する取得先"""
+
+    def fetch(self, request):
+        if request.id == "crash":
+            os._exit(1)
+        x = np.arange(np.datetime64(START, "ms"), np.datetime64(END, "ms"), np.timedelta64(1, "h"))
+        return x, np.arange(len(x), dtype=np.float64)
+
+
+class BrokenTableSource(CrashingSource):
+    """ID が "missing" の系列は更新状況も取得もできない取得先 (テーブルが無い DB など)"""
+
+    def fetch(self, request):
+        if request.id == "missing":
+            raise DataSourceError("Database error: table not found")
+        return super().fetch(request)
+
+    def watermark(self, request):
+        if request.id == "missing":
+            raise DataSourceError("Database error: table not found")
+        return "1"
+
+
+def test_dead_worker_fails_only_its_page(tmp_path, isolated_sources):
+    # fork したワーカーは登録済みの取得先を引き継ぐ
+    register_source("crashing", CrashingSource())
+    pages = [
+        make_page(make_tab([series_id], data_source="crashing"), title=f"page{i}")
+        for i, series_id in enumerate(["a", "b", "crash", "c", "d", "e"])
+    ]
+
+    results = render_pages(pages, str(tmp_path), fmt="json", jobs=2)
+
+    assert [result.page for result in results] == list(range(len(pages)))
+    assert [result.ok for result in results] == [True, True, False, True, True, True]
+    assert "BrokenProcessPool" in results[2].error
+    assert all(os.path.exists(result.path) for result in results if result.ok)
+
+
+def test_serial_render_writes_every_page(tmp_path):
+    pages = [make_page(make_tab(["a"]), title=f"page{i}") for i in range(2)]
+
+    results = render_pages(pages, str(tmp_path), fmt="json", jobs=1)
+
+    assert all(result.ok and result.size > 0 for result in results)
+
+
+def test_unreadable_watermark_fails_only_its_page(tmp_path, isolated_sources):
+    register_source("broken-table", BrokenTableSource())
+    pages = [
+        make_page(make_tab([series_id], data_source="broken-table"), title=f"page{i}")
+        for i, series_id in enumerate(["a", "missing", "b"])
+    ]
+    cache = RenderCache(str(tmp_path / "cache"))
+
+    with pytest.warns(FetchFailedWarning):
+        results = render_pages(
+            pages, str(tmp_path), fmt="json", jobs=2, cache=cache, shared_series=True
+        )
+
+    assert [result.ok for result in results] == [True, False, True]
+    assert "DataSourceError" in results[1].error
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from src.libs.calc import CalcEngine, CalcError, CalcExpression, install_calcs
+from src.libs.calc.engine import _rolling, align
+from src.libs.fetch.planner import FetchRequest
+from src.libs.model.calc import CalcDefinition
+from src.libs.source import SeriesSource, register_source
+from src.worker import RenderWorker
+
+from .conftest import END, START
+
+
+def expression(text: str) -> CalcExpression:
+    return CalcExpression(CalcDefinition(id="calc1", expression=text))
+
+
+def request(series_id: str = "calc1") -> FetchRequest:
+    return FetchRequest(
+        data_source="calc", id=series_id, interval="hourly", start_date=START, end_date=END
+    )
+
+
+class CountingSource(SeriesSource):
+    """取得回数を数え、version を更新状況として返す取得先"""
+
+    def __init__(self):
+        self.fetches = 0
+        self.version = 1
+
+    def fetch(self, request):
+        self.fetches += 1
+        x = np.array(["2024-01-01T00", "2024-01-01T01"], dtype="datetime64[ms]")
+        return x, np.array([1.0, 2.0]) * self.version
+
+    def watermark(self, request):
+        return str(self.version)
+
+
+@pytest.fixture
+def raw(isolated_sources):
+    source = CountingSource()
+    register_source("raw", source)
+    return source
+
+
+def make_engine(source, *definitions, **ids):
+    definitions = [CalcDefinition(id=name, expression=text) for name, text in definitions]
+    return CalcEngine(definitions, source.fetch, {"a": "raw", "b": "raw", **ids})
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "abs(a, b)",
+        "sqrt()",
+        "max()",
+        "diff(a, 1)",
+        "rolling_mean(a)",
+        "rolling_mean(a, b)",
+        "rolling_sum(a, 2.5)",
+        "rolling_sum(a, 0)",
+        "rolling_mean(a, True)",
+        "abs(*a)",
+        "abs(x=a)",
+        "open(a)",
+        "a.real",
+    ],
+)
+def test_rejects_invalid_calls(text):
+    with pytest.raises(CalcError):
+        expression(text)
+
+
+def test_extra_argument_does_not_overwrite_dependency():
+    # 以前は np.abs(a, b) として評価され、b が out= として書き換えられていた
+    with pytest.raises(CalcError, match="abs"):
+        expression("abs(a, b)")
+
+
+def test_evaluates_functions_and_operators():
+    calc = expression("max(a, {b-1}) + rolling_sum(a, 2) - -1")
+    values = {"a": np.array([1.0, 5.0, 2.0]), "b-1": np.array([3.0, np.nan, 4.0])}
+
+    result = calc.evaluate(values)
+
+    assert calc.dependencies == ["a", "b-1"]
+    np.testing.assert_array_equal(result, [np.nan, 12.0, 12.0])
+
+
+def test_rolling_skips_missing_values():
+    y = np.array([1.0, np.nan, 3.0, np.nan, np.nan])
+
+    np.testing.assert_array_equal(_rolling(y, 2, mean=True), [np.nan, 1.0, 3.0, 3.0, np.nan])
+    np.testing.assert_array_equal(_rolling(y, 2, mean=False), [np.nan, 1.0, 3.0, 3.0, np.nan])
+    assert np.isnan(_rolling(y[:1], 2, mean=True)).all()
+
+
+def test_align_takes_latest_value_as_of_each_time():
+    x_target = np.array([0, 10, 20, 30], dtype="datetime64[ms]")
+    x = np.array([5, 20], dtype="datetime64[ms]")
+
+    result = align(x_target, x, np.array([1.0, 2.0]))
+
+    np.testing.assert_array_equal(result, [np.nan, 1.0, 2.0, 2.0])
+    assert np.isnan(align(x_target, x[:0], np.array([]))).all()
+
+
+def test_engine_fetches_shared_dependency_once(raw):
+    engine = make_engine(raw, ("double", "a * 2"), ("total", "double + a"))
+
+    x, y = engine.series("total", request("total"))
+
+    np.testing.assert_array_equal(y, [3.0, 6.0])
+    assert raw.fetches == 1
+    engine.series("total", request("total"))
+    assert raw.fetches == 1
+
+
+def test_engine_refetches_when_watermark_changes(raw):
+    engine = make_engine(raw, ("double", "a * 2"))
+    engine.series("double", request("double"))
+
+    raw.version = 2
+    x, y = engine.series("double", request("double"))
+
+    np.testing.assert_array_equal(y, [4.0, 8.0])
+    assert raw.fetches == 2
+
+
+def test_engine_rejects_cycles(raw):
+    with pytest.raises(CalcError, match="循環"):
+        make_engine(raw, ("p", "q + 1"), ("q", "p + 1"))
+
+
+def test_worker_clear_cache_clears_calc_engine(raw):
+    worker = RenderWorker(fetch=raw.fetch)
+    worker.calcs = install_calcs(
+        [CalcDefinition(id="double", expression="a * 2")], {"a": "raw"}, raw.fetch
+    )
+    # 更新状況が分からない取得先は clear_cache まで保持した系列を返す
+    raw.watermark = lambda request: None
+    worker.calcs.series("double", request("double"))
+    worker.calcs.series("double", request("double"))
+    assert raw.fetches == 1
+
+    worker.clear_cache()
+    worker.calcs.series("double", request("double"))
+
+    assert raw.fetches == 2
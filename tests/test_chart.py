@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from src.libs.chart.config import FigureConfig
+from src.libs.chart.schema import ChartData
+
+
+def chart_data(y) -> ChartData:
+    return ChartData(x=[f"c{i}" for i in range(len(y))], y=y, colors=["red"] * len(y))
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint32, np.uint64, np.int64, np.float64])
+def test_top_n_orders_by_value_for_every_dtype(dtype):
+    data = chart_data(np.array([3, 250, 0, 7, 250, 1], dtype=dtype))
+
+    top = data.top_n(3)
+
+    assert list(top.x) == ["c1", "c4", "c3", "Other"]
+    assert list(top.y) == [250, 250, 7, 4]
+
+
+def test_categories_are_not_limited_by_default():
+    assert FigureConfig().max_categories is None
@@ -0,0 +1,166 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.libs.fetch.concurrent import (
+    FetchFailedWarning,
+    FetchPolicy,
+    execute_plan_concurrent,
+    set_fetch_policy,
+)
+from src.libs.fetch.planner import plan_conditions
+from src.libs.render.lazy import LazyReport
+from src.libs.source import DataSourceError, HttpSource, SeriesSource, register_source
+from src.libs.source.stub import StubHistorian
+
+from .conftest import END, START, make_page, make_tab
+
+HISTORIAN = "historian"
+
+
+@pytest.fixture
+def stub(isolated_sources):
+    with StubHistorian(fail_ids={"broken"}, flaky_ids={"flaky"}) as server:
+        register_source(HISTORIAN, HttpSource(server.url))
+        yield server
+
+
+def plan_for(*ids, data_source=HISTORIAN):
+    return plan_conditions(make_tab(ids, data_source=data_source).data_conditions)
+
+
+def afetch_from(data_source):
+    from src.libs.source import resolve_source
+
+    return resolve_source(data_source).afetch
+
+
+def test_partial_results_keep_successful_series(stub):
+    set_fetch_policy(HISTORIAN, FetchPolicy(retries=0))
+    ok, broken = make_tab(["ok", "broken"], data_source=HISTORIAN).data_conditions
+
+    with pytest.warns(FetchFailedWarning) as record:
+        sources = execute_plan_concurrent(plan_conditions([ok, broken]), afetch_from(HISTORIAN))
+
+    assert [request.id for request in sources.failures] == ["broken"]
+    assert "TransientSourceError" in next(iter(sources.failures.values()))
+    assert len(sources.series_for(ok)[0]) == 25
+    assert len(sources.series_for(broken)[0]) == 0
+    # 警告は asyncio の内部ではなく取得計画を実行した呼び出し元を指す
+    assert record[0].filename == __file__
+
+
+def test_partial_disabled_raises(stub):
+    set_fetch_policy(HISTORIAN, FetchPolicy(retries=0, partial=False))
+    with pytest.raises(DataSourceError):
+        execute_plan_concurrent(plan_for("ok", "broken"), afetch_from(HISTORIAN))
+
+
+def test_retries_transient_errors(stub):
+    set_fetch_policy(HISTORIAN, FetchPolicy(retries=1, backoff=0))
+    sources = execute_plan_concurrent(plan_for("flaky"), afetch_from(HISTORIAN))
+
+    assert not sources.failures
+    # 初回は 503 で失敗し、再試行で取得できる
+    assert stub.requests == 2
+
+
+def test_does_not_retry_client_errors(stub, isolated_sources):
+    # 存在しないパスは 404 を返す (設定の誤りは何度送っても同じ結果になる)
+    register_source("wrong-path", HttpSource(stub.url, path="/missing/{id}"))
+    set_fetch_policy("wrong-path", FetchPolicy(retries=3, backoff=0))
+
+    with pytest.warns(FetchFailedWarning):
+        sources = execute_plan_concurrent(
+            plan_for("ok", data_source="wrong-path"), afetch_from("wrong-path")
+        )
+
+    assert "DataSourceError" in next(iter(sources.failures.values()))
+    assert stub.requests == 0
+
+
+def test_timeout_is_retried_then_reported(stub):
+    stub.delay = 0.5
+    set_fetch_policy(HISTORIAN, FetchPolicy(timeout=0.1, retries=1, backoff=0))
+
+    started = time.perf_counter()
+    with pytest.warns(FetchFailedWarning):
+        sources = execute_plan_concurrent(plan_for("ok"), afetch_from(HISTORIAN))
+
+    assert "TimeoutError" in next(iter(sources.failures.values()))
+    assert stub.requests == 2
+    assert time.perf_counter() - started < 1.5
+
+
+class SlowSource(SeriesSource):
+    """同時に実行中の fetch の数を記録する遅い取得先"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, request):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            return np.array([START], dtype="datetime64[ms]"), np.array([1.0])
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def test_timed_out_thread_keeps_concurrency_slot(isolated_sources):
+    source = SlowSource(delay=0.3)
+    register_source("slow", source)
+    set_fetch_policy("slow", FetchPolicy(max_concurrency=1, timeout=0.05, retries=1, backoff=0))
+
+    with pytest.warns(FetchFailedWarning):
+        sources = execute_plan_concurrent(plan_for("a", "b", data_source="slow"), source.afetch)
+
+    assert len(sources.failures) == 2
+    # タイムアウト後もスレッドが終わるまで次の取得は始まらない
+    assert source.max_active == 1
+    assert source.active == 0
+
+
+def test_lazy_report_renders_partial_tab(stub):
+    from src.graph import afetch_series, create_bokeh_graph, fetch_series
+
+    set_fetch_policy(HISTORIAN, FetchPolicy(retries=0))
+    report = LazyReport(
+        [make_page(make_tab(["ok", "broken"], data_source=HISTORIAN))],
+        build_tab=create_bokeh_graph,
+        fetch=fetch_series,
+        afetch=afetch_series,
+    )
+
+    with pytest.warns(FetchFailedWarning):
+        item = report.tab_json(0, "tab")
+
+    assert item["doc"]["roots"]
+    # 失敗した系列を含むタブはメモ化せず、次の要求で取得し直す
+    assert report.rendered_tabs == 0
+    assert report.cached_series == 1
+
+
+def test_lazy_report_fetches_concurrently(isolated_sources):
+    source = SlowSource(delay=0.2)
+    register_source("slow", source)
+    set_fetch_policy("slow", FetchPolicy(max_concurrency=4))
+    report = LazyReport(
+        [make_page(make_tab(["a", "b", "c", "d"], data_source="slow"))],
+        build_tab=lambda tab, sources: sources,
+        fetch=source.fetch,
+    )
+
+    sources = report.sources_for(report.pages[0].tabs)
+
+    assert source.max_active == 4
+    assert not sources.failures
+    assert all(request.end_date == END for request in sources.plan.requests)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from src.libs.model.graph import Downsample
+from src.libs.series.downsample import downsample, lttb_indices, minmax_indices
+
+N = 10_000
+SPIKE = 4_321
+
+
+def noisy_series():
+    """ゆるやかな波形に1点だけ突発値を入れた1秒間隔の系列"""
+    x = np.datetime64("2024-01-01T00:00:00", "ms") + np.arange(N) * np.timedelta64(1, "s")
+    y = np.sin(np.arange(N) / 500) + np.random.default_rng(0).normal(0, 0.01, N)
+    y[SPIKE] = 10.0
+    return x, y
+
+
+def test_minmax_keeps_peaks_and_ends():
+    _, y = noisy_series()
+    y[SPIKE + 1000] = -10.0
+
+    indices = minmax_indices(y, 200)
+
+    assert len(indices) <= 200 + 2
+    assert np.all(np.diff(indices) > 0)
+    assert indices[0] == 0 and indices[-1] == N - 1
+    assert {SPIKE, SPIKE + 1000} <= set(indices.tolist())
+
+
+def test_minmax_skips_missing_values():
+    y = np.array([np.nan, 1.0, 5.0, np.nan, -3.0, 2.0, np.nan, np.nan])
+
+    indices = minmax_indices(y, 4)
+
+    assert {2, 4} <= set(indices.tolist())
+    assert {1, 5} & set(indices.tolist())
+
+
+def test_lttb_returns_requested_points_with_spike():
+    x, y = noisy_series()
+
+    indices = lttb_indices(x, y, 300)
+
+    assert len(indices) == 300
+    assert np.all(np.diff(indices) > 0)
+    assert indices[0] == 0 and indices[-1] == N - 1
+    assert SPIKE in indices
+
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_downsample_keeps_original_points(method):
+    x, y = noisy_series()
+
+    small_x, small_y = downsample(x[:50], y[:50], 100, method)
+    np.testing.assert_array_equal(small_x, x[:50])
+    np.testing.assert_array_equal(small_y, y[:50])
+
+    down_x, down_y = downsample(x, y, 100, method)
+    assert len(down_x) <= 102
+    np.testing.assert_array_equal(down_y, y[np.searchsorted(x, down_x)])
+
+
+def test_downsample_rejects_unknown_method():
+    x, y = noisy_series()
+    with pytest.raises(ValueError):
+        downsample(x, y, 100, "mean")
+
+
+def test_points_per_pixel_between_two_and_four():
+    assert Downsample(screen_width=1000, points_per_pixel=3).target_points(columns=2) == 1500
+    for value in (1, 4.5):
+        with pytest.raises(ValidationError):
+            Downsample(points_per_pixel=value)
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import duckdb
+import numpy as np
+import pytest
+
+from src.libs.fetch.planner import FetchRequest
+from src.libs.source.duck import ConnectionPool, DuckDBSource
+from src.libs.source.rollup import RollupJob
+
+
+def insert_hours(database: str, start: str, hours: int, value: float) -> None:
+    with duckdb.connect(database) as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS series (id VARCHAR, timestamp TIMESTAMP, value DOUBLE)"
+        )
+        conn.execute(
+            "INSERT INTO series SELECT 'a', ?::TIMESTAMP + to_minutes(30 * i), ? + i"
+            " FROM range(?) t(i)",
+            [start, value, hours * 2],
+        )
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "series.duckdb")
+    insert_hours(path, "2024-01-01", 48, 0.0)
+    return path
+
+
+def request(aggregation: str = "mean", interval: str = "daily", **dates) -> FetchRequest:
+    return FetchRequest(
+        data_source="duck",
+        id="a",
+        interval=interval,
+        aggregation=aggregation,
+        start_date=dates.get("start", datetime(2024, 1, 1, 6)),
+        end_date=dates.get("end", datetime(2024, 1, 5)),
+    )
+
+
+def raw_aggregate(database: str, req: FetchRequest):
+    """集計テーブルを使わずに集計した結果 (比較用)"""
+    pool = ConnectionPool()
+    try:
+        return DuckDBSource(database, id_column="id", pool=pool).fetch(req)
+    finally:
+        pool.close()
+
+
+@pytest.mark.parametrize("aggregation", ["mean", "min", "max", "last"])
+def test_rollup_reads_tail_appended_after_refresh(database, aggregation):
+    pool = ConnectionPool()
+    source = DuckDBSource(database, id_column="id", pool=pool)
+    RollupJob(database, intervals=["daily"], pool=pool).refresh()
+    # 更新後に追記した行 (最後のバケットの続きと新しいバケット) は生データから集計する
+    pool.release(database)
+    insert_hours(database, "2024-01-02 12:15", 24, 100.0)
+
+    req = request(aggregation)
+    assert "series__daily" in source.build_query(req)[0]
+    x, y = source.fetch(req)
+    pool.close()
+    expected_x, expected_y = raw_aggregate(database, req)
+
+    np.testing.assert_array_equal(x, expected_x)
+    np.testing.assert_allclose(y, expected_y)
+    assert len(x) == 3
+
+
+def test_refresh_invalidates_rollup_list(database):
+    pool = ConnectionPool()
+    source = DuckDBSource(database, id_column="id", pool=pool)
+    assert source.rollup_tables() == set()
+
+    RollupJob(database, intervals=["daily"], pool=pool).refresh()
+
+    assert source.rollup_tables() == {"series__daily"}
+    pool.close()
+
+
+def test_watermark_covers_whole_buckets(database):
+    pool = ConnectionPool()
+    source = DuckDBSource(database, id_column="id", pool=pool)
+    # 期間 (2024-01-01 06:00 ~) の外だが、最初のバケットに含まれる行の変化も検出する
+    before = source.watermark(request())
+    pool.release(database)
+    with duckdb.connect(database) as conn:
+        conn.execute("UPDATE series SET value = -1 WHERE timestamp = '2024-01-01 00:00'")
+
+    assert source.watermark(request()) != before
+    pool.close()
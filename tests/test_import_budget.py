@@ -0,0 +1,15 @@
+import pytest
+
+from src.benchmark import IMPORT_BUDGETS, measure_import
+
+# 計測の揺らぎで落ちないよう、各モジュールは数回 import して最も速い時間を使う
+REPEAT = 3
+
+
+@pytest.mark.parametrize("module", list(IMPORT_BUDGETS))
+def test_import_stays_within_budget(module):
+    budget = IMPORT_BUDGETS[module]
+    probes = [measure_import(module) for _ in range(REPEAT)]
+
+    assert not set(probes[-1]["loaded"]) & set(budget.forbidden)
+    assert min(probe["seconds"] for probe in probes) <= budget.seconds
@@ -0,0 +1,85 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import numpy as np
+from bokeh.models import ColumnDataSource
+
+from src.libs.render.interactive import PyramidStore, _on_ranges_update, create_interactive_graph
+
+from .conftest import END, START, make_page, make_tab
+
+
+class RecordingFetch:
+    """取得要求の期間に1時間間隔の系列を返し、受け取った要求を記録する"""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        x = np.arange(
+            np.datetime64(request.start_date, "ms"),
+            np.datetime64(request.end_date, "ms") + np.timedelta64(1, "ms"),
+            np.timedelta64(1, "h"),
+        )
+        return x, np.arange(len(x), dtype=np.float64)
+
+
+def shifted_tab(tabname: str, shift: timedelta):
+    tab = make_tab(["a"], tabname=tabname)
+    conditions = [
+        condition.model_copy(update={"start_date": START + shift, "end_date": END + shift})
+        for condition in tab.data_conditions
+    ]
+    return tab.model_copy(update={"data_conditions": conditions})
+
+
+def sources_of(grid):
+    return list(grid.select({"type": ColumnDataSource}))
+
+
+def test_initial_range_uses_condition_window():
+    early = make_tab(["a"], tabname="early")
+    late = shifted_tab("late", timedelta(hours=12))
+    fetch = RecordingFetch()
+    store = PyramidStore([make_page(early, late)], fetch)
+
+    grid = create_interactive_graph(late, store)
+
+    # 期間の重なる2つのタブはまとめて1度だけ取得する
+    assert len(fetch.requests) == 1
+    assert fetch.requests[0].end_date == END + timedelta(hours=12)
+    (source,) = sources_of(grid)
+    x = source.data["x"]
+    assert x[0] == np.datetime64(START + timedelta(hours=12), "ms")
+    assert x[-1] == np.datetime64(END + timedelta(hours=12), "ms")
+
+    (source,) = sources_of(create_interactive_graph(early, store))
+    assert source.data["x"][-1] == np.datetime64(END, "ms")
+    assert len(fetch.requests) == 1
+
+
+def test_zoom_out_stays_inside_condition_window():
+    early = make_tab(["a"], tabname="early")
+    late = shifted_tab("late", timedelta(hours=12))
+    store = PyramidStore([make_page(early, late)], RecordingFetch())
+    (source,) = sources_of(create_interactive_graph(early, store))
+    sources = [(source, store.pyramid_for(early.data_conditions[0]))]
+
+    event = SimpleNamespace(
+        x0=np.datetime64(START, "ms").astype(np.int64),
+        x1=np.datetime64(END + timedelta(days=1), "ms").astype(np.int64),
+    )
+    _on_ranges_update(sources, 2000, event)
+
+    assert source.data["x"][-1] == np.datetime64(END, "ms")
+
+
+def test_tab_without_data_conditions():
+    tab = make_tab(["a"]).model_copy(update={"data_conditions": []})
+    fetch = RecordingFetch()
+
+    grid = create_interactive_graph(tab, PyramidStore([make_page(tab)], fetch))
+
+    assert grid is not None
+    assert fetch.requests == []
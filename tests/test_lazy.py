@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from src.libs.fetch.concurrent import FetchFailedWarning
+from src.libs.render.cache import RenderCache
+from src.libs.render.lazy import LazyReport
+from src.libs.source import DataSourceError, SeriesSource, register_source, resolve_source
+
+from .conftest import START, make_page, make_tab
+
+
+class VersionedSource(SeriesSource):
+    """version を更新状況として返し、取得回数を数える取得先 (broken=True では何もできない)"""
+
+    def __init__(self):
+        self.version = 1
+        self.fetches = 0
+        self.broken = False
+
+    def fetch(self, request):
+        if self.broken:
+            raise DataSourceError("Database error: table not found")
+        self.fetches += 1
+        return np.array([START], dtype="datetime64[ms]"), np.array([float(self.version)])
+
+    def watermark(self, request):
+        if self.broken:
+            raise DataSourceError("Database error: table not found")
+        return str(self.version)
+
+
+@pytest.fixture
+def source(isolated_sources):
+    source = VersionedSource()
+    register_source("versioned", source)
+    return source
+
+
+def fetch(request):
+    return resolve_source(request.data_source).fetch(request)
+
+
+def make_report(cache=None):
+    from src.graph import create_bokeh_graph
+
+    page = make_page(make_tab(["a"], data_source="versioned"))
+    return LazyReport([page], build_tab=create_bokeh_graph, fetch=fetch, cache=cache)
+
+
+def render(report):
+    return report.tab_json(0, "tab")
+
+
+def test_memoized_tab_is_rendered_again_when_data_changes(source):
+    report = make_report()
+
+    first = render(report)
+    assert render(report) is first
+    assert source.fetches == 1
+
+    source.version = 2
+    second = render(report)
+
+    assert second is not first
+    assert source.fetches == 2
+    assert report.rendered_tabs == 1
+
+
+def test_failing_watermark_renders_empty_series(source, tmp_path):
+    report = make_report(cache=RenderCache(str(tmp_path)))
+    source.broken = True
+
+    with pytest.warns(FetchFailedWarning):
+        item = render(report)
+
+    assert item["doc"]["roots"]
+    assert report.rendered_tabs == 0
+    assert report.cached_series == 0
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import timedelta
+
+import numpy as np
+import pytest
+from bokeh.document import Document
+
+from src.libs.fetch.concurrent import FetchPolicy, set_fetch_policy
+from src.libs.render.live import LiveOptions, LiveTab, make_live_document
+from src.libs.source import TransientSourceError
+
+from .conftest import END, make_page, make_tab
+
+OPTIONS = LiveOptions(lookback=timedelta(0))
+
+
+class ClockFetch:
+    """要求の期間の毎正時の行 (値は時刻から決まる) を返し、受け取った要求を記録する
+
+    fail に指定した回数だけ、最初の取得を TransientSourceError で失敗させます。
+    """
+
+    def __init__(self, fail: int = 0):
+        self.requests = []
+        self.fail = fail
+
+    def __call__(self, request):
+        self.requests.append(request)
+        if self.fail:
+            self.fail -= 1
+            raise TransientSourceError("503 Service Unavailable")
+        x = np.arange(
+            np.datetime64(request.start_date, "h"),
+            np.datetime64(request.end_date, "h") + np.timedelta64(1, "h"),
+            np.timedelta64(1, "h"),
+        )
+        return x.astype("datetime64[ms]"), x.astype(np.float64)
+
+
+def build_tab(tab, sources):
+    from src.graph import create_bokeh_graph
+
+    return create_bokeh_graph(tab, sources)
+
+
+def make_live_tab(fetch, data_source="dummy"):
+    tab = make_tab(["a", "b"], data_source=data_source)
+    return LiveTab(tab, fetch, build_tab, OPTIONS, now=END)
+
+
+def test_only_activated_tabs_are_built():
+    fetch = ClockFetch()
+    page = make_page(make_tab(["a"], tabname="first"), make_tab(["b"], tabname="second"))
+    doc = Document()
+
+    make_live_document([page], fetch, build_tab, OPTIONS)(doc)
+
+    assert [request.id for request in fetch.requests] == ["a"]
+    (root,) = doc.roots
+    inner = root.tabs[0].child
+    assert inner.tabs[1].child.children == []
+
+    inner.active = 1
+    inner.active = 0
+
+    assert [request.id for request in fetch.requests] == ["a", "b"]
+    assert len(inner.tabs[1].child.children) == 1
+
+
+def test_poll_streams_new_rows():
+    live = make_live_tab(ClockFetch())
+
+    updates = asyncio.run(live.poll(END + timedelta(hours=2)))
+
+    for patches, (x, y) in updates:
+        assert patches == []
+        assert x[0] == np.datetime64(END + timedelta(hours=1), "ms")
+        assert len(x) == 2
+    assert live.apply(None, updates) == 4
+    assert live.series[0].watermark == np.datetime64(END + timedelta(hours=2), "ms")
+
+
+def test_poll_retries_with_fetch_policy(isolated_sources):
+    set_fetch_policy("flaky", FetchPolicy(retries=1, backoff=0))
+    fetch = ClockFetch()
+    live = make_live_tab(fetch, data_source="flaky")
+    fetch.fail = 1
+
+    updates = asyncio.run(live.poll(END + timedelta(hours=1)))
+
+    assert [len(x) for _, (x, _) in updates] == [1, 1]
+    # 表示開始時の2回と、更新時の2系列 + 再試行1回
+    assert len(fetch.requests) == 2 + 3
+
+
+@pytest.mark.parametrize("partial", [True, False])
+def test_failed_poll_leaves_series_unchanged(isolated_sources, partial):
+    set_fetch_policy("flaky", FetchPolicy(retries=0, partial=partial))
+    fetch = ClockFetch()
+    live = make_live_tab(fetch, data_source="flaky")
+    fetch.fail = 2
+
+    updates = asyncio.run(live.poll(END + timedelta(hours=1)))
+
+    assert [len(x) for _, (x, _) in updates] == [0, 0]
+    assert live.apply(None, updates) == 0
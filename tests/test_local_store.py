@@ -0,0 +1,110 @@
+import multiprocessing
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.libs.fetch.planner import FetchRequest
+from src.libs.series.interval import bucket_start
+from src.libs.store import LocalStore
+from src.libs.store.local import SeriesKeyStore
+
+
+def hourly(request: FetchRequest):
+    """区間の開始時刻ごとに1点を返す取得関数"""
+    start = bucket_start(np.datetime64(request.start_date, "ms"), request.interval)
+    x = np.arange(start, np.datetime64(request.end_date, "ms") + 1, np.timedelta64(1, "h"))
+    return x, np.ones(len(x))
+
+
+class Upstream:
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        return hourly(request)
+
+
+def make_request(start: datetime, end: datetime, interval: str = "hourly") -> FetchRequest:
+    return FetchRequest(
+        data_source="test", id="a", interval=interval, start_date=start, end_date=end
+    )
+
+
+def test_fetches_only_gaps(tmp_path):
+    store, upstream = LocalStore(str(tmp_path)), Upstream()
+    store.fetch(make_request(datetime(2024, 1, 1), datetime(2024, 1, 2)), upstream)
+    x, _ = store.fetch(make_request(datetime(2024, 1, 1, 12), datetime(2024, 1, 3)), upstream)
+
+    assert len(upstream.requests) == 2
+    assert upstream.requests[1].start_date == datetime(2024, 1, 2)
+    assert x[0] == np.datetime64("2024-01-01T12:00") and x[-1] == np.datetime64("2024-01-03")
+
+
+def test_start_is_aligned_to_bucket(tmp_path):
+    store, upstream = LocalStore(str(tmp_path)), Upstream()
+    store.fetch(make_request(datetime(2024, 1, 1), datetime(2024, 1, 2)), upstream)
+    # 10:30 から始まる要求の最初の集計値は 10:00 の区間 (取得済み)
+    x, _ = store.fetch(make_request(datetime(2024, 1, 1, 10, 30), datetime(2024, 1, 2)), upstream)
+
+    assert len(upstream.requests) == 1
+    assert x[0] == np.datetime64("2024-01-01T10:00")
+
+
+def test_newest_bucket_is_always_refetched(tmp_path):
+    store, upstream = LocalStore(str(tmp_path)), Upstream()
+    now = datetime.now()
+    request = make_request(now - timedelta(hours=5), now + timedelta(hours=1))
+
+    first, _ = store.fetch(request, upstream)
+    second, _ = store.fetch(request, upstream)
+
+    current = bucket_start(np.datetime64(now, "ms"), "hourly")
+    assert len(upstream.requests) == 2
+    # 2回目は集計中の区間から先だけを取得し直す (ギャップは取得済みの期間の端から始まる)
+    assert np.datetime64(upstream.requests[1].start_date, "ms") == current - np.timedelta64(1, "ms")
+    assert (first == second).all()
+    covered_end = store.key_store(request).covered()[-1][1]
+    assert covered_end < current
+
+
+def test_compact_keeps_recent_unknown_files(tmp_path):
+    store = SeriesKeyStore(tmp_path / "key")
+    x = np.arange(np.datetime64("2024-01-01"), np.datetime64("2024-01-03"), np.timedelta64(1, "D"))
+    for day in range(2):
+        window = (x[day].astype("datetime64[ms]"), x[day].astype("datetime64[ms]"))
+        store.add([(x[day : day + 1], np.array([float(day)]))], [window])
+    # 他のプロセスが書き込んだばかりのセグメント (まだマニフェストに載っていない)
+    (store.directory / "other.arrow").write_bytes(b"")
+    before = store.read()
+
+    assert store.compact() == 0
+    assert store.segment_count() == 1
+    assert (store.directory / "other.arrow").exists()
+    np.testing.assert_array_equal(store.read()[1], before[1])
+
+    # 猶予が過ぎたら置き換えたセグメントと不明なファイルを削除する
+    assert store.compact(grace=0) == 3
+    names = {path.name for path in store.directory.iterdir()}
+    assert names == {"manifest.json", "manifest.lock", store.read_manifest()["segments"][0]["name"]}
+
+
+def _add_day(directory: str, day: int) -> None:
+    store = SeriesKeyStore(Path(directory))
+    t = np.datetime64("2024-01-01", "ms") + np.timedelta64(day, "D")
+    store.add([(np.array([t]), np.array([float(day)]))], [(t, t)])
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="fork only")
+def test_concurrent_processes_do_not_lose_updates(tmp_path):
+    days = 16
+    context = multiprocessing.get_context("fork")
+    with context.Pool(4) as pool:
+        pool.starmap(_add_day, [(str(tmp_path), day) for day in range(days)])
+
+    store = SeriesKeyStore(tmp_path)
+    assert store.segment_count() == days
+    _, y = store.read()
+    assert sorted(y) == [float(day) for day in range(days)]
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from src.libs.profiling.tracer import Tracer
+
+
+@pytest.fixture
+def tracer():
+    tracer = Tracer()
+    tracer.enable(memory=True)
+    yield tracer
+    tracer.disable()
+
+
+def events_by_name(tracer):
+    return {event["name"]: event for event in tracer.events}
+
+
+def test_nested_span_peak_is_included_in_parent(tracer):
+    with tracer.span("outer"):
+        with tracer.span("inner"):
+            block = bytearray(8 * 2**20)
+        del block
+
+    events = events_by_name(tracer)
+    assert events["inner"]["args"]["peak_mb"] >= 8
+    assert events["outer"]["args"]["peak_mb"] >= events["inner"]["args"]["peak_mb"]
+
+
+def test_concurrent_tasks_have_separate_span_stacks(tracer):
+    depths = {}
+
+    async def fetch(name: str) -> None:
+        with tracer.span(name, "series"):
+            # 他のタスクの span が開いている間に切り替わる
+            await asyncio.sleep(0)
+            depths[name] = len(tracer._stack.get())
+            await asyncio.sleep(0)
+
+    async def page() -> None:
+        with tracer.span("page"):
+            await asyncio.gather(fetch("a"), fetch("b"), fetch("c"))
+        depths["page"] = len(tracer._stack.get())
+
+    asyncio.run(page())
+
+    # 各タスクの span は page の直下 (他のタスクの span の子にならない)
+    assert depths == {"a": 2, "b": 2, "c": 2, "page": 0}
+    assert sorted(events_by_name(tracer)) == ["a", "b", "c", "page"]
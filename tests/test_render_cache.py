@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from src.libs.render import cache as cache_module
+from src.libs.render.cache import RenderCache
+
+
+def stored(directory: Path):
+    return sorted(path.name for path in directory.glob("*/*"))
+
+
+def total_size(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.glob("*/*"))
+
+
+def test_put_scans_directory_only_when_needed(tmp_path, monkeypatch):
+    cache = RenderCache(str(tmp_path), max_bytes=1000)
+    scans = []
+    evict = RenderCache.evict
+    monkeypatch.setattr(RenderCache, "evict", lambda self: scans.append(1) or evict(self))
+
+    for i in range(5):
+        cache.put(f"{i:02d}key", b"x" * 100)
+
+    # 初回だけ合計サイズを調べ、以降は保存した分を足して見積もる
+    assert len(scans) == 1
+    assert cache.get(f"{0:02d}key") == b"x" * 100
+
+
+def test_evicts_least_recently_used_when_over_limit(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=250)
+    cache.put("aa1", b"x" * 100)
+    cache.put("bb2", b"x" * 100)
+    cache.put("aa1", b"y" * 100)  # 上書きは合計サイズを増やさない
+    assert stored(tmp_path) == ["aa1", "bb2"]
+
+    cache.put("cc3", b"x" * 100)
+
+    assert stored(tmp_path) == ["aa1", "cc3"]
+
+
+def test_rescans_after_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "RESCAN_INTERVAL", 2)
+    cache = RenderCache(str(tmp_path), max_bytes=250)
+    other = RenderCache(str(tmp_path), max_bytes=10**6)
+    cache.put("aa1", b"x" * 100)
+    # 他のプロセス (別のインスタンス) が保存した分は見積もりに含まれない
+    other.put("bb2", b"x" * 100)
+    other.put("cc3", b"x" * 100)
+    cache.put("dd4", b"x" * 10)
+    cache.put("ee5", b"x" * 10)
+    assert total_size(tmp_path) > 250
+
+    # RESCAN_INTERVAL 回ごとにフォルダ全体を調べ直して上限まで削除する
+    cache.put("ff6", b"x" * 10)
+
+    assert total_size(tmp_path) <= 250
+    assert "aa1" not in stored(tmp_path)
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from src.benchmark import Workload, settings_frames
+from src.libs.model.data import DataCondition
+from src.libs.model.graph import GraphCondition, XAxis, YAxis
+from src.libs.model.page import GraphLayout, Page, Tab
+from src.libs.settings import SettingsValidationError, build_settings
+
+
+def reference_pages(data_df, layout_df, graph_df):
+    """1行ずつモデルを作成して組み立てた Page の一覧 (一括変換との比較用)"""
+    data = {}
+    for row in data_df.to_dict("records"):
+        data.setdefault(row["tabname"], []).append(DataCondition(**row))
+    graphs = {}
+    for row in graph_df.to_dict("records"):
+        graph = graphs.setdefault(
+            (row["tabname"], row["id"]),
+            GraphCondition(
+                id=row["id"],
+                tabname=row["tabname"],
+                x_axis=XAxis(
+                    param=row["x_param"],
+                    unit=row["x_unit"],
+                    range=(row["x_min"], row["x_max"]),
+                    label=row["x_label"],
+                ),
+                y_axes=[],
+            ),
+        )
+        graph.y_axes.append(
+            YAxis(
+                param=row["y_param"],
+                unit=row["y_unit"],
+                range=(row["y_min"], row["y_max"]),
+                color=row["y_color"],
+                label=row["y_label"],
+            )
+        )
+    pages = {}
+    for row in layout_df.to_dict("records"):
+        page = pages.setdefault(
+            row["page_title"],
+            Page(page_title=row["page_title"], output_file_name=row["output_file_name"], tabs=[]),
+        )
+        tabname = row["tabname"]
+        page.tabs.append(
+            Tab(
+                tabname=tabname,
+                tabtitle=row["tabtitle"],
+                layout=GraphLayout(tabname=tabname, columns=row["columns"], rows=row["rows"]),
+                data_conditions=data.get(tabname, []),
+                graph_conditions=[g for (t, _), g in graphs.items() if t == tabname],
+            )
+        )
+    return list(pages.values())
+
+
+def test_bulk_build_matches_row_by_row_models():
+    frames = settings_frames(Workload(pages=3, tabs_per_page=2, graphs_per_tab=2))
+
+    pages, calcs = build_settings(frames["data"], frames["layout"], frames["graph"], frames["calc"])
+
+    assert pages == reference_pages(frames["data"], frames["layout"], frames["graph"])
+    assert calcs == []
+
+
+def test_reports_every_issue_with_sheet_and_row():
+    frames = settings_frames(Workload(pages=1, tabs_per_page=2))
+    data = frames["data"]
+    data.loc[0, "end_date"] = datetime(2000, 1, 1)
+    data.loc[1, "unit"] = None
+    layout = frames["layout"]
+    graph = pd.concat([frames["graph"], frames["graph"].assign(tabname="unknown")])
+
+    with pytest.raises(SettingsValidationError) as error:
+        build_settings(data, layout, graph.reset_index(drop=True), frames["calc"])
+
+    places = {(issue.sheet, issue.row) for issue in error.value.issues}
+    # 見出しは2行目のため、DataFrame の先頭行は Excel の3行目
+    assert ("data", 3) in places
+    assert ("data", 4) in places
+    assert any(sheet == "graph" for sheet, _ in places)
@@ -0,0 +1,66 @@
+import json
+
+import numpy as np
+from bokeh.models import ColumnDataSource, Panel, Tabs
+from bokeh.plotting import figure
+
+from src.batch import render_pages
+from src.libs.render.sidecar import SidecarWriter
+
+from .conftest import make_page, make_tab
+
+
+def line_figure(source: ColumnDataSource):
+    fig = figure()
+    fig.line("x", "y", source=source)
+    return fig
+
+
+def test_shared_source_is_not_modified(tmp_path):
+    inline = ColumnDataSource(data={"x": np.arange(5.0), "y": np.arange(5.0)})
+    shared = ColumnDataSource(data={"x": np.arange(5.0), "y": np.arange(5.0) * 2})
+    first, second, third = line_figure(inline), line_figure(shared), line_figure(shared)
+    writer = SidecarWriter.for_output(str(tmp_path / "page.html"))
+
+    writer.add_tab(first, inline=True)
+    writer.add_tab(second)
+    writer.add_tab(third)
+    writer.attach(Tabs(tabs=[Panel(child=fig) for fig in (first, second, third)]))
+
+    # 共有しているソースの配列は残し、サイドカーで読み込むタブだけ空の複製に差し替える
+    np.testing.assert_array_equal(shared.data["y"], np.arange(5.0) * 2)
+    assert first.renderers[0].data_source is inline
+    stub = second.renderers[0].data_source
+    assert stub is not shared
+    assert len(stub.data["y"]) == 0
+    assert stub.selected is not shared.selected
+    # 同じソースを参照する別のタブは書き出し済みの複製を使う
+    assert third.renderers[0].data_source is stub
+    assert all(renderer.view.source is stub for renderer in second.renderers)
+
+
+def test_urls_are_relative_without_base_url(tmp_path):
+    writer = SidecarWriter.for_output(str(tmp_path / "page.html"))
+    source = ColumnDataSource(data={"x": np.array([1.0]), "y": np.array([2.0])})
+    writer.add_tab(line_figure(source))
+
+    assert writer._entries[0][0]["url"] == "page_series/0.bin"
+
+
+def test_render_pages_uses_sidecar_url(tmp_path):
+    pages = [make_page(make_tab(["a"], tabname="first"), make_tab(["b"], tabname="second"))]
+
+    (result,) = render_pages(
+        pages,
+        str(tmp_path),
+        fmt="json",
+        jobs=1,
+        sidecars=True,
+        sidecar_url="http://localhost:8000/reports/",
+    )
+
+    assert result.ok, result.error
+    text = json.dumps(json.load(open(result.path, encoding="utf-8")))
+    folder = f"{tmp_path.joinpath(result.path).stem}_series"
+    assert f"http://localhost:8000/reports/{folder}/0.bin" in text
+    assert (tmp_path / folder / "0.bin").exists()
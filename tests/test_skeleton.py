@@ -0,0 +1,56 @@
+from bokeh.document import Document
+from bokeh.models import HoverTool, Span
+from bokeh.plotting import figure
+
+from src.libs.render.skeleton import FigureTemplates, clone_model
+
+
+def skeleton():
+    p = figure(x_axis_type="datetime", plot_height=200)
+    p.grid.grid_line_alpha = 0.3
+    return p
+
+
+def test_clone_copies_settings_with_new_models():
+    template = skeleton()
+
+    clone = clone_model(template)
+
+    assert clone.id != template.id
+    assert clone.plot_height == 200
+    assert clone.xaxis[0].id != template.xaxis[0].id
+    assert type(clone.xaxis[0]) is type(template.xaxis[0])
+    assert [grid.grid_line_alpha for grid in clone.grid] == [0.3, 0.3]
+    # 複製どうしの参照関係は元と同じ (グリッドは複製した軸を参照する)
+    assert {grid.axis for grid in clone.grid} == {clone.xaxis[0], clone.yaxis[0]}
+    assert len(clone.toolbar.tools) == len(template.toolbar.tools)
+
+
+def test_changing_clone_leaves_template_alone():
+    templates = FigureTemplates()
+    first = templates.figure("timeseries", skeleton)
+    second = templates.figure("timeseries", skeleton)
+
+    first.line([1, 2], [3, 4])
+    first.xaxis.axis_label = "time"
+    first.add_tools(HoverTool())
+
+    assert (templates.hits, templates.misses) == (1, 1)
+    assert second.renderers == []
+    assert second.xaxis[0].axis_label is None
+    assert len(second.toolbar.tools) == len(first.toolbar.tools) - 1
+
+
+def test_in_place_changes_of_clone_notify_document():
+    clone = clone_model(skeleton())
+    doc = Document()
+    doc.add_root(clone)
+    events = []
+    doc.on_change(events.append)
+
+    span = Span(location=0, dimension="width")
+    clone.center.append(span)
+    clone.line([1, 2], [3, 4])
+
+    assert len(events) == 2
+    assert doc.get_model_by_id(span.id) is span
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from src.worker import (
+    INTERNAL_ERROR,
+    INVALID_PARAMS,
+    INVALID_REQUEST,
+    METHOD_NOT_FOUND,
+    PARSE_ERROR,
+    RenderWorker,
+    RpcError,
+    WorkerClient,
+)
+
+from .conftest import make_page, make_tab
+
+
+def request(method, request_id=1, **params):
+    message = {"jsonrpc": "2.0", "method": method, "params": params}
+    if request_id is not None:
+        message["id"] = request_id
+    return json.dumps(message)
+
+
+@pytest.fixture(scope="module")
+def client():
+    client = WorkerClient()
+    yield client
+    client.close()
+
+
+@pytest.fixture(scope="module")
+def pages():
+    return [make_page(make_tab(["a", "b"], tabname="tab1"), make_tab(["c"], tabname="tab2"))]
+
+
+def test_round_trip(client, pages):
+    assert client.call("ping") == "pong"
+    assert client.call("load", pages=[page.model_dump(mode="json") for page in pages]) == 1
+    tabs = client.call("list_tabs")
+    assert [tab["tabname"] for tab in tabs] == ["tab1", "tab2"]
+
+    item = client.call("render", page=0, tab="tab2")
+
+    assert item["doc"]["roots"]
+    assert client.call("health")["rendered_tabs"] == 1
+
+
+@pytest.mark.parametrize(
+    "method, params, code",
+    [
+        ("missing", {}, METHOD_NOT_FOUND),
+        ("render", {"page": 99}, INVALID_PARAMS),
+        ("render", {"unknown": 1}, INVALID_PARAMS),
+        ("load", {"path": "does-not-exist.json"}, INTERNAL_ERROR),
+    ],
+)
+def test_error_codes(client, method, params, code):
+    with pytest.raises(RpcError) as error:
+        client.call(method, **params)
+    assert error.value.code == code
+    # エラーの後もワーカーは応答を続ける
+    assert client.call("ping") == "pong"
+
+
+def test_notifications_and_buffered_requests_survive_restart(client):
+    # 通知 (id なし) には成功・失敗どちらも応答しない。restart の後ろに続けて書いた
+    # リクエストは起動し直したプロセスが処理する
+    lines = [
+        request("ping", request_id=None),
+        request("missing", request_id=None),
+        request("restart", request_id=10),
+        request("ping", request_id=11),
+    ]
+    client.process.stdin.write("\n".join(lines) + "\n")
+    client.process.stdin.flush()
+
+    responses = [json.loads(client.process.stdout.readline()) for _ in range(2)]
+
+    assert responses == [
+        {"jsonrpc": "2.0", "id": 10, "result": "restarting"},
+        {"jsonrpc": "2.0", "id": 11, "result": "pong"},
+    ]
+    assert client.call("health")["pages"] == 0
+
+
+def test_type_error_inside_method_is_internal_error():
+    worker = RenderWorker()
+
+    def broken(value: int) -> int:
+        return value + "1"
+
+    worker.methods["broken"] = broken
+
+    assert worker.handle(request("broken", value=1))["error"]["code"] == INTERNAL_ERROR
+    assert worker.handle(request("broken", other=1))["error"]["code"] == INVALID_PARAMS
+    assert worker.handle(request("broken", request_id=None, other=1)) is None
+
+
+@pytest.mark.parametrize(
+    "line, code",
+    [("{not json", PARSE_ERROR), ("[1]", INVALID_REQUEST), ('{"id": 3}', INVALID_REQUEST)],
+)
+def test_protocol_errors(line, code):
+    response = RenderWorker().handle(line)
+    assert response["error"]["code"] == code